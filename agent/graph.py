@@ -1,9 +1,12 @@
 from __future__ import annotations
+from functools import lru_cache
 from typing import TypedDict, List, Dict, Any
 from langgraph.graph import StateGraph, END
 
-# ASR (faster-whisper)
-from transcriber.whisper import transcribe_with_faster_whisper
+# ASR (faster-whisper; модель — в демоне моделей, если он запущен)
+from utils.config import get_config
+from api.model_client import create_transcriber
+from transcriber.utils import segments_text
 # LLM-логика: саммари и задачи
 from llms.tasks import make_summary, extract_tasks_struct
 
@@ -31,19 +34,20 @@ class S(TypedDict, total=False):
     hits: List[Dict[str, Any]]
 
 
+@lru_cache(maxsize=None)
+def _transcriber():
+    """Транскрайбер создаётся один раз на процесс (подключение к демону — тоже)"""
+    return create_transcriber(get_config())
+
+
 # --- Узлы графа ---
 
 def asr_node(state: S) -> S:
     """
     Транскрибация аудио через faster-whisper.
     """
-    out = transcribe_with_faster_whisper(
-        state["audio_path"],
-        device="cuda",        # при необходимости поменяй на "cpu"
-        model_name="base",    # "large-v3" даст выше качество
-        language="ru",
-    )
-    state["transcript_text"] = out["text"]
+    out = _transcriber().transcribe_segments(state["audio_path"])
+    state["transcript_text"] = segments_text(out["segments"])
     state["transcript_segments"] = out["segments"]
     state["asr_info"] = out["info"]
     return state
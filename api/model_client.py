@@ -0,0 +1,308 @@
+"""
+Тонкий клиент локального демона моделей (api/model_server.py).
+
+Запросы идут по Unix-сокету кадрами "длина + JSON"; аудио и эмбеддинги
+передаются через общую память (multiprocessing.shared_memory), а не через сокет.
+Если демон не запущен, фабрики create_* возвращают обычные in-process объекты.
+"""
+import json
+import logging
+import os
+import socket
+import struct
+from multiprocessing import shared_memory
+from types import SimpleNamespace
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_HEADER = struct.Struct("!I")
+
+
+class ModelServerError(Exception):
+    """Исключение для ошибок демона моделей и связи с ним"""
+    pass
+
+
+def send_message(sock: socket.socket, message: Dict[str, Any]) -> None:
+    data = json.dumps(message, ensure_ascii=False).encode("utf-8")
+    sock.sendall(_HEADER.pack(len(data)) + data)
+
+
+def recv_message(sock: socket.socket) -> Optional[Dict[str, Any]]:
+    """Следующее сообщение или None, если собеседник закрыл соединение"""
+    header = _recv_exact(sock, _HEADER.size)
+    if header is None:
+        return None
+    data = _recv_exact(sock, _HEADER.unpack(header)[0])
+    if data is None:
+        raise ModelServerError("Connection closed in the middle of a message")
+    return json.loads(data.decode("utf-8"))
+
+
+def _recv_exact(sock: socket.socket, size: int) -> Optional[bytes]:
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+class ModelClient:
+    """Соединение с демоном моделей: одно соединение и один сегмент общей памяти на запрос"""
+
+    def __init__(self, socket_path: str, timeout: Optional[float] = None):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._dim: Optional[int] = None
+
+    def available(self) -> bool:
+        """Запущен ли демон"""
+        try:
+            return self.request({"op": "ping"}).get("ok", False)
+        except (OSError, ModelServerError):
+            return False
+
+    def _connect(self) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+        except OSError:
+            sock.close()
+            raise
+        return sock
+
+    def request(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        with self._connect() as sock:
+            send_message(sock, message)
+            reply = recv_message(sock)
+        return self._check(reply)
+
+    def stream(self, message: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        """Потоковый ответ: сообщения до {"done": true}"""
+        with self._connect() as sock:
+            send_message(sock, message)
+            while True:
+                reply = self._check(recv_message(sock))
+                if reply.get("done"):
+                    return
+                yield reply
+
+    @staticmethod
+    def _check(reply: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        if reply is None:
+            raise ModelServerError("Model server closed the connection")
+        if "error" in reply:
+            raise ModelServerError(reply["error"])
+        return reply
+
+    def status(self) -> Dict[str, Any]:
+        return self.request({"op": "status"})
+
+    def asr(self, audio, **options) -> Dict[str, Any]:
+        """Распознавание: путь к файлу или float32 моно 16 kHz (через общую память)"""
+        if isinstance(audio, (str, os.PathLike)):
+            return self.request({"op": "asr", "path": os.fspath(audio), "options": options})
+
+        audio = np.ascontiguousarray(audio, dtype=np.float32)
+        shm = shared_memory.SharedMemory(create=True, size=max(audio.nbytes, 1))
+        try:
+            np.ndarray(audio.shape, dtype=np.float32, buffer=shm.buf)[:] = audio
+            return self.request({"op": "asr", "shm": shm.name, "shape": list(audio.shape),
+                                 "options": options})
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def embed(self, texts: List[str], kind: str = "passage") -> np.ndarray:
+        """Эмбеддинги (N, d) float32; демон пишет их прямо в общую память клиента.
+        kind: "passage" (чанки) или "query" (запросы — через кэш запросов демона)"""
+        dim = self._embedding_dim()
+        shape = (len(texts), dim)
+        shm = shared_memory.SharedMemory(create=True, size=max(shape[0] * dim * 4, 1))
+        try:
+            self.request({"op": "embed", "texts": texts, "kind": kind, "shm": shm.name, "shape": list(shape)})
+            vecs = np.ndarray(shape, dtype=np.float32, buffer=shm.buf).copy()
+        finally:
+            shm.close()
+            shm.unlink()
+        return vecs
+
+    def _embedding_dim(self) -> int:
+        if self._dim is None:
+            self._dim = self.request({"op": "embed_dim"})["dim"]
+        return self._dim
+
+    def rerank(self, pairs: List[Tuple[str, str]], batch_size: int) -> np.ndarray:
+        """Скоры cross-encoder для пар (запрос, текст)"""
+        reply = self.request({"op": "rerank", "pairs": [list(p) for p in pairs], "batch_size": batch_size})
+        return np.asarray(reply["scores"], dtype=np.float32)
+
+    def generate(self, prompt: str) -> str:
+        return self.request({"op": "generate", "prompt": prompt})["text"]
+
+    def generate_stream(self, prompt: str) -> Iterator[str]:
+        for reply in self.stream({"op": "generate_stream", "prompt": prompt}):
+            yield reply["chunk"]
+
+
+# =========================
+# Клиентские аналоги in-process моделей
+# =========================
+
+class RemoteWhisperModel:
+    """Замена faster_whisper.WhisperModel: transcribe() выполняется в демоне"""
+
+    def __init__(self, client: ModelClient):
+        self.client = client
+
+    def transcribe(self, audio, language: Optional[str] = None, task: str = "transcribe",
+                   word_timestamps: bool = False, **kwargs) -> Tuple[List[Any], Any]:
+        reply = self.client.asr(audio, language=language, task=task, word_timestamps=word_timestamps)
+        segments = [
+            SimpleNamespace(**{**seg, "words": [SimpleNamespace(**w) for w in seg.get("words", [])]})
+            for seg in reply["segments"]
+        ]
+        return segments, SimpleNamespace(**reply["info"])
+
+
+class RemoteEmbedder:
+    """Замена rag.embedder.Embedder"""
+
+    def __init__(self, client: ModelClient):
+        self.client = client
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        return self.client.embed(texts)
+
+    def encode_queries(self, texts: List[str]) -> np.ndarray:
+        return self.client.embed(texts, kind="query")
+
+    @property
+    def model_id(self) -> str:
+        return self.client.request({"op": "embed_model"})["model_id"]
+
+    def stats(self) -> Dict[str, Any]:
+        return self.client.request({"op": "status"}).get("embedder", {})
+
+    def warm_up(self) -> None:
+        self.client.embed(["warm-up"])
+
+
+class RemoteScorer:
+    """Замена rag.reranker.CrossEncoderScorer (кэш скоров и бюджет — на стороне клиента)"""
+
+    def __init__(self, client: ModelClient):
+        self.client = client
+
+    def score(self, pairs: List[Tuple[str, str]], batch_size: int = 16) -> np.ndarray:
+        return self.client.rerank(pairs, batch_size)
+
+    def warm_up(self) -> None:
+        self.client.request({"op": "warm_up", "component": "reranker"})
+
+
+class RemoteLLMClient:
+    """Замена llms.llm.LocalLLMClient: запросы к LLM идут через демон"""
+
+    def __init__(self, client: ModelClient):
+        self.client = client
+
+    def generate_answer(self, prompt):
+        return self.client.generate(prompt)
+
+    def generate_answer_stream(self, prompt):
+        return self.client.generate_stream(prompt)
+
+    def warm_up(self) -> None:
+        self.client.request({"op": "warm_up", "component": "llm"})
+
+
+# =========================
+# Фабрики для точек входа
+# =========================
+
+def connect(config: Dict[str, Any]) -> Optional[ModelClient]:
+    """
+    Клиент демона согласно model_server в конфигурации:
+    "auto" — если демон запущен, "on" — обязательно, "off" — никогда.
+    """
+    mode = config.get("model_server", "auto")
+    if mode == "off":
+        return None
+    client = ModelClient(config["model_server_socket"])
+    if client.available():
+        logger.info(f"Using model server at {client.socket_path}")
+        return client
+    if mode == "on":
+        raise ModelServerError(f"Model server is not running at {client.socket_path}")
+    return None
+
+
+def create_transcriber(config: Dict[str, Any], client: Optional[ModelClient] = None):
+    """OptimizedWhisperTranscriber, у которого модель живёт в демоне (если он запущен)"""
+    from transcriber.whisper_optimized import OptimizedWhisperTranscriber
+
+    client = client or connect(config)
+    if client is None:
+        return OptimizedWhisperTranscriber(config)
+
+    class RemoteTranscriber(OptimizedWhisperTranscriber):
+        """Кэш, JSONL, VAD — на клиенте; инференс — в демоне"""
+
+        def get_model(self):
+            return RemoteWhisperModel(client)
+
+        def _use_long_mode(self, audio_path: str) -> bool:
+            # Пул процессов с собственными моделями обошёл бы демон
+            return False
+
+    return RemoteTranscriber(config)
+
+
+def create_embedder(config: Dict[str, Any], client: Optional[ModelClient] = None):
+    client = client or connect(config)
+    if client is None:
+        from rag.embedder import Embedder
+        return Embedder(model_name=config["rag_model_name"], device=config["asr_device"],
+                        backend=config.get("rag_embed_backend", "torch"),
+                        query_cache_size=config.get("rag_query_cache_size", 4096),
+                        query_cache_dir=config.get("rag_query_cache_dir"))
+    return RemoteEmbedder(client)
+
+
+def create_reranker(config: Dict[str, Any], client: Optional[ModelClient] = None):
+    """Reranker или None, если переранжирование выключено (rag_rerank)"""
+    if not config.get("rag_rerank"):
+        return None
+    from rag.reranker import CrossEncoderScorer, Reranker
+    client = client or connect(config)
+    if client is None:
+        scorer = CrossEncoderScorer(config["rag_rerank_model"], device=config["asr_device"])
+    else:
+        scorer = RemoteScorer(client)
+    return Reranker(scorer, batch_size=config["rag_rerank_batch_size"],
+                    budget_ms=config["rag_rerank_budget_ms"])
+
+
+def create_llm_client(config: Dict[str, Any], client: Optional[ModelClient] = None):
+    client = client or connect(config)
+    if client is None:
+        from llms.llm import LocalLLMClient
+        return LocalLLMClient(host=config["llm_host"], model=config["llm_model"])
+    return RemoteLLMClient(client)
+
+
+def create_whisper_model(config: Dict[str, Any], client: Optional[ModelClient] = None):
+    """Модель для transcriber.whisper.transcribe_with_faster_whisper"""
+    client = client or connect(config)
+    if client is None:
+        from transcriber.whisper import load_asr_model
+        return load_asr_model(device=config["asr_device"])
+    return RemoteWhisperModel(client)
@@ -0,0 +1,222 @@
+"""
+Локальный демон моделей: ASR, эмбеддер и прокси к LLM загружены один раз
+и обслуживают все точки входа (main_optimized.py, main.py, api/server.py, agent/graph.py).
+
+    python -m api.model_server [--socket /run/user/1000/mia-models.sock]
+
+Протокол — api/model_client.py.
+"""
+import argparse
+import logging
+import os
+import signal
+import socketserver
+import sys
+import threading
+from multiprocessing import resource_tracker, shared_memory
+from typing import Any, Dict
+
+import numpy as np
+
+from utils.config import get_config
+from utils.model_cache import model_cache
+from utils.warmup import ModelWarmup, WarmupError
+from api.model_client import recv_message, send_message
+from transcriber.utils import segment_to_dict
+
+logger = logging.getLogger(__name__)
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    """Подключиться к сегменту клиента. Владелец сегмента — клиент, он его и удаляет"""
+    shm = shared_memory.SharedMemory(name=name)
+    # Иначе resource_tracker демона удалит чужой сегмент при выходе
+    resource_tracker.unregister(shm._name, "shared_memory")
+    return shm
+
+
+class ModelServer:
+    """Резидентные модели и обработка запросов клиентов"""
+
+    def __init__(self, config: Dict[str, Any]):
+        from transcriber.whisper_optimized import OptimizedWhisperTranscriber
+        from llms.llm import LocalLLMClient
+
+        self.config = config
+        self.transcriber = OptimizedWhisperTranscriber(config)
+        self.llm_client = LocalLLMClient(host=config["llm_host"], model=config["llm_model"])
+        self.embedder = None
+        self.scorer = None
+        self._embedder_lock = threading.Lock()
+        self.warmup = ModelWarmup()
+        self.warmup.add("asr", self.transcriber.warm_up)
+        self.warmup.add("embedder", lambda: self.get_embedder().warm_up())
+        self.warmup.add("llm", self.llm_client.warm_up)
+        if config.get("rag_rerank"):
+            self.warmup.add("reranker", lambda: self.get_scorer().warm_up())
+
+    def get_embedder(self):
+        with self._embedder_lock:
+            if self.embedder is None:
+                from rag.embedder import Embedder
+                self.embedder = Embedder(model_name=self.config["rag_model_name"],
+                                         device=self.config["asr_device"],
+                                         backend=self.config.get("rag_embed_backend", "torch"),
+                                         query_cache_size=self.config.get("rag_query_cache_size", 4096),
+                                         query_cache_dir=self.config.get("rag_query_cache_dir"))
+            return self.embedder
+
+    def get_scorer(self):
+        with self._embedder_lock:
+            if self.scorer is None:
+                from rag.reranker import CrossEncoderScorer
+                self.scorer = CrossEncoderScorer(self.config["rag_rerank_model"],
+                                                 device=self.config["asr_device"])
+            return self.scorer
+
+    def _await(self, name: str) -> None:
+        """Дождаться прогрева; если он упал, модель загрузится при обращении"""
+        try:
+            self.warmup.wait(name)
+        except WarmupError as e:
+            logger.warning(f"{e}, loading on demand")
+
+    def handle(self, message: Dict[str, Any], reply) -> None:
+        op = message.get("op")
+        handler = getattr(self, f"op_{op}", None)
+        if handler is None:
+            reply({"error": f"Unknown operation: {op}"})
+            return
+        handler(message, reply)
+
+    def op_ping(self, message, reply) -> None:
+        reply({"ok": True, "pid": os.getpid()})
+
+    def op_status(self, message, reply) -> None:
+        status = {"warmup": self.warmup.status(), "model_cache": model_cache.stats()}
+        if self.embedder is not None:
+            status["embedder"] = self.embedder.stats()
+        reply(status)
+
+    def op_warm_up(self, message, reply) -> None:
+        self.warmup.wait(message["component"])
+        reply({"ok": True})
+
+    def op_asr(self, message, reply) -> None:
+        self._await("asr")
+        options = message.get("options", {})
+        model = self.transcriber.get_model()
+        if "path" in message:
+            segments, info = model.transcribe(message["path"], **options)
+            reply(self._asr_reply(segments, info))
+            return
+
+        shm = _attach(message["shm"])
+        try:
+            # Декодер читает аудио прямо из общей памяти клиента
+            audio = np.ndarray(tuple(message["shape"]), dtype=np.float32, buffer=shm.buf)
+            segments, info = model.transcribe(audio, **options)
+            result = self._asr_reply(segments, info)
+            del audio
+        finally:
+            shm.close()
+        reply(result)
+
+    @staticmethod
+    def _asr_reply(segments, info) -> Dict[str, Any]:
+        return {
+            "segments": [segment_to_dict(s, with_words=True) for s in segments],
+            "info": {"language": info.language,
+                     "language_probability": info.language_probability,
+                     "duration": info.duration},
+        }
+
+    def op_embed_dim(self, message, reply) -> None:
+        self._await("embedder")
+        reply({"dim": int(self.get_embedder().model.get_sentence_embedding_dimension())})
+
+    def op_embed_model(self, message, reply) -> None:
+        self._await("embedder")
+        reply({"model_id": self.get_embedder().model_id})
+
+    def op_embed(self, message, reply) -> None:
+        self._await("embedder")
+        embedder = self.get_embedder()
+        if message.get("kind") == "query":
+            vecs = embedder.encode_queries(message["texts"])
+        else:
+            vecs = embedder.encode(message["texts"])
+        shm = _attach(message["shm"])
+        try:
+            out = np.ndarray(tuple(message["shape"]), dtype=np.float32, buffer=shm.buf)
+            out[:] = vecs
+            del out
+        finally:
+            shm.close()
+        reply({"ok": True})
+
+    def op_rerank(self, message, reply) -> None:
+        if "reranker" in self.warmup.status():
+            self._await("reranker")
+        pairs = [tuple(p) for p in message["pairs"]]
+        scores = self.get_scorer().score(pairs, batch_size=message.get("batch_size", 16))
+        reply({"scores": scores.tolist()})
+
+    def op_generate(self, message, reply) -> None:
+        reply({"text": self.llm_client.generate_answer(message["prompt"])})
+
+    def op_generate_stream(self, message, reply) -> None:
+        for chunk in self.llm_client.generate_answer_stream(message["prompt"]):
+            reply({"chunk": chunk})
+        reply({"done": True})
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self) -> None:
+        message = recv_message(self.request)
+        if message is None:
+            return
+        try:
+            self.server.models.handle(message, lambda data: send_message(self.request, data))
+        except Exception as e:
+            logger.error(f"Model server {message.get('op')} failed: {e}")
+            send_message(self.request, {"error": f"{type(e).__name__}: {e}"})
+
+
+class _UnixServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+def serve(config: Dict[str, Any], socket_path: str) -> None:
+    """Запустить демон и обслуживать запросы до прерывания"""
+    models = ModelServer(config)
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)  # сокет от упавшего процесса
+    server = _UnixServer(socket_path, _Handler)
+    os.chmod(socket_path, 0o600)
+    server.models = models
+    models.warmup.start()
+    logger.info(f"Model server listening on {socket_path}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.unlink(socket_path)
+        model_cache.clear()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    config = get_config()
+    parser = argparse.ArgumentParser(description="MIA local model server")
+    parser.add_argument("--socket", default=config["model_server_socket"])
+    args = parser.parse_args()
+    # SIGTERM — как Ctrl+C: закрыть сокет и выгрузить модели
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    serve(config, args.socket)
+
+
+if __name__ == "__main__":
+    main()
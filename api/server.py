@@ -6,13 +6,40 @@ import traceback
 import uvicorn
 import os
 
-# Транскрибация
-from transcriber.whisper import transcribe_with_faster_whisper
-from llms.llm import load_llm_client
-from rag.search import search  # сделай/проверь функцию: def rag_answer(question: str, top_k:int=5) -> dict
+# Модели: из демона моделей (api/model_server.py), если он запущен, иначе в процессе
+from functools import lru_cache
+from utils.config import get_config
+from api.model_client import connect, create_embedder, create_llm_client, create_reranker, create_transcriber
+from rag.metadata import since_days
+from rag.retriever import QueryBatcher, Retriever
+from rag.search import format_context
+from prompts.templates import get_rag_answer_prompt
 
 app = FastAPI(title="MIA API", version="0.1.0")
 
+
+@lru_cache(maxsize=None)
+def _client():
+    return connect(get_config())
+
+@lru_cache(maxsize=None)
+def _models():
+    """Транскрайбер и LLM-клиент создаются один раз на процесс"""
+    config = get_config()
+    return create_transcriber(config, _client()), create_llm_client(config, _client())
+
+@lru_cache(maxsize=None)
+def _rag() -> QueryBatcher:
+    """Общий стор (саммари + транскрибации) загружается один раз; одновременные запросы ищутся одним батчем"""
+    config = get_config()
+    retriever = Retriever(config["rag_store_dir"], create_embedder(config, _client()),
+                          top_k=config["rag_top_k"], threshold=config["rag_threshold"],
+                          nprobe=config["rag_nprobe"], ef_search=config["rag_ef_search"],
+                          mode=config["rag_search_mode"], budget_ms=config["rag_hybrid_budget_ms"],
+                          reranker=create_reranker(config, _client()),
+                          rerank_candidates=config["rag_rerank_candidates"])
+    return QueryBatcher(retriever)
+
 # -------- Модели запросов/ответов --------
 class SummarizeIn(BaseModel):
     transcript: str
@@ -34,6 +61,22 @@ class SummaryOut(BaseModel):
 class RagIn(BaseModel):
     question: str
     top_k: Optional[int] = 5
+    # {"source": "summary"|"transcript", "kind": "meeting"|"question", "meeting_date": {"gte": "YYYY-MM-DD"}, ...}
+    filters: Optional[dict] = None
+    since_days: Optional[int] = None  # только встречи за последние N дней
+
+class RagBatchIn(BaseModel):
+    questions: List[str]
+    top_k: Optional[int] = 5
+    filters: Optional[dict] = None
+    since_days: Optional[int] = None
+
+def _filters(payload) -> Optional[dict]:
+    """filters запроса + since_days как диапазон meeting_date (применяется до поиска)"""
+    filters = dict(payload.filters or {})
+    if payload.since_days is not None:
+        filters["meeting_date"] = since_days(payload.since_days)
+    return filters or None
 
 # -------- Health --------
 @app.get("/health")
@@ -50,7 +93,7 @@ async def transcribe(file: UploadFile = File(...)):
         tmp_path = f"/tmp/{file.filename}"
         with open(tmp_path, "wb") as f:
             f.write(await file.read())
-        text = transcribe_with_faster_whisper(tmp_path)
+        text = _models()[0].transcribe(tmp_path)
         os.remove(tmp_path)
         return {"text": text}
     except Exception as e:
@@ -64,7 +107,7 @@ def summarize(payload: SummarizeIn):
     Принимает transcript и просит LLM вернуть структурированное JSON-summary.
     """
     try:
-        client = load_llm_client(host="http://localhost:11434", model="qwen3")
+        client = _models()[1]
         prompt = f"""
 Ты — помощник протоколирования встреч. Верни ТОЛЬКО JSON без пояснений,
 со следующими полями: 
@@ -122,12 +165,38 @@ def rag_search(payload: RagIn):
     где chunks — найденные фрагменты/метаданные.
     """
     try:
-        result = search(payload.question, top_k=payload.top_k or 5)
-        return JSONResponse(result)
+        hits = _rag().search(payload.question, top_k=payload.top_k, filters=_filters(payload))
+        prompt = get_rag_answer_prompt(payload.question, format_context(hits))
+        answer = _models()[1].generate_answer(prompt)
+        return JSONResponse({"answer": answer, "chunks": hits})
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"rag_error: {e}")
 
+# -------- 4) /rag/search_batch --------
+@app.post("/rag/search_batch")
+def rag_search_batch(payload: RagBatchIn):
+    """
+    Только поиск (без LLM) для списка вопросов — например, для прогонов оценки.
+    Возвращает {"results": [[chunk, ...], ...]} в порядке вопросов.
+    """
+    try:
+        results = _rag().retriever.search(payload.questions, top_k=payload.top_k, filters=_filters(payload))
+        return JSONResponse({"results": results})
+    except Exception as e:
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"rag_error: {e}")
+
+# -------- 5) /rag/stats --------
+@app.get("/rag/stats")
+def rag_stats():
+    """Попадания кэша эмбеддингов запросов (и реранкера, если включён)"""
+    retriever = _rag().retriever
+    stats = {"embedder": retriever.embedder.stats()}
+    if retriever.reranker is not None:
+        stats["reranker"] = retriever.reranker.stats()
+    return stats
+
 # Локальный запуск (опционально)
 if __name__ == "__main__":
     uvicorn.run("api.server:app", host="127.0.0.1", port=5001, reload=True)
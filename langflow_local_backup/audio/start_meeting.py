@@ -6,7 +6,7 @@ from ._recorder_singleton import get_recorder
 
 class StartMeetingRecording(Component):
     display_name = "Start Meeting Recording"
-    description = "Старт записи полной встречи (parec|sox через твой Recorder)."
+    description = "Старт записи полной встречи (parec → кольцевой буфер через твой Recorder)."
     icon = "play"
     name = "StartMeetingRecording"
 
@@ -45,6 +45,21 @@ class LocalLLMClient:
         data = resp.json()
         return data.get("response") or data.get("message") or str(data)
 
+    def warm_up(self, timeout=180):
+        """
+        Загрузить модель в память Ollama и сгенерировать один токен,
+        чтобы первый ответ не ждал загрузки.
+        """
+        url = f"{self.host}/api/generate"
+        payload = {
+            "model": self.model,
+            "prompt": "ping",
+            "stream": False,
+            "options": {"num_predict": 1}
+        }
+        resp = requests.post(url, json=payload, timeout=timeout)
+        resp.raise_for_status()
+
 def load_llm_client(host="http://localhost:11434", model="qwen3"):
     """
     Инициализация клиента локального LLM (вызывается один раз)
@@ -6,14 +6,14 @@ import threading
 from pynput import keyboard as kb
 
 from transcriber.recorder import Recorder
-from transcriber.whisper import load_asr_model, transcribe_with_faster_whisper
-from llms.llm import load_llm_client
+from transcriber.whisper import transcribe_with_faster_whisper
+from api.model_client import connect, create_embedder, create_llm_client, create_reranker, create_whisper_model
 from prompts.templates import get_corporate_summary_prompt, get_interview_prompt
 
-from rag.embedder import Embedder
-from rag.search import search
+from rag.search import format_context
+from rag.retriever import Retriever
+from rag.index_store import IndexStore
 from prompts.templates import get_rag_answer_prompt
-import faiss, json, os
 
 # =========================
 # Конфигурация и инициализация
@@ -23,9 +23,10 @@ from utils.config import get_config
 # Получаем конфигурацию
 config = get_config()  # Можно изменить на "production" для продакшена
 
-# Предзагрузка моделей (уменьшаем latency)
-asr_model = load_asr_model(device=config["asr_device"])
-llm_client = load_llm_client(host=config["llm_host"], model=config["llm_model"])
+# Предзагрузка моделей (уменьшаем latency); если запущен демон моделей — берём их у него
+model_client = connect(config)
+asr_model = create_whisper_model(config, model_client)
+llm_client = create_llm_client(config, model_client)
 recorder = Recorder.create_auto(
     monitor_name=config["virtual_cable_name"],
     samplerate=config["sample_rate"],
@@ -44,7 +45,7 @@ def handle_meeting_recording():
     """
     Ctrl+R:
     - если не пишем → старт записи встречи (audio/meetings/*.wav)
-    - если пишем → стоп, транскрипция (transcripts/meetings/*.txt), саммари → summaries/*.json
+    - если пишем → стоп, транскрипция (transcripts/meetings/*.jsonl), саммари → summaries/*.json
     """
     global is_meeting_active
 
@@ -59,7 +60,7 @@ def handle_meeting_recording():
     audio_path = recorder.stop_main_recording()
     print("⏹ Основная запись завершена. Обработка...")
 
-    # Транскрибуем (функция сама положит текст в transcripts/meetings/*.txt)
+    # Транскрибуем (функция сама положит текст в transcripts/meetings/*.jsonl)
     transcript_text = transcribe_with_faster_whisper(audio_path, asr_model=asr_model)
 
     # Формируем промпт саммари и получаем ответ от LLM (непотоково — это краткий JSON)
@@ -81,7 +82,7 @@ def handle_question_recording():
     """
     Ctrl+Q:
     - если не пишем вопрос → старт (audio/questions/*.wav)
-    - если пишем → стоп, транскрипция (transcripts/questions/*.txt), потоковый ответ от LLM
+    - если пишем → стоп, транскрипция (transcripts/questions/*.jsonl), потоковый ответ от LLM
     """
     global is_question_active
 
@@ -100,7 +101,7 @@ def handle_question_recording():
     audio_path = recorder.stop_question_recording()
     print("🔵 Запись вопроса завершена. Обработка...")
 
-    # Транскрибуем (функция сама положит текст в transcripts/questions/*.txt)
+    # Транскрибуем (функция сама положит текст в transcripts/questions/*.jsonl)
     question_text = transcribe_with_faster_whisper(audio_path, asr_model=asr_model)
     print(f"Вопрос: {question_text}")
 
@@ -154,17 +155,15 @@ def listen_hotkeys():
 
 # === RAG по САММАРИ ===
 def run_rag_chat_summaries():
-    # Загрузка индекса и мета
-    idx_path  = os.path.join("rag_store", "faiss.index")
-    meta_path = os.path.join("rag_store", "meta.json")
-    if not (os.path.exists(idx_path) and os.path.exists(meta_path)):
+    # Загрузка индекса и хранилища чанков
+    store = IndexStore("rag_store")
+    if not store.exists():
         print("[RAG] Индекс по саммари не найден. Сначала: python -m rag.build")
         return
-    index = faiss.read_index(idx_path)
-    with open(meta_path, "r", encoding="utf-8") as f:
-        metas = json.load(f)
-
-    embedder = Embedder()
+    retriever = Retriever(store.base_dir, create_embedder(config, model_client), top_k=5, threshold=0.32,
+                          mode=config["rag_search_mode"], budget_ms=config["rag_hybrid_budget_ms"],
+                          reranker=create_reranker(config, model_client),
+                          rerank_candidates=config["rag_rerank_candidates"])
 
     print("\n[RAG] Чат по САММАРИ. Введите вопрос (или 'exit'):")
     while True:
@@ -172,20 +171,17 @@ def run_rag_chat_summaries():
         if not q:
             continue
         if q.lower() in ("exit", "quit"):
+            query_cache = retriever.embedder.stats().get("query_cache")
+            if query_cache:
+                print(f"[RAG] Кэш запросов: {query_cache['hits']} попаданий из "
+                      f"{query_cache['hits'] + query_cache['misses']} ({query_cache['hit_rate']:.0%})")
             print("[RAG] Выход.")
             break
 
-        q_vec = embedder.encode([q])                 # (1, d)
-        hits  = search(index, metas, q_vec, top_k=5, threshold=0.32)
-
-        # Для MVP подмешаем ссылки/идентификаторы найденных фрагментов
-        lines = []
-        for h in hits:
-            p = h["meta"].get("path")
-            doc_id = h["meta"].get("doc_id")
-            chunk_id = h["meta"].get("chunk_id")
-            lines.append(f"[summary:{doc_id}#chunk{chunk_id}] score={h['score']:.2f} | {p}")
-        retrieved = "Найдены фрагменты саммари:\n" + ("\n".join(lines) if lines else "ничего не найдено")
+        hits = retriever.search([q], filters={"source": "summary"})[0]  # dense + BM25, только саммари
+
+        # В промпт — тексты найденных фрагментов со ссылками на источник
+        retrieved = "Найдены фрагменты саммари:\n" + format_context(hits, "summary")
 
         prompt = get_rag_answer_prompt(q, retrieved)
 
@@ -16,16 +16,18 @@ from utils.config import get_config
 from utils.app_state import state_manager
 from utils.audio_manager import AudioManager, AudioRecordingError
 from utils.model_cache import model_cache
+from utils.warmup import LOADING, PENDING, ModelWarmup, WarmupError
 
 from transcriber.whisper_optimized import OptimizedWhisperTranscriber, TranscriptionError
-from llms.llm import LocalLLMClient
+from transcriber.streaming import IncrementalTranscriber
 from prompts.templates import get_corporate_summary_prompt, get_interview_prompt
 
-from rag.embedder import Embedder
-from rag.search import search
+from api.model_client import (ModelClient, connect, create_embedder, create_llm_client, create_reranker,
+                              create_transcriber)
+from rag.search import format_context
+from rag.retriever import Retriever
+from rag.index_store import IndexStore
 from prompts.templates import get_rag_answer_prompt
-import faiss
-import json
 
 # Настройка логирования
 logging.basicConfig(
@@ -46,8 +48,12 @@ class MIAApplication:
         self.config = config
         self.audio_manager: Optional[AudioManager] = None
         self.transcriber: Optional[OptimizedWhisperTranscriber] = None
-        self.llm_client: Optional[LocalLLMClient] = None
-        self.embedder: Optional[Embedder] = None
+        self.llm_client = None
+        self.embedder = None
+        self.reranker = None
+        self.model_client: Optional[ModelClient] = None
+        self.live_transcriber: Optional[IncrementalTranscriber] = None
+        self.warmup = ModelWarmup()
         
         # Флаг для graceful shutdown
         self.running = True
@@ -64,24 +70,40 @@ class MIAApplication:
         try:
             logger.info("Initializing MIA application...")
             
+            # Бюджет памяти моделей
+            model_cache.configure(
+                budgets_mb={"cpu": self.config.get("model_cache_ram_mb"),
+                            "cuda": self.config.get("model_cache_vram_mb")},
+                idle_timeout=self.config.get("model_cache_idle_sec"),
+            )
+            
             # Инициализация аудио менеджера
             self.audio_manager = AudioManager(self.config)
             self.audio_manager.setup_virtual_cable()
             
+            # Если запущен демон моделей, модели живут в нём, а здесь — тонкие клиенты
+            self.model_client = connect(self.config)
+            
             # Инициализация транскрайбера
-            self.transcriber = OptimizedWhisperTranscriber(self.config)
+            self.transcriber = create_transcriber(self.config, self.model_client)
             
             # Инициализация LLM клиента
-            self.llm_client = LocalLLMClient(
-                host=self.config["llm_host"],
-                model=self.config["llm_model"]
-            )
+            self.llm_client = create_llm_client(self.config, self.model_client)
             
-            # Инициализация эмбеддера
-            self.embedder = Embedder(
-                model_name=self.config["rag_model_name"],
-                device=self.config["asr_device"]
-            )
+            # Cross-encoder для переранжирования RAG (None, если выключен)
+            self.reranker = create_reranker(self.config, self.model_client)
+            
+            # Модели грузятся и прогреваются параллельно в фоне: горячие клавиши
+            # доступны сразу, обработчик ждёт только нужную ему модель
+            if self.config.get("warmup_models", True):
+                self.warmup.add("asr", self.transcriber.warm_up)
+                self.warmup.add("embedder", self._load_embedder)
+                self.warmup.add("llm", self.llm_client.warm_up)
+                if self.reranker is not None:
+                    self.warmup.add("reranker", self.reranker.warm_up)
+                self.warmup.start()
+            else:
+                self._load_embedder(warm_up=False)
             
             logger.info("MIA application initialized successfully")
             
@@ -89,6 +111,24 @@ class MIAApplication:
             logger.error(f"Failed to initialize application: {e}")
             raise
     
+    def _load_embedder(self, warm_up: bool = True) -> None:
+        """Инициализация эмбеддера"""
+        embedder = create_embedder(self.config, self.model_client)
+        if warm_up:
+            embedder.warm_up()
+        self.embedder = embedder
+    
+    def _wait_for_model(self, name: str) -> None:
+        """Дождаться фоновой загрузки модели. При ошибке прогрева модель загрузится при первом вызове"""
+        state = self.warmup.status().get(name)
+        # Без прогрева (warmup_models=False) или для незарегистрированной модели ждать нечего
+        if state is not None and state["status"] in (PENDING, LOADING):
+            print(f"⏳ Модель {name} ещё загружается...")
+        try:
+            self.warmup.wait(name)
+        except WarmupError as e:
+            logger.warning(f"{e}, loading on demand")
+    
     def _signal_handler(self, signum, frame):
         """Обработчик сигналов для graceful shutdown"""
         logger.info(f"Received signal {signum}, shutting down...")
@@ -100,10 +140,18 @@ class MIAApplication:
         """Очистка ресурсов"""
         logger.info("Cleaning up resources...")
         
+        if self.live_transcriber:
+            self.live_transcriber.cancel()
+        
         if self.audio_manager:
             self.audio_manager.cleanup()
         
         # Очистка кэша моделей
+        logger.info(f"Model cache stats: {model_cache.stats()}")
+        if self.embedder is not None:
+            logger.info(f"Embedder stats: {self.embedder.stats()}")
+        if self.reranker is not None:
+            logger.info(f"Reranker stats: {self.reranker.stats()}")
         model_cache.clear()
     
     def handle_meeting_recording(self):
@@ -112,6 +160,13 @@ class MIAApplication:
             if not state_manager.is_meeting_active():
                 # Старт записи
                 self.audio_manager.start_main_recording()
+                if self.config.get("asr_streaming"):
+                    self.live_transcriber = IncrementalTranscriber(
+                        self.transcriber,
+                        self.audio_manager.main_capture,
+                        window_sec=self.config["asr_stream_window_sec"],
+                        overlap_sec=self.config["asr_stream_overlap_sec"],
+                    ).start()
                 state_manager.set_meeting_active(True)
                 logger.info("Meeting recording started")
                 print("▶️ Основная запись встречи начата (Ctrl+R чтобы остановить)")
@@ -122,8 +177,19 @@ class MIAApplication:
                 logger.info("Meeting recording stopped")
                 print("⏹ Основная запись завершена. Обработка...")
                 
-                # Транскрипция
-                transcript_text = self.transcriber.transcribe(audio_path)
+                self._wait_for_model("asr")
+                
+                # Транскрипция: при потоковом ASR остаётся декодировать только хвост
+                # ASR читает 16 kHz побочный файл, если он пишется (тот же stem, что у архива)
+                asr_path = self.audio_manager.main_asr_filename or audio_path
+                live, self.live_transcriber = self.live_transcriber, None
+                if live is not None:
+                    transcript_text = live.finish(asr_path)
+                    if not live.complete:
+                        logger.warning("Incremental ASR was incomplete, re-transcribing the file")
+                        transcript_text = self.transcriber.transcribe(asr_path)
+                else:
+                    transcript_text = self.transcriber.transcribe(asr_path)
                 
                 # Генерация саммари
                 prompt = get_corporate_summary_prompt(transcript_text)
@@ -156,14 +222,17 @@ class MIAApplication:
                 logger.info("Question recording started")
                 print("🔴 Запись вопроса начата (Ctrl+Q чтобы остановить)")
             else:
-                # Остановка записи вопроса
-                audio_path = self.audio_manager.stop_question_recording()
+                # Остановка записи вопроса (фрагмент идущей записи встречи)
+                clip = self.audio_manager.stop_question_recording()
                 state_manager.set_question_active(False)
                 logger.info("Question recording stopped")
                 print("🔵 Запись вопроса завершена. Обработка...")
                 
-                # Транскрипция
-                question_text = self.transcriber.transcribe(audio_path)
+                # WAV вопроса пишется в фоне, транскрипция идёт прямо из буфера захвата
+                if self.config.get("question_save_audio", True):
+                    self.audio_manager.save_clip_async(clip)
+                self._wait_for_model("asr")
+                question_text = self.transcriber.transcribe_clip(clip)
                 print(f"Вопрос: {question_text}")
                 
                 # Генерация ответа
@@ -210,16 +279,26 @@ class MIAApplication:
         """RAG чат по саммари"""
         try:
             # Загрузка индекса
-            idx_path = Path(self.config["rag_store_dir"]) / "faiss.index"
-            meta_path = Path(self.config["rag_store_dir"]) / "meta.json"
-            
-            if not (idx_path.exists() and meta_path.exists()):
+            store = IndexStore(self.config["rag_store_dir"])
+            if not store.exists():
                 print("[RAG] Индекс по саммари не найден. Сначала: python -m rag.build")
                 return
             
-            index = faiss.read_index(str(idx_path))
-            with open(meta_path, "r", encoding="utf-8") as f:
-                metas = json.load(f)
+            self._wait_for_model("embedder")
+            if self.embedder is None:
+                self._load_embedder(warm_up=False)
+            if self.reranker is not None:
+                self._wait_for_model("reranker")
+            
+            retriever = Retriever(store.base_dir, self.embedder,
+                                  top_k=self.config["rag_top_k"],
+                                  threshold=self.config["rag_threshold"],
+                                  nprobe=self.config["rag_nprobe"],
+                                  ef_search=self.config["rag_ef_search"],
+                                  mode=self.config["rag_search_mode"],
+                                  budget_ms=self.config["rag_hybrid_budget_ms"],
+                                  reranker=self.reranker,
+                                  rerank_candidates=self.config["rag_rerank_candidates"])
             
             print("\n[RAG] Чат по САММАРИ. Введите вопрос (или 'exit'):")
             
@@ -232,21 +311,11 @@ class MIAApplication:
                         print("[RAG] Выход.")
                         break
                     
-                    # Поиск
-                    q_vec = self.embedder.encode([q])
-                    hits = search(index, metas, q_vec, 
-                                top_k=self.config["rag_top_k"], 
-                                threshold=self.config["rag_threshold"])
-                    
-                    # Формирование ответа
-                    lines = []
-                    for h in hits:
-                        p = h["meta"].get("path")
-                        doc_id = h["meta"].get("doc_id")
-                        chunk_id = h["meta"].get("chunk_id")
-                        lines.append(f"[summary:{doc_id}#chunk{chunk_id}] score={h['score']:.2f} | {p}")
+                    # Поиск (dense + BM25)
+                    hits = retriever.search([q], filters={"source": "summary"})[0]
                     
-                    retrieved = "Найдены фрагменты саммари:\n" + ("\n".join(lines) if lines else "ничего не найдено")
+                    # Формирование ответа: тексты найденных чанков с источниками
+                    retrieved = "Найдены фрагменты саммари:\n" + format_context(hits, "summary")
                     prompt = get_rag_answer_prompt(q, retrieved)
                     
                     # Генерация ответа
@@ -295,6 +364,8 @@ class MIAApplication:
             print("Ctrl+Q — старт/стоп записи вопроса")
             print("ESC    — выход")
             print("====================================")
+            if self.config.get("warmup_models", True):
+                print("⏳ Модели загружаются в фоне, горячие клавиши уже работают")
             
             # Запуск слушателя клавиш
             with kb.Listener(on_press=self.on_press, on_release=self.on_release) as listener:
@@ -0,0 +1,169 @@
+# rag/ann.py
+import math
+from typing import Optional
+
+import faiss
+import numpy as np
+
+# Типы индексов (все — inner product по L2-нормированным векторам, т.е. cosine):
+#   flat  — точный перебор;
+#   hnsw  — граф HNSW, без обучения; удаление — только мягкое (мета = null);
+#   ivf   — инвертированные списки с обученными центроидами (IVF-Flat);
+#   ivfpq — IVF + product quantization: в разы меньше памяти, оценка сходства приближённая.
+INDEX_TYPES = ("flat", "hnsw", "ivf", "ivfpq")
+
+# Автовыбор по числу векторов
+FLAT_MAX = 20_000
+HNSW_MAX = 500_000
+
+# Хранение векторов внутри индекса: float32 как есть, либо скалярное квантование —
+# sq8 (1 байт на измерение, в 4 раза меньше) или fp16 (в 2 раза). Точность
+# восстанавливается пересчётом лучших кандидатов по полным float32 из vectors.f32.
+STORAGES = ("float32", "sq8", "fp16")
+RERANK_FACTOR = 4  # сколько кандидатов на один результат берём из квантованного индекса
+
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 200
+DEFAULT_NPROBE = 16
+DEFAULT_EF_SEARCH = 64
+
+
+def choose_index_type(n: int) -> str:
+    """Тип индекса по размеру корпуса"""
+    if n <= FLAT_MAX:
+        return "flat"
+    if n <= HNSW_MAX:
+        return "hnsw"
+    return "ivfpq"
+
+
+def ivf_nlist(n: int) -> int:
+    """Число центроидов: ~4*sqrt(n), но не меньше 39 обучающих векторов на центроид"""
+    return int(max(1, min(4 * math.sqrt(n), n // 39, 65536)))
+
+
+def pq_m(d: int) -> int:
+    """Число подквантователей PQ: по ~8 измерений на байт кода, d должно делиться на m"""
+    m = max(1, d // 8)
+    while d % m:
+        m -= 1
+    return m
+
+
+def _scalar_quantizer(storage: str):
+    return {"sq8": faiss.ScalarQuantizer.QT_8bit, "fp16": faiss.ScalarQuantizer.QT_fp16}[storage]
+
+
+def build_index(kind: str, vecs: np.ndarray, ids: np.ndarray, storage: str = "float32") -> faiss.Index:
+    """
+    Построить индекс типа kind по нормированным векторам vecs (N, d) с внешними ID.
+    IVF/IVF-PQ обучаются на этих же векторах; если их слишком мало для обучения —
+    строится flat. storage — формат векторов внутри индекса (для ivfpq не применяется).
+    """
+    if storage not in STORAGES:
+        raise ValueError(f"Unknown vector storage: {storage} (expected one of {STORAGES})")
+    quantized = storage != "float32"
+    d = vecs.shape[1]
+    n = len(vecs)
+    if kind == "ivfpq" and n < 39 * 256:
+        print(f"[RAG] Слишком мало векторов для обучения PQ ({n}) — строю ivf")
+        kind = "ivf"
+    if kind == "ivf" and n < 39 * 8:
+        print(f"[RAG] Слишком мало векторов для {kind} ({n}) — строю flat")
+        kind = "flat"
+
+    if kind == "flat" and quantized:
+        sq = faiss.IndexScalarQuantizer(d, _scalar_quantizer(storage), faiss.METRIC_INNER_PRODUCT)
+        sq.train(vecs)
+        index = faiss.IndexIDMap2(sq)
+    elif kind == "flat":
+        index = faiss.IndexIDMap2(faiss.IndexFlatIP(d))
+    elif kind == "hnsw":
+        if quantized:
+            hnsw = faiss.IndexHNSWSQ(d, _scalar_quantizer(storage), HNSW_M, faiss.METRIC_INNER_PRODUCT)
+            hnsw.train(vecs)
+        else:
+            hnsw = faiss.IndexHNSWFlat(d, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        hnsw.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        index = faiss.IndexIDMap2(hnsw)
+    elif kind == "ivf":
+        codec = {"float32": "Flat", "sq8": "SQ8", "fp16": "SQfp16"}[storage]
+        index = faiss.index_factory(d, f"IVF{ivf_nlist(n)},{codec}", faiss.METRIC_INNER_PRODUCT)
+        index.train(vecs)
+    elif kind == "ivfpq":
+        # PQ-коды — 8 бит, для обучения кодбуков нужно >= 256 векторов
+        index = faiss.index_factory(d, f"IVF{ivf_nlist(n)},PQ{pq_m(d)}", faiss.METRIC_INNER_PRODUCT)
+        index.train(vecs)
+    else:
+        raise ValueError(f"Unknown index type: {kind} (expected one of {INDEX_TYPES})")
+
+    if n:
+        index.add_with_ids(vecs, ids.astype("int64"))
+    return index
+
+
+def index_type(index: faiss.Index) -> str:
+    """Тип уже построенного индекса"""
+    try:
+        ivf = faiss.extract_index_ivf(index)
+        return "ivfpq" if isinstance(faiss.downcast_index(ivf), faiss.IndexIVFPQ) else "ivf"
+    except RuntimeError:
+        pass
+    inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else index
+    return "hnsw" if isinstance(inner, faiss.IndexHNSW) else "flat"
+
+
+def remove_ids(index: faiss.Index, ids: np.ndarray) -> bool:
+    """Удалить векторы по ID. False, если индекс этого не умеет (HNSW) — тогда удаление мягкое"""
+    try:
+        index.remove_ids(ids.astype("int64"))
+        return True
+    except RuntimeError:
+        return False
+
+
+def set_search_params(index: faiss.Index, nprobe: Optional[int] = None,
+                      ef_search: Optional[int] = None) -> None:
+    """nprobe — сколько IVF-списков просматривать, ef_search — ширина поиска HNSW"""
+    kind = index_type(index)
+    if kind in ("ivf", "ivfpq") and nprobe is not None:
+        faiss.extract_index_ivf(index).nprobe = nprobe
+    elif kind == "hnsw" and ef_search is not None:
+        faiss.downcast_index(index.index).hnsw.efSearch = ef_search
+
+
+def search_params(index: faiss.Index, allowed: np.ndarray, nprobe: Optional[int] = None,
+                  ef_search: Optional[int] = None):
+    """
+    Параметры поиска с предфильтром: FAISS оценивает только ID из маски allowed
+    (IDSelectorBitmap), а не отсекает их после поиска. Возвращает (params, keepalive) —
+    keepalive (битовая маска и селектор) держать живыми до конца поиска.
+    """
+    bitmap = np.packbits(allowed, bitorder="little")
+    # Первый аргумент — длина маски в байтах: ID за её концом FAISS отклоняет, а не читает чужую память
+    selector = faiss.IDSelectorBitmap(len(bitmap), faiss.swig_ptr(bitmap))
+    kind = index_type(index)
+    if kind in ("ivf", "ivfpq"):
+        params = faiss.SearchParametersIVF(sel=selector, nprobe=nprobe or DEFAULT_NPROBE)
+    elif kind == "hnsw":
+        params = faiss.SearchParametersHNSW(sel=selector, efSearch=ef_search or DEFAULT_EF_SEARCH)
+    else:
+        params = faiss.SearchParameters(sel=selector)
+    return params, (bitmap, selector)
+
+
+def rerank(queries: np.ndarray, ids: np.ndarray, vectors: np.ndarray):
+    """
+    Точный пересчёт кандидатов по полным векторам: строки memmap читаются только
+    для кандидатов, по одному разу на батч. queries (N, d), ids (N, k), -1 — пусто.
+    Возвращает (scores, ids) формы (N, k) по убыванию скора; пустые — (-inf, -1).
+    """
+    ids = np.where((ids >= 0) & (ids < len(vectors)), ids, -1)
+    scores = np.full(ids.shape, -np.inf, dtype="float32")
+    valid = ids >= 0
+    uniq = np.unique(ids[valid])
+    if len(uniq):
+        rows = np.asarray(vectors[uniq], dtype="float32")[np.searchsorted(uniq, ids[valid])]
+        scores[valid] = np.einsum("ij,ij->i", rows, queries[np.nonzero(valid)[0]])
+    order = np.argsort(-scores, axis=1, kind="stable")
+    return np.take_along_axis(scores, order, 1), np.take_along_axis(ids, order, 1)
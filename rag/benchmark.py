@@ -0,0 +1,127 @@
+# rag/benchmark.py
+"""
+Recall и латентность ANN-индексов против точного flat-поиска.
+
+    python -m rag.benchmark rag_store --k 10
+    python -m rag.benchmark --synthetic 200000 --dim 768   # без реального корпуса
+    python -m rag.benchmark --storage sq8                  # квантованный индекс + точный пересчёт
+"""
+import argparse
+import time
+
+import faiss
+import numpy as np
+
+from rag import ann
+from rag.index_store import IndexStore
+from rag.utils import l2_normalize
+
+SWEEPS = {
+    "hnsw": ("ef_search", [16, 32, 64, 128, 256]),
+    "ivf": ("nprobe", [1, 4, 16, 64]),
+    "ivfpq": ("nprobe", [1, 4, 16, 64]),
+}
+
+
+def load_store_vectors(store_dir: str) -> np.ndarray:
+    store = IndexStore(store_dir)
+    manifest = store.load_manifest()
+    if manifest is None or "dim" not in manifest.get("index", {}):
+        raise SystemExit(f"[RAG] В {store_dir} нет манифеста с векторами. Соберите индекс заново.")
+    ids = sorted(i for doc in manifest["docs"].values() for i in doc["ids"])
+    return np.ascontiguousarray(store.load_vectors(manifest["index"]["dim"])[ids])
+
+
+def make_queries(vecs: np.ndarray, n: int, noise: float, seed: int = 0) -> np.ndarray:
+    """Запросы — зашумлённые векторы корпуса: ближайшие соседи у них осмысленные"""
+    rng = np.random.default_rng(seed)
+    base = vecs[rng.choice(len(vecs), size=min(n, len(vecs)), replace=False)]
+    return l2_normalize(base + noise * rng.standard_normal(base.shape).astype("float32") / np.sqrt(vecs.shape[1]))
+
+
+def timed_search(index, queries: np.ndarray, k: int):
+    """Поиск по одному запросу (как в чате): средняя латентность, мс"""
+    ids = np.empty((len(queries), k), dtype="int64")
+    start = time.perf_counter()
+    for i, q in enumerate(queries):
+        _, ids[i] = index.search(q[None], k)
+    return ids, (time.perf_counter() - start) * 1000 / len(queries)
+
+
+def timed_rerank_search(index, queries: np.ndarray, vecs: np.ndarray, k: int, factor: int):
+    """Как timed_search, но с точным пересчётом top k*factor кандидатов по полным векторам"""
+    ids = np.empty((len(queries), k), dtype="int64")
+    start = time.perf_counter()
+    for i, q in enumerate(queries):
+        _, cand = index.search(q[None], k * factor)
+        ids[i] = ann.rerank(q[None], cand, vecs)[1][0, :k]
+    return ids, (time.perf_counter() - start) * 1000 / len(queries)
+
+
+def recall(found: np.ndarray, truth: np.ndarray) -> float:
+    return float(np.mean([len(set(f) & set(t)) / len(t) for f, t in zip(found, truth)]))
+
+
+def index_mb(index) -> float:
+    return len(faiss.serialize_index(index)) / 2 ** 20
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall vs latency ANN-индексов")
+    parser.add_argument("store_dir", nargs="?", default="rag_store")
+    parser.add_argument("--synthetic", type=int, default=0, help="случайный корпус из N векторов")
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--noise", type=float, default=0.5)
+    parser.add_argument("--types", default="hnsw,ivf,ivfpq")
+    parser.add_argument("--storage", default="float32", choices=ann.STORAGES,
+                        help="формат векторов в индексе; для sq8/fp16 печатается и recall после пересчёта")
+    parser.add_argument("--rerank-factor", type=int, default=ann.RERANK_FACTOR)
+    args = parser.parse_args()
+
+    if args.synthetic:
+        rng = np.random.default_rng(0)
+        # Кластеризованный корпус ближе к реальным эмбеддингам, чем равномерный шум
+        centers = rng.standard_normal((max(1, args.synthetic // 500), args.dim)).astype("float32")
+        vecs = centers[rng.integers(len(centers), size=args.synthetic)]
+        vecs = l2_normalize(vecs + 0.6 * rng.standard_normal(vecs.shape).astype("float32"))
+    else:
+        vecs = load_store_vectors(args.store_dir)
+    ids = np.arange(len(vecs), dtype="int64")
+    queries = make_queries(vecs, args.queries, args.noise)
+    k = min(args.k, len(vecs))
+    print(f"[Bench] corpus={len(vecs)} dim={vecs.shape[1]} queries={len(queries)} k={k} "
+          f"(auto -> {ann.choose_index_type(len(vecs))})")
+
+    flat = ann.build_index("flat", vecs, ids)
+    truth, flat_ms = timed_search(flat, queries, k)
+    print(f"{'index':<8} {'param':<14} {'recall@k':>9} {'ms/query':>9} {'speedup':>8} {'build s':>8} {'MB':>8}")
+    print(f"{'flat':<8} {'-':<14} {1.0:>9.3f} {flat_ms:>9.3f} {1.0:>8.1f} {'-':>8} {index_mb(flat):>8.1f}")
+
+    quantized = args.storage != "float32"
+    kinds = [t.strip() for t in args.types.split(",") if t.strip()]
+    if quantized:
+        kinds = ["flat"] + kinds
+    for kind in kinds:
+        start = time.perf_counter()
+        index = ann.build_index(kind, vecs, ids, args.storage)
+        build = time.perf_counter() - start
+        if ann.index_type(index) != kind:
+            continue
+        name, values = SWEEPS.get(kind, ("-", [None]))
+        for value in values:
+            if value is not None:
+                ann.set_search_params(index, **{name: value})
+            param = f"{name}={value}" if value is not None else "-"
+            found, ms = timed_search(index, queries, k)
+            row = [(f"{kind}", found, ms)]
+            if quantized:
+                found, ms = timed_rerank_search(index, queries, vecs, k, args.rerank_factor)
+                row.append((f"{kind}+rr", found, ms))
+            for label, found, ms in row:
+                print(f"{label:<8} {param:<14} {recall(found, truth):>9.3f} {ms:>9.3f} "
+                      f"{flat_ms / ms:>8.1f} {build:>8.1f} {index_mb(index):>8.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+# rag/build.py
+import argparse
+from rag.loader_summaries import load_summary_docs
+from rag.loader_transcripts import load_transcript_docs
+from rag.embedder import Embedder, MODEL_NAME, EMBED_BACKENDS, EMBED_CACHE_DIR
+from rag.index_store import IndexStore
+from rag.ann import INDEX_TYPES, STORAGES
+from utils.config import (RAG_BATCH_SIZE, RAG_EMBED_BACKEND, RAG_EMBED_WORKERS, RAG_INDEX_TYPE,
+                          RAG_VECTOR_STORAGE)
+
+STORE_DIR = "rag_store"  # общий стор всех коллекций (фильтр по source/kind/meeting_date)
+
+# Коллекция -> (загрузчик документов, max_tokens, overlap_tokens чанка)
+COLLECTIONS = {
+    "summary": (load_summary_docs, 320, 48),
+    "transcript": (load_transcript_docs, 480, 64),
+}
+
+def main(collections=None, rebuild: bool = False, index_type: str = RAG_INDEX_TYPE,
+         storage: str = RAG_VECTOR_STORAGE, workers: int = RAG_EMBED_WORKERS, backend: str = RAG_EMBED_BACKEND):
+    """Инкрементальная сборка коллекций (по умолчанию всех) в один стор; эмбеддер — один на все"""
+    # Массовый режим: корзины по длине, при workers > 0 — пул CPU-процессов (модель грузится при первом промахе кэша)
+    embedder = Embedder(cache_dir=EMBED_CACHE_DIR, bulk=True, workers=workers,
+                        batch_size=RAG_BATCH_SIZE, backend=backend)
+    store = IndexStore(STORE_DIR)
+    try:
+        # Бэкенд пишется в манифест: сборка другим бэкендом переэмбеддит стор, а не смешает векторы
+        model_id = embedder.model_id
+        if store.needs_reset(model_id):
+            # Векторы всех коллекций несовместимы: пересобираем общий стор целиком, а не одну коллекцию
+            if collections and set(collections) != set(COLLECTIONS):
+                print(f"[RAG] Изменились модель, бэкенд эмбеддера или формат {STORE_DIR} — собираю все коллекции")
+            collections = None
+            store.reset()
+        for name in collections or COLLECTIONS:
+            load_docs, max_tokens, overlap_tokens = COLLECTIONS[name]
+            docs = load_docs()
+            # Пустая коллекция без --rebuild — не трогаем (документы не удаляются по ошибке пути)
+            if not docs and not rebuild:
+                print(f"[RAG] Коллекция {name}: нет данных.")
+                continue
+            # Эмбеддим только новые/изменённые документы; --rebuild — всю коллекцию заново
+            stats = store.update(docs, lambda: embedder, MODEL_NAME, max_tokens=max_tokens,
+                                 overlap_tokens=overlap_tokens, rebuild=rebuild, index_type=index_type,
+                                 storage=storage, collection=name, model_id=model_id)
+            print(f"[RAG] {STORE_DIR}/{name}: +{stats['added']} ~{stats['changed']} -{stats['removed']} "
+                  f"документов, эмбеддировано чанков: {stats['embedded_chunks']}, векторов в сторе: {stats['vectors']}")
+    finally:
+        embedder.close()
+
+def parser(description: str) -> argparse.ArgumentParser:
+    """Общие опции сборщиков (rag.build, rag.build_summaries, rag.build_transcripts)"""
+    p = argparse.ArgumentParser(description=description)
+    p.add_argument("--rebuild", action="store_true", help="переэмбеддить коллекцию целиком")
+    p.add_argument("--index-type", default=RAG_INDEX_TYPE, choices=("auto",) + INDEX_TYPES,
+                   help="тип ANN-индекса (auto — по размеру корпуса)")
+    p.add_argument("--storage", default=RAG_VECTOR_STORAGE, choices=STORAGES,
+                   help="формат векторов в индексе (sq8/fp16 — меньше памяти, точный пересчёт по vectors.f32)")
+    p.add_argument("--workers", type=int, default=RAG_EMBED_WORKERS,
+                   help="CPU-процессов для эмбеддинга (0 — в текущем процессе; на GPU игнорируется)")
+    p.add_argument("--backend", default=RAG_EMBED_BACKEND, choices=EMBED_BACKENDS,
+                   help="torch или onnx (int8 ONNX Runtime, для машин без GPU)")
+    return p
+
+if __name__ == "__main__":
+    cli = parser("Инкрементальная сборка общего RAG-стора (саммари + транскрибации)")
+    cli.add_argument("--collection", action="append", choices=tuple(COLLECTIONS),
+                     help="собрать только эту коллекцию (можно повторять)")
+    args = cli.parse_args()
+    main(args.collection, rebuild=args.rebuild, index_type=args.index_type, storage=args.storage,
+         workers=args.workers, backend=args.backend)
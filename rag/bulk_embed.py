@@ -0,0 +1,180 @@
+# rag/bulk_embed.py
+"""
+Массовый эмбеддинг: тексты сортируются по длине в токенах и режутся на корзины
+похожей длины (паддинг в батче минимален), корзины считаются на GPU в процессе
+или пулом CPU-процессов, результат возвращается в исходном порядке.
+
+    python -m rag.bulk_embed rag_store --workers 4   # texts/s против Embedder.encode
+"""
+import argparse
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import Callable, List, Optional
+
+import numpy as np
+
+from rag.chunker import token_counter
+
+BUCKET_BATCHES = 8  # батчей в одной корзине (единица работы процесса)
+
+_worker_model = None
+
+
+def _init_worker(model_name: str, threads: int, backend: str):
+    """Инициализация процесса пула: своя копия модели на CPU и своя доля ядер"""
+    global _worker_model
+    if backend == "onnx":
+        # Экспорт и сверку родитель уже сделал — здесь только загрузка
+        from rag.onnx_backend import OnnxEncoder, export_dir
+        _worker_model = OnnxEncoder(export_dir(model_name), threads=threads)
+        return
+    import torch
+    torch.set_num_threads(threads)
+    from sentence_transformers import SentenceTransformer
+    _worker_model = SentenceTransformer(model_name, device="cpu")
+
+
+def _encode_in_worker(texts: List[str], batch_size: int) -> np.ndarray:
+    vecs = _worker_model.encode(texts, batch_size=batch_size, show_progress_bar=False,
+                                convert_to_numpy=True, normalize_embeddings=False)
+    return np.asarray(vecs, dtype="float32")
+
+
+def has_gpu(device: Optional[str]) -> bool:
+    if device:
+        return device.startswith("cuda")
+    try:
+        import torch
+        return torch.cuda.is_available()
+    except ImportError:
+        return False
+
+
+class BulkEncoder:
+    """
+    encode_fn(texts, batch_size) — эмбеддинг в текущем процессе (модель из общего кэша);
+    workers > 0 — пул CPU-процессов (каждый грузит свою копию модели), на GPU не используется.
+    backend — "torch" или "onnx" (ONNX Runtime всегда на CPU).
+    """
+
+    def __init__(self, model_name: str, encode_fn: Callable[[List[str], int], np.ndarray],
+                 device: Optional[str] = None, workers: int = 0, batch_size: int = 32,
+                 bucket_batches: int = BUCKET_BATCHES, backend: str = "torch"):
+        self.model_name = model_name
+        self.encode_fn = encode_fn
+        self.device = device
+        self.requested_workers = workers
+        self.backend = backend
+        self.batch_size = batch_size
+        self.bucket_size = batch_size * bucket_batches
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self.texts = 0
+        self.seconds = 0.0
+
+    @property
+    def gpu(self) -> bool:
+        return self.backend == "torch" and has_gpu(self.device)
+
+    @property
+    def workers(self) -> int:
+        return 0 if self.gpu else self.requested_workers
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            threads = max(1, (os.cpu_count() or 1) // self.workers)
+            print(f"[RAG] Пул эмбеддинга: {self.workers} процессов по {threads} потоков")
+            # spawn: CUDA/torch и потоки родителя не наследуются
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker, initargs=(self.model_name, threads, self.backend))
+        return self._pool
+
+    def warm_up(self):
+        """Поднять процессы пула и загрузить в них модель заранее"""
+        if self.workers > 0:
+            list(self._get_pool().map(_encode_in_worker, [["warm-up"]] * self.workers, repeat(1)))
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """Эмбеддинги (N, d) float32 в порядке texts"""
+        start = time.perf_counter()
+        count_tokens = token_counter(self.model_name)
+        order = np.argsort([count_tokens(t) for t in texts], kind="stable")
+        buckets = [order[i:i + self.bucket_size] for i in range(0, len(order), self.bucket_size)]
+        bucket_texts = [[texts[i] for i in bucket] for bucket in buckets]
+        if self.workers > 0:
+            parts = self._get_pool().map(_encode_in_worker, bucket_texts, repeat(self.batch_size))
+        else:
+            parts = (self.encode_fn(chunk, self.batch_size) for chunk in bucket_texts)
+
+        out = None
+        for bucket, vecs in zip(buckets, parts):
+            if out is None:
+                out = np.empty((len(texts), vecs.shape[1]), dtype="float32")
+            out[bucket] = vecs
+        if out is None:
+            return np.zeros((0, 0), dtype="float32")
+
+        elapsed = time.perf_counter() - start
+        self.texts += len(texts)
+        self.seconds += elapsed
+        where = "GPU" if self.gpu else (f"{self.workers} CPU-процессов" if self.workers else "CPU")
+        if self.backend != "torch":
+            where += f", {self.backend}"
+        print(f"[RAG] Эмбеддинг: {len(texts)} текстов за {elapsed:.1f} с "
+              f"({len(texts) / max(elapsed, 1e-9):.0f} текстов/с, {where}, корзины по длине)")
+        return out
+
+
+def main():
+    from rag.embedder import Embedder, EMBED_BACKENDS, MODEL_NAME
+    from rag.index_store import IndexStore
+
+    parser = argparse.ArgumentParser(description="Пропускная способность эмбеддинга: обычный путь против bulk")
+    parser.add_argument("store_dir", nargs="?", default="rag_store",
+                        help="стор, из chunks.sqlite которого берутся тексты")
+    parser.add_argument("--workers", type=int, default=0, help="CPU-процессов для bulk (0 — в процессе)")
+    parser.add_argument("--limit", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--model", default=MODEL_NAME)
+    parser.add_argument("--backend", default="torch", choices=EMBED_BACKENDS, help="бэкенд для bulk-пути")
+    args = parser.parse_args()
+
+    store = IndexStore(args.store_dir)
+    if not os.path.exists(store.chunks_path):
+        raise SystemExit(f"[RAG] В {args.store_dir} нет chunks.sqlite. Сначала соберите индекс.")
+    _, chunks = store.load()
+    texts = [text for _, text in chunks.texts()[:args.limit]]
+    print(f"[Bench] текстов: {len(texts)}, batch_size={args.batch_size}")
+
+    plain = Embedder(model_name=args.model)
+    plain.warm_up()
+    start = time.perf_counter()
+    baseline = plain.encode(texts)
+    plain_rate = len(texts) / (time.perf_counter() - start)
+
+    bulk = Embedder(model_name=args.model, bulk=True, workers=args.workers, batch_size=args.batch_size,
+                    backend=args.backend)
+    bulk.model  # onnx: экспорт и сверка до замера
+    bulk.bulk.warm_up()
+    start = time.perf_counter()
+    vecs = bulk.encode(texts)
+    bulk_rate = len(texts) / (time.perf_counter() - start)
+    bulk.close()
+
+    diff = float(np.abs(vecs - baseline).max()) if len(texts) else 0.0
+    print(f"{'path':<28} {'texts/s':>9}")
+    print(f"{'Embedder.encode':<28} {plain_rate:>9.1f}")
+    print(f"{'bulk (' + bulk.backend + ', ' + str(args.workers) + ' workers)':<28} {bulk_rate:>9.1f}   x{bulk_rate / plain_rate:.2f}, "
+          f"max |diff| {diff:.2e}")
+
+
+if __name__ == "__main__":
+    main()
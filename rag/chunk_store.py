@@ -0,0 +1,200 @@
+# rag/chunk_store.py
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from .metadata import TYPED_FIELDS
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunks (
+    id       INTEGER PRIMARY KEY,  -- ID вектора в faiss.index и строка в vectors.f32
+    doc_id   TEXT NOT NULL,
+    chunk_id INTEGER NOT NULL,
+    text     TEXT NOT NULL,
+    meta     TEXT NOT NULL         -- JSON с метаданными документа
+)
+"""
+# Типизированные поля мета (rag.metadata) — отдельные колонки с индексами: фильтры
+# по коллекции, виду записи и диапазону дат выбирают ID без разбора JSON
+INDEXES = """
+CREATE INDEX IF NOT EXISTS chunks_source_date ON chunks(source, meeting_date);
+CREATE INDEX IF NOT EXISTS chunks_kind_date ON chunks(kind, meeting_date);
+CREATE INDEX IF NOT EXISTS chunks_date ON chunks(meeting_date);
+"""
+SQL_FIELDS = ("doc_id", "chunk_id") + TYPED_FIELDS
+RANGE_OPS = {"gte": ">=", "gt": ">", "lte": "<=", "lt": "<"}
+MASK_CACHE_SIZE = 32  # масок фильтров в LRU (у каждого since_days своя граница даты)
+
+
+class ChunkStore:
+    """
+    Тексты и метаданные чанков в SQLite (chunks.sqlite рядом с индексом).
+    При старте ничего не читается: после поиска достаются только top-k строк
+    по первичному ключу. Удалённые инкрементальной сборкой чанки — просто нет строки.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._ids: Optional[np.ndarray] = None
+        self._columns: Dict[str, np.ndarray] = {}
+        self._masks: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # Поиск может идти из потоков API-сервера — одно соединение под локом
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute(SCHEMA)
+            # Стор до типизированных колонок: добавляем их и заполняем из JSON мета
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(chunks)")}
+            for field in TYPED_FIELDS:
+                if field not in columns:
+                    self._conn.execute(f"ALTER TABLE chunks ADD COLUMN {field} TEXT")
+                    self._conn.execute(f"UPDATE chunks SET {field} = json_extract(meta, '$.{field}')")
+            self._conn.executescript(INDEXES)
+            self._conn.commit()
+
+    def _changed(self):
+        self._ids = None
+        self._columns = {}
+        self._masks = OrderedDict()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def add(self, ids: Iterable[int], chunks: List[Dict]):
+        """chunks — как из chunker.iter_chunks: {doc_id, chunk_id, text, meta}"""
+        rows = [(int(i), c["doc_id"], c["chunk_id"], c["text"], json.dumps(c["meta"], ensure_ascii=False),
+                 *(c["meta"].get(field) for field in TYPED_FIELDS))
+                for i, c in zip(ids, chunks)]
+        columns = ", ".join(("id", "doc_id", "chunk_id", "text", "meta") + TYPED_FIELDS)
+        marks = ", ".join("?" * (5 + len(TYPED_FIELDS)))
+        with self._lock:
+            self._conn.executemany(f"INSERT OR REPLACE INTO chunks ({columns}) VALUES ({marks})", rows)
+            self._conn.commit()
+            self._changed()
+
+    def delete(self, ids: Iterable[int]):
+        with self._lock:
+            self._conn.executemany("DELETE FROM chunks WHERE id = ?", [(int(i),) for i in ids])
+            self._conn.commit()
+            self._changed()
+
+    def delete_from(self, start: int) -> int:
+        """Удалить чанки с ID >= start (хвост незавершённой сборки); возвращает их число"""
+        with self._lock:
+            removed = self._conn.execute("DELETE FROM chunks WHERE id >= ?", (int(start),)).rowcount
+            self._conn.commit()
+            self._changed()
+        return removed
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM chunks")
+            self._conn.commit()
+            self._changed()
+
+    def renumber(self, remap: Dict[int, int]):
+        """Перенумеровать ID после уплотнения (new <= old, по возрастанию — без коллизий)"""
+        with self._lock:
+            self._conn.executemany("UPDATE chunks SET id = ? WHERE id = ?",
+                                   [(new, old) for old, new in sorted(remap.items()) if new != old])
+            self._conn.commit()
+            self._changed()
+
+    def get_many(self, ids: Iterable[int]) -> Dict[int, Dict]:
+        """{id: {"text", "meta": {doc_id, chunk_id, ...}}} для найденных ID"""
+        ids = [int(i) for i in ids]
+        if not ids:
+            return {}
+        marks = ",".join("?" * len(ids))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT id, doc_id, chunk_id, text, meta FROM chunks WHERE id IN ({marks})", ids).fetchall()
+        return {i: {"text": text, "meta": {"doc_id": doc_id, "chunk_id": chunk_id, **json.loads(meta)}}
+                for i, doc_id, chunk_id, text, meta in rows}
+
+    def texts(self) -> List[Tuple[int, str]]:
+        """Все (id, text) по возрастанию ID — для перестройки BM25"""
+        with self._lock:
+            return self._conn.execute("SELECT id, text FROM chunks ORDER BY id").fetchall()
+
+    def get(self, chunk_id: int) -> Optional[Dict]:
+        return self.get_many([chunk_id]).get(int(chunk_id))
+
+    def ids(self) -> np.ndarray:
+        """ID существующих чанков (кэшируется до изменения хранилища)"""
+        if self._ids is None:
+            with self._lock:
+                rows = self._conn.execute("SELECT id FROM chunks ORDER BY id").fetchall()
+            self._ids = np.array([r[0] for r in rows], dtype="int64")
+        return self._ids
+
+    def column(self, key: str) -> np.ndarray:
+        """Значения поля мета по ID (object-массив, None — нет чанка или поля); кэшируется"""
+        if key not in self._columns:
+            ids = self.ids()
+            values = np.full(int(ids[-1]) + 1 if len(ids) else 0, None, dtype=object)
+            if key in SQL_FIELDS:
+                sql, args = f"SELECT id, {key} FROM chunks", ()
+            else:
+                sql, args = "SELECT id, json_extract(meta, ?) FROM chunks", (f'$."{key}"',)
+            with self._lock:
+                for i, value in self._conn.execute(sql, args):
+                    values[i] = value
+            self._columns[key] = values
+        return self._columns[key]
+
+    @staticmethod
+    def _where(filters: Dict[str, Any]) -> Tuple[str, List]:
+        """WHERE по фильтрам: типизированные поля — колонки (с индексами), прочие — json_extract"""
+        clauses, args = [], []
+        for key, value in filters.items():
+            expr, expr_args = (key, []) if key in SQL_FIELDS else ("json_extract(meta, ?)", [f'$."{key}"'])
+            if isinstance(value, dict):
+                for op, bound in value.items():
+                    if op not in RANGE_OPS:
+                        raise ValueError(f"Unknown range operator: {op} (expected one of {tuple(RANGE_OPS)})")
+                    clauses.append(f"{expr} {RANGE_OPS[op]} ?")
+                    args += expr_args + [bound]
+            else:
+                options = list(value) if isinstance(value, (list, tuple, set)) else [value]
+                clauses.append(f"{expr} IN ({','.join('?' * len(options))})")
+                args += expr_args + options
+        return " AND ".join(clauses), args
+
+    def mask(self, filters: Optional[Dict[str, Any]] = None) -> np.ndarray:
+        """
+        Булева маска по ID: чанк существует и подходит под фильтры
+        {поле: значение, список допустимых значений или диапазон {"gte"/"gt"/"lte"/"lt": граница}},
+        например {"source": "transcript", "kind": "meeting", "meeting_date": {"gte": "2025-03-01"}}.
+        ID выбираются одним SQL-запросом (по индексам для типизированных полей).
+        """
+        cache_key = json.dumps(filters or {}, sort_keys=True, ensure_ascii=False, default=str)
+        with self._lock:
+            if cache_key in self._masks:
+                self._masks.move_to_end(cache_key)
+                return self._masks[cache_key]
+        ids = self.ids()
+        allowed = np.zeros(int(ids[-1]) + 1 if len(ids) else 0, dtype=bool)
+        if filters:
+            where, args = self._where(filters)
+            with self._lock:
+                rows = self._conn.execute(f"SELECT id FROM chunks WHERE {where}", args).fetchall()
+            allowed[np.array([r[0] for r in rows], dtype="int64")] = True
+        else:
+            allowed[ids] = True
+        with self._lock:
+            self._masks[cache_key] = allowed
+            while len(self._masks) > MASK_CACHE_SIZE:
+                self._masks.popitem(last=False)
+        return allowed
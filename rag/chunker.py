@@ -1,4 +1,6 @@
-from typing import List, Dict
+import re
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple
 
 def chunk_text(text: str, max_chars=1200, overlap=150) -> List[str]:
     """
@@ -31,3 +33,84 @@ def chunk_docs(docs: List[Dict], max_chars=1200, overlap=150) -> List[Dict]:
             })
     print(f"[RAG] Чанков всего: {len(result)}")
     return result
+
+
+# =========================
+# Нарезка по токенам эмбеддера
+# =========================
+
+# Границы предложений и строк (в транскриптах строка = сегмент ASR)
+SENTENCE_RE = re.compile(r"(?<=[.!?…])\s+|\n+")
+RESERVED_TOKENS = 8  # [CLS]/[SEP] и префикс "passage: " не входят в бюджет чанка
+
+def _approx_tokens(text: str) -> int:
+    # ~3 символа на токен для русского текста у токенизаторов XLM-R/e5 — с запасом
+    return len(text) // 3 + 1
+
+@lru_cache(maxsize=4)
+def token_counter(model_name: str) -> Callable[[str], int]:
+    """Счётчик токенов токенизатором модели (без весов); без transformers — оценка по длине"""
+    try:
+        from transformers import AutoTokenizer
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+    except Exception as e:
+        print(f"[RAG] Токенизатор {model_name} недоступен ({e}) — оцениваю токены по длине текста")
+        return _approx_tokens
+    return lambda text: len(tokenizer(text, add_special_tokens=False)["input_ids"])
+
+def split_sentences(text: str) -> List[str]:
+    return [s.strip() for s in SENTENCE_RE.split(text) if s.strip()]
+
+def _split_long(sentence: str, count_tokens: Callable[[str], int], max_tokens: int) -> Iterator[Tuple[str, int]]:
+    """Предложение длиннее бюджета — режем по словам"""
+    words, size = [], 0
+    for word in sentence.split():
+        n = count_tokens(word)
+        if words and size + n > max_tokens:
+            yield " ".join(words), size
+            words, size = [], 0
+        words.append(word)
+        size += n
+    if words:
+        yield " ".join(words), size
+
+def iter_text_chunks(text: str, count_tokens: Callable[[str], int],
+                     max_tokens: int, overlap_tokens: int) -> Iterator[str]:
+    """
+    Чанки из целых предложений/сегментов, каждый не длиннее max_tokens токенов;
+    соседние чанки перекрываются последними предложениями (до overlap_tokens).
+    """
+    window: List[Tuple[str, int]] = []
+    size = 0
+    for sentence in split_sentences(text):
+        n = count_tokens(sentence)
+        units = _split_long(sentence, count_tokens, max_tokens) if n > max_tokens else [(sentence, n)]
+        for unit, n in units:
+            if window and size + n > max_tokens:
+                yield " ".join(u for u, _ in window)
+                carry, carry_size = [], 0
+                for u, m in reversed(window):
+                    if carry_size + m > overlap_tokens:
+                        break
+                    carry.insert(0, (u, m))
+                    carry_size += m
+                window, size = (carry, carry_size) if carry_size + n <= max_tokens else ([], 0)
+            window.append((unit, n))
+            size += n
+    if window:
+        yield " ".join(u for u, _ in window)
+
+def iter_chunks(docs: Iterable[Dict], count_tokens: Callable[[str], int],
+                max_tokens: int = 480, overlap_tokens: int = 64) -> Iterator[Dict]:
+    """
+    Ленивая нарезка: документы читаются по одному, чанки отдаются по мере готовности.
+    { "doc_id": str, "chunk_id": int, "text": str, "meta": {...} }
+    """
+    for d in docs:
+        for idx, t in enumerate(iter_text_chunks(d["text"], count_tokens, max_tokens, overlap_tokens)):
+            yield {
+                "doc_id": d["id"],
+                "chunk_id": idx,
+                "text": t,
+                "meta": d.get("meta", {})
+            }
@@ -1,24 +1,144 @@
 import numpy as np
-from typing import List
+from typing import Dict, List, Optional, Tuple
 from sentence_transformers import SentenceTransformer
 
+from utils.model_cache import model_cache, get_embedder_cache_key
+from rag.embedding_cache import QUERY_CACHE_SIZE, EmbeddingCache, QueryCache, normalize_query
+from rag.bulk_embed import BulkEncoder, has_gpu
+from rag.onnx_backend import OnnxBackendError, load_or_export
+
 MODEL_NAME = "intfloat/multilingual-e5-base"  # отличный ru/eng эмбеддер
+EMBED_CACHE_DIR = "rag_store/embed_cache"     # кэш эмбеддингов чанков (модель + хэш текста)
+EMBED_BACKENDS = ("torch", "onnx", "auto")    # auto — onnx (int8) без GPU, иначе torch
+
+
+def embed_model_id(model_name: str, backend: str) -> str:
+    """Модель с бэкендом: векторы int8-модели чуть отличаются, их не смешиваем в одном индексе и кэше"""
+    return model_name if backend == "torch" else f"{model_name}@onnx-int8"
+
+
+def e5_prefixes(model_name: str) -> Tuple[str, str]:
+    """Префиксы (запрос, фрагмент): e5 обучены на "query: "/"passage: ", без них качество падает"""
+    return ("query: ", "passage: ") if "e5" in model_name.lower() else ("", "")
+
 
 class Embedder:
-    def __init__(self, model_name: str = MODEL_NAME, device: str = None):
+    def __init__(self, model_name: str = MODEL_NAME, device: str = None,
+                 cache_dir: Optional[str] = None, bulk: bool = False, workers: int = 0,
+                 batch_size: int = 32, backend: str = "torch",
+                 query_cache_size: int = QUERY_CACHE_SIZE, query_cache_dir: Optional[str] = None):
         # device=None => авто; можно "cuda" или "cpu"
-        print(f"[RAG] Загружаю эмбеддер: {model_name}")
-        self.model = SentenceTransformer(model_name, device=device)
+        # cache_dir — дисковый кэш эмбеддингов: модель считает только невиданные тексты
+        # bulk — массовый режим для сборки индекса (rag/bulk_embed.py): корзины по длине в токенах,
+        # workers > 0 — пул CPU-процессов (на GPU считаем в процессе)
+        # backend — "onnx": int8 ONNX Runtime (rag/onnx_backend.py), при провале экспорта/сверки — torch
+        # query_cache_* — LRU эмбеддингов запросов (encode_queries), query_cache_dir — ещё и на диске
+        if backend not in EMBED_BACKENDS:
+            raise ValueError(f"Unknown embedder backend: {backend} (expected one of {EMBED_BACKENDS})")
+        self.model_name = model_name
+        self.device = device
+        self.batch_size = batch_size
+        self.backend = ("onnx" if not has_gpu(device) else "torch") if backend == "auto" else backend
+        self.query_prefix, self.passage_prefix = e5_prefixes(model_name)
+        self.cache_dir = cache_dir
+        self.query_cache_size = query_cache_size
+        self.query_cache_dir = query_cache_dir
+        self._make_caches()
+        self.bulk = BulkEncoder(model_name, self._encode_bucket, device, workers, batch_size,
+                                backend=self.backend) if bulk else None
+        if self.cache is None:
+            self.model  # загрузка сразу, как и раньше; с кэшем — только при первом промахе
+
+    def _make_caches(self):
+        # Векторы int8-модели чуть отличаются — отдельный кэш, чтобы не смешивать в одном индексе
+        name = embed_model_id(self.model_name, self.backend)
+        self.cache = EmbeddingCache(self.cache_dir, name) if self.cache_dir else None
+        self.query_cache = (QueryCache(name, self.query_cache_size, self.query_cache_dir)
+                            if self.query_cache_size else None)
+
+    @property
+    def model_id(self) -> str:
+        """Фактическая модель с бэкендом (пишется в манифест стора, сверяется при поиске)"""
+        if self.backend == "onnx":
+            self.model  # экспорт/сверка могут откатить эмбеддер на torch
+        return embed_model_id(self.model_name, self.backend)
+
+    @property
+    def model(self) -> SentenceTransformer:
+        """Модель из общего кэша: её можно выгрузить по бюджету памяти, при обращении загрузится снова"""
+        if self.backend == "onnx":
+            try:
+                return model_cache.get_or_load(f"embedder_onnx_{self.model_name}",
+                                               lambda: load_or_export(self.model_name), device="cpu")
+            except (OnnxBackendError, ImportError) as e:
+                print(f"[RAG] {e} — эмбеддер на torch")
+                self.backend = "torch"
+                self._make_caches()
+                if self.bulk is not None:
+                    self.bulk.backend = "torch"
+
+        def load():
+            print(f"[RAG] Загружаю эмбеддер: {self.model_name}")
+            return SentenceTransformer(self.model_name, device=self.device)
+        return model_cache.get_or_load(get_embedder_cache_key(self.model_name, self.device),
+                                       load, device=self.device)
 
     def encode(self, texts: List[str]) -> np.ndarray:
         """
-        Возвращает np.ndarray float32 (N, d)
+        Эмбеддинги фрагментов (чанков) для индекса: np.ndarray float32 (N, d)
+        """
+        texts = [self.passage_prefix + t for t in texts]
+        if self.cache is not None:
+            misses = self.cache.misses
+            vecs = self.cache.encode(texts, self._encode)
+            misses = self.cache.misses - misses
+            print(f"[RAG] Кэш эмбеддингов: {len(texts) - misses} из кэша, {misses} посчитано")
+            return vecs
+        return self._encode(texts)
+
+    def encode_queries(self, texts: List[str]) -> np.ndarray:
         """
+        Эмбеддинги поисковых запросов (N, d): нормализованный текст с префиксом запроса,
+        повторы — из LRU без прогона модели
+        """
+        texts = [self.query_prefix + normalize_query(t) for t in texts]
+        if self.query_cache is None:
+            return self._encode(texts)
+        return self.query_cache.encode(texts, self._encode)
+
+    def stats(self) -> Dict:
+        """Попадания кэшей эмбеддингов: запросов и (при сборке) чанков"""
+        stats = {"backend": self.backend}
+        if self.query_cache is not None:
+            stats["query_cache"] = self.query_cache.stats()
+        if self.cache is not None:
+            stats["embed_cache"] = self.cache.stats()
+        return stats
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        if self.bulk is not None and len(texts) > self.batch_size:
+            if self.backend == "onnx":
+                self.model  # экспорт и сверка — в этом процессе, до старта пула
+            return self.bulk.encode(texts)
         vecs = self.model.encode(
             texts,
-            batch_size=32,
+            batch_size=self.batch_size,
             show_progress_bar=True,
             convert_to_numpy=True,
             normalize_embeddings=False   # нормализацию сделаем отдельно
         )
         return vecs.astype("float32")
+
+    def _encode_bucket(self, texts: List[str], batch_size: int) -> np.ndarray:
+        vecs = self.model.encode(texts, batch_size=batch_size, show_progress_bar=False,
+                                 convert_to_numpy=True, normalize_embeddings=False)
+        return np.asarray(vecs, dtype="float32")
+
+    def close(self) -> None:
+        """Остановить пул процессов bulk-режима"""
+        if self.bulk is not None:
+            self.bulk.close()
+
+    def warm_up(self) -> None:
+        """Пустой инференс: прогрев ядер и кэшей до первого запроса"""
+        self.model.encode(["warm-up"], show_progress_bar=False)
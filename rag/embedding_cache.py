@@ -0,0 +1,201 @@
+# rag/embedding_cache.py
+import fcntl
+import hashlib
+import json
+import os
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+KEY_SIZE = 16  # blake2b-128 от текста
+QUERY_CACHE_SIZE = 4096  # эмбеддингов запросов в памяти
+
+
+def text_key(text: str) -> bytes:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=KEY_SIZE).digest()
+
+
+class EmbeddingCache:
+    """
+    Content-addressed кэш эмбеддингов на диске: для каждой модели своя папка с
+    - vectors.bin — матрица (N, d) float16/float32, читается через np.memmap;
+    - keys.bin    — N ключей по 16 байт (хэш текста), i-й ключ -> i-я строка;
+    - info.json   — размерность и тип.
+    Файлы только дописываются (сначала векторы, потом ключи — ключ появляется,
+    когда строка уже записана), запись между процессами — под flock.
+    """
+
+    def __init__(self, cache_dir: str, model_name: str, dtype: str = "float16"):
+        slug = re.sub(r"[^\w.-]+", "__", model_name)
+        self.dir = os.path.join(cache_dir, slug)
+        os.makedirs(self.dir, exist_ok=True)
+        self.keys_path = os.path.join(self.dir, "keys.bin")
+        self.vecs_path = os.path.join(self.dir, "vectors.bin")
+        self.info_path = os.path.join(self.dir, "info.json")
+        self.lock_path = os.path.join(self.dir, ".lock")
+        self.dtype = np.dtype(dtype)
+        self.dim = None
+        self.rows: Dict[bytes, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self._vectors = None
+        self._refresh()
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def _refresh(self):
+        """Подхватить строки, дописанные с прошлого чтения (в т.ч. другими процессами)"""
+        if os.path.exists(self.info_path):
+            with open(self.info_path, "r", encoding="utf-8") as f:
+                info = json.load(f)
+            self.dim, self.dtype = info["dim"], np.dtype(info["dtype"])
+        if self.dim is None or not os.path.exists(self.keys_path):
+            return
+        row_bytes = self.dim * self.dtype.itemsize
+        n = min(os.path.getsize(self.keys_path) // KEY_SIZE,
+                os.path.getsize(self.vecs_path) // row_bytes)
+        if n > len(self.rows):
+            with open(self.keys_path, "rb") as f:
+                f.seek(len(self.rows) * KEY_SIZE)
+                data = f.read((n - len(self.rows)) * KEY_SIZE)
+            for i in range(len(data) // KEY_SIZE):
+                self.rows.setdefault(data[i * KEY_SIZE:(i + 1) * KEY_SIZE], len(self.rows))
+        if n and (self._vectors is None or len(self._vectors) != n):
+            self._vectors = np.memmap(self.vecs_path, dtype=self.dtype, mode="r", shape=(n, self.dim))
+
+    @contextmanager
+    def _locked(self):
+        with open(self.lock_path, "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _append(self, keys: List[bytes], vecs: np.ndarray):
+        with self._locked():
+            if self.dim is None and not os.path.exists(self.info_path):
+                with open(self.info_path, "w", encoding="utf-8") as f:
+                    json.dump({"dim": int(vecs.shape[1]), "dtype": self.dtype.name}, f)
+            self._refresh()
+            if vecs.shape[1] != self.dim:
+                raise ValueError(f"Embedding dim {vecs.shape[1]} != cached dim {self.dim}")
+            new = [i for i, k in enumerate(keys) if k not in self.rows]
+            if not new:
+                return
+            # Обрезаем недописанный хвост после аварийного завершения
+            n = len(self.rows)
+            row_bytes = self.dim * self.dtype.itemsize
+            with open(self.vecs_path, "ab") as f:
+                f.truncate(n * row_bytes)
+                f.write(np.ascontiguousarray(vecs[new], dtype=self.dtype).tobytes())
+            with open(self.keys_path, "ab") as f:
+                f.truncate(n * KEY_SIZE)
+                f.write(b"".join(keys[i] for i in new))
+            self._refresh()
+
+    def encode(self, texts: List[str], encode_fn: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        """
+        Эмбеддинги (N, d) float32: из кэша, а для невиданных текстов — encode_fn
+        (вызывается один раз на уникальные промахи) с дозаписью в кэш.
+        """
+        keys = [text_key(t) for t in texts]
+        self._refresh()
+        missing: Dict[bytes, str] = {}
+        for k, t in zip(keys, texts):
+            if k not in self.rows:
+                missing.setdefault(k, t)
+        self.hits += len(texts) - sum(1 for k in keys if k in missing)
+        self.misses += len(missing)
+
+        computed: Dict[bytes, np.ndarray] = {}
+        if missing:
+            miss_keys = list(missing)
+            vecs = np.asarray(encode_fn([missing[k] for k in miss_keys]), dtype="float32")
+            # Округляем до точности хранения: результат не зависит от того, был ли промах
+            computed = dict(zip(miss_keys, vecs.astype(self.dtype).astype("float32")))
+            self._append(miss_keys, vecs)
+
+        if not texts:
+            return np.zeros((0, self.dim or 0), dtype="float32")
+        dim = self.dim if self.dim is not None else next(iter(computed.values())).shape[0]
+        out = np.empty((len(texts), dim), dtype="float32")
+        hit_pos = [i for i, k in enumerate(keys) if k not in computed]
+        if hit_pos:
+            out[hit_pos] = self._vectors[[self.rows[keys[i]] for i in hit_pos]]
+        for i, k in enumerate(keys):
+            if k in computed:
+                out[i] = computed[k]
+        return out
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {"rows": len(self.rows), "hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0}
+
+
+def normalize_query(text: str) -> str:
+    """Текст запроса для эмбеддинга и ключа кэша: NFKC, регистр, ё -> е, схлопнутые пробелы"""
+    return " ".join(unicodedata.normalize("NFKC", text).casefold().replace("ё", "е").split())
+
+
+class QueryCache:
+    """
+    LRU эмбеддингов запросов в памяти, ключ — хэш (модель, текст запроса с префиксом).
+    cache_dir — дополнительно дисковый EmbeddingCache (float32): переживает перезапуск
+    чата и API-сервера. Тексты сюда приходят уже нормализованными.
+    """
+
+    def __init__(self, model_name: str, size: int = QUERY_CACHE_SIZE, cache_dir: Optional[str] = None):
+        self.model_name = model_name
+        self.size = size
+        self.disk = EmbeddingCache(cache_dir, model_name, dtype="float32") if cache_dir else None
+        self._lru: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def encode(self, texts: List[str], encode_fn: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        keys = [text_key(f"{self.model_name}\n{t}") for t in texts]
+        out: List[Optional[np.ndarray]] = [None] * len(texts)
+        missing: Dict[bytes, str] = {}
+        with self._lock:
+            for i, (k, t) in enumerate(zip(keys, texts)):
+                vec = self._lru.get(k)
+                if vec is not None:
+                    self._lru.move_to_end(k)
+                    out[i] = vec
+                else:
+                    missing.setdefault(k, t)
+            self.hits += len(texts) - len(missing)  # повтор внутри батча — тоже попадание
+            self.misses += len(missing)
+
+        if missing:
+            miss_keys = list(missing)
+            miss_texts = [missing[k] for k in miss_keys]
+            vecs = self.disk.encode(miss_texts, encode_fn) if self.disk is not None else encode_fn(miss_texts)
+            computed = dict(zip(miss_keys, np.asarray(vecs, dtype="float32")))
+            with self._lock:
+                self._lru.update(computed)
+                while len(self._lru) > self.size:
+                    self._lru.popitem(last=False)
+            for i, k in enumerate(keys):
+                if out[i] is None:
+                    out[i] = computed[k]
+        if not texts:
+            return np.zeros((0, 0), dtype="float32")
+        return np.stack(out)
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        stats = {"cached": len(self._lru), "hits": self.hits, "misses": self.misses,
+                 "hit_rate": self.hits / total if total else 0.0}
+        if self.disk is not None:
+            stats["disk_hits"] = self.disk.hits
+        return stats
@@ -1,8 +1,38 @@
 # rag/index_store.py
+import hashlib
+import json
 import os
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
 import faiss
-from typing import List, Dict, Tuple
-from .utils import ensure_dir, save_json, load_json
+import numpy as np
+
+from . import ann
+from .chunker import iter_chunks, token_counter
+from .chunk_store import ChunkStore
+from .lexical import LexicalIndex
+from .utils import ensure_dir, save_json, load_json, l2_normalize
+
+MANIFEST_VERSION = 7  # 6: префикс "passage: " (e5); 7: коллекции и типизированные колонки чанков
+EMBED_BATCH = 2048  # чанков на один вызов Embedder.encode при сборке (bulk делит их на корзины по длине)
+
+
+def doc_key(collection: str, doc_id: str) -> str:
+    """Ключ документа в манифесте: ID уникальны только внутри коллекции"""
+    return f"{collection}:{doc_id}"
+
+
+def store_settings(model_id: str) -> Dict:
+    """Общие настройки стора: при их смене все векторы несовместимы"""
+    return {"version": MANIFEST_VERSION, "model": model_id}
+
+
+def doc_hash(doc: Dict) -> str:
+    """Хэш содержимого документа (текст + мета): изменился — переэмбеддим"""
+    payload = json.dumps({"text": doc["text"], "meta": doc.get("meta", {})},
+                         ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
 
 class IndexStore:
     def __init__(self, base_dir: str):
@@ -11,18 +41,272 @@ class IndexStore:
         """
         self.base_dir = base_dir
         self.index_path = os.path.join(base_dir, "faiss.index")
-        self.meta_path  = os.path.join(base_dir, "meta.json")
+        self.chunks_path = os.path.join(base_dir, "chunks.sqlite")
+        self.lexical_path = os.path.join(base_dir, "lexical.sqlite")
+        self.manifest_path = os.path.join(base_dir, "manifest.json")
+        self.vectors_path = os.path.join(base_dir, "vectors.f32")
+        self.legacy_meta_path = os.path.join(base_dir, "meta.json")  # до chunks.sqlite
 
-    def save(self, index: faiss.Index, metas: List[Dict]):
+    def save(self, index: faiss.Index):
         ensure_dir(self.base_dir)
         faiss.write_index(index, self.index_path)
-        save_json(self.meta_path, metas)
-        print(f"[RAG] Индекс сохранён: {self.index_path}, мета: {self.meta_path}, векторов: {len(metas)}")
+        print(f"[RAG] Индекс сохранён: {self.index_path}, чанки: {self.chunks_path}, векторов: {index.ntotal}")
 
-    def load(self) -> Tuple[faiss.Index, List[Dict]]:
-        if not (os.path.exists(self.index_path) and os.path.exists(self.meta_path)):
+    def exists(self) -> bool:
+        return os.path.exists(self.index_path) and os.path.exists(self.chunks_path)
+
+    def load(self) -> Tuple[faiss.Index, ChunkStore]:
+        """Индекс и хранилище чанков (тексты читаются лениво, только для найденных ID)"""
+        if not self.exists():
             raise RuntimeError(f"[RAG] Индекс не найден в {self.base_dir}. Сначала соберите его.")
         index = faiss.read_index(self.index_path)
-        metas = load_json(self.meta_path)
-        print(f"[RAG] Индекс загружен: {self.index_path}, мета-объектов: {len(metas)}")
-        return index, metas
+        print(f"[RAG] Индекс загружен: {self.index_path}, векторов: {index.ntotal}")
+        return index, ChunkStore(self.chunks_path)
+
+    def load_manifest(self) -> Optional[Dict]:
+        if not os.path.exists(self.manifest_path):
+            return None
+        return load_json(self.manifest_path)
+
+    def load_vectors(self, dim: int) -> np.ndarray:
+        """Исходные нормированные векторы (ID -> строка), memmap только для чтения"""
+        if not os.path.exists(self.vectors_path) or os.path.getsize(self.vectors_path) == 0:
+            return np.zeros((0, dim), dtype="float32")
+        return np.memmap(self.vectors_path, dtype="float32", mode="r").reshape(-1, dim)
+
+    def open_vectors(self) -> Optional[np.ndarray]:
+        """Полные векторы для точного пересчёта кандидатов (None, если стор собран без них)"""
+        manifest = self.load_manifest()
+        if manifest is None or "dim" not in manifest.get("index", {}):
+            return None
+        return self.load_vectors(manifest["index"]["dim"])
+
+    def open_lexical(self) -> Optional[LexicalIndex]:
+        """BM25-индекс для гибридного поиска (None, если стор собран без него)"""
+        if not os.path.exists(self.lexical_path):
+            return None
+        return LexicalIndex(self.lexical_path)
+
+    def _stale(self, manifest: Dict, settings: Dict) -> bool:
+        """Стор неполный или собран с другими моделью/бэкендом/форматом — только полная пересборка"""
+        complete = self.exists() and os.path.exists(self.vectors_path) and os.path.exists(self.lexical_path)
+        return not complete or manifest.get("settings") != settings
+
+    def needs_reset(self, model_id: str) -> bool:
+        """Сборка моделью model_id (Embedder.model_id) пересоберёт стор целиком, со всеми коллекциями"""
+        manifest = self.load_manifest()
+        return manifest is not None and self._stale(manifest, store_settings(model_id))
+
+    def reset(self):
+        """Удалить индекс, векторы, чанки, BM25 и манифест всех коллекций"""
+        for path in (self.index_path, self.vectors_path, self.chunks_path, self.lexical_path,
+                     self.legacy_meta_path, self.manifest_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _append_vectors(self, start_id: int, vecs: np.ndarray):
+        ensure_dir(self.base_dir)
+        with open(self.vectors_path, "ab") as f:
+            f.truncate(start_id * vecs.shape[1] * 4)
+            f.write(np.ascontiguousarray(vecs, dtype="float32").tobytes())
+
+    def update(self, docs: Iterable[Dict], get_embedder: Callable, model_name: str,
+               max_tokens: int, overlap_tokens: int, rebuild: bool = False,
+               index_type: str = "auto", storage: str = "float32",
+               collection: str = "docs", model_id: Optional[str] = None) -> Dict[str, int]:
+        """
+        Инкрементальная сборка коллекции collection ("summary", "transcript", ...):
+        эмбеддим только новые и изменённые документы, векторы удалённых убираем из
+        индекса по ID. Документы других коллекций стора не трогаются; у чанков в мета
+        проставляется source = collection (типизированная колонка для фильтров).
+
+        Потоково: документ -> чанки (rag.chunker.iter_chunks, до max_tokens токенов
+        токенизатора модели) -> батчи по EMBED_BATCH чанков -> эмбеддинги сразу на диск,
+        поэтому память не растёт с размером корпуса (кроме перестройки индекса).
+
+        ID вектора — строка в vectors.f32 (нормированные векторы, из которых индекс
+        перестраивается без переэмбеддинга), ключ в chunks.sqlite (текст и мета чанка)
+        и в lexical.sqlite (BM25);
+        строки удалённых чанков из chunks.sqlite удаляются. Манифест хранит хэш и ID
+        чанков каждого документа.
+        Все документы коллекции переэмбеддятся по rebuild=True или при смене её параметров
+        нарезки. При смене модели, бэкенда или формата стора несовместимы векторы всех
+        коллекций: если в сторе есть другие коллекции, update отказывается (RuntimeError),
+        ничего не удаляя, — их пересобирают вместе (rag.build делает reset и собирает все).
+        index_type: "auto" (по размеру корпуса) или один из rag.ann.INDEX_TYPES; при
+        смене типа или сильном росте корпуса для IVF индекс перестраивается из vectors.f32.
+        storage: формат векторов внутри индекса ("float32", "sq8", "fp16", см. rag.ann.STORAGES).
+        model_id — модель с бэкендом эмбеддера (Embedder.model_id, напр. "...@onnx-int8"):
+        векторы torch и int8-ONNX в одном индексе не смешиваются. model_name — для токенизатора.
+        get_embedder вызывается, только если есть что эмбеддить.
+        """
+        settings = store_settings(model_id or model_name)
+        chunking = {"max_tokens": max_tokens, "overlap_tokens": overlap_tokens}
+        manifest = self.load_manifest()
+        if manifest is not None and self._stale(manifest, settings):
+            # Документы до коллекций (манифест < 7) — тоже чужие: без них стор не пересобираем
+            others = sorted({entry.get("collection", "docs") for entry in manifest["docs"].values()}
+                            - {collection})
+            if others:
+                raise RuntimeError(f"[RAG] Стор {self.base_dir} собран с другими моделью, бэкендом или "
+                                   f"форматом: пересоберите все коллекции сразу (python -m rag.build), "
+                                   f"иначе пропадут коллекции {', '.join(others)}")
+            print("[RAG] Изменились модель, бэкенд эмбеддера или формат стора — полная пересборка")
+            manifest = None
+
+        if manifest is not None:
+            index = faiss.read_index(self.index_path)
+        else:
+            index = None
+            manifest = {"settings": settings, "collections": {}, "docs": {}, "index": {}}
+            for path in (self.vectors_path, self.chunks_path, self.lexical_path, self.legacy_meta_path):
+                if os.path.exists(path):
+                    os.remove(path)
+
+        previous = manifest["collections"].get(collection)
+        if rebuild or (previous is not None and previous != chunking):
+            print(f"[RAG] Коллекция {collection}: " + ("пересборка" if rebuild else "изменились параметры нарезки")
+                  + " — все её документы будут переэмбеддены")
+            for entry in manifest["docs"].values():
+                if entry["collection"] == collection:
+                    entry["hash"] = None
+        manifest["collections"][collection] = chunking
+        chunk_store = ChunkStore(self.chunks_path)
+        lexical = LexicalIndex(self.lexical_path)
+        try:
+            return self._update(docs, collection, get_embedder, token_counter(model_name), max_tokens,
+                                overlap_tokens, rebuild, index_type, storage, manifest, index, chunk_store, lexical)
+        finally:
+            chunk_store.close()
+            lexical.close()
+
+    def _update(self, docs, collection, get_embedder, count_tokens, max_tokens, overlap_tokens, rebuild,
+                index_type, storage, manifest, index, chunk_store: ChunkStore,
+                lexical: LexicalIndex) -> Dict[str, int]:
+        index_info = manifest["index"]
+        known = manifest["docs"]
+        seen = set()
+        added, changed, stale = [], [], []
+        # Строки сверх total в сторах — от сборки, упавшей до записи манифеста: убираем, ID выдадим заново
+        total = index_info.get("total")
+        if total is None:  # манифест до учёта total
+            total = len(self.load_vectors(index_info["dim"])) if "dim" in index_info else 0
+        # Индекс мог успеть сохраниться с этим хвостом — тогда перестраиваем его из vectors.f32
+        rolled_back = self._rollback(total, index_info.get("dim"), chunk_store, lexical)
+        first_new = total
+        embedder = None
+        batch: List[Dict] = []
+
+        def flush():
+            """Эмбеддинги батча чанков -> vectors.f32, chunks.sqlite, BM25; новые ID — следующие строки"""
+            nonlocal embedder, total
+            if not batch:
+                return
+            embedder = embedder or get_embedder()
+            vecs = l2_normalize(embedder.encode([c["text"] for c in batch]))
+            index_info.setdefault("dim", int(vecs.shape[1]))
+            ids = list(range(total, total + len(batch)))
+            self._append_vectors(total, vecs)
+            chunk_store.add(ids, batch)
+            lexical.add(ids, [c["text"] for c in batch])
+            for c, i in zip(batch, ids):
+                known[doc_key(collection, c["doc_id"])]["ids"].append(i)
+            total += len(batch)
+            batch.clear()
+
+        def fresh_docs():
+            """Новые и изменённые документы; неизменённые пропускаются без нарезки"""
+            for doc in docs:
+                key, h = doc_key(collection, doc["id"]), doc_hash(doc)
+                seen.add(key)
+                entry = known.get(key)
+                if entry is not None and entry["hash"] == h:
+                    continue
+                if entry is not None:
+                    changed.append(key)
+                    stale.extend(entry["ids"])
+                else:
+                    added.append(key)
+                # Документ без чанков (пустой текст) тоже учитываем, чтобы не обрабатывать повторно
+                known[key] = {"hash": h, "ids": [], "collection": collection}
+                yield {**doc, "meta": {**doc.get("meta", {}), "source": collection}}
+
+        for chunk in iter_chunks(fresh_docs(), count_tokens, max_tokens, overlap_tokens):
+            batch.append(chunk)
+            if len(batch) >= EMBED_BATCH:
+                flush()
+        flush()
+
+        # Удаляем векторы удалённых и изменённых документов (HNSW — только мягко: ID не переиспользуются,
+        # а чанка с таким ID больше нет)
+        removed = [key for key, entry in known.items() if entry["collection"] == collection and key not in seen]
+        for key in removed:
+            stale.extend(known.pop(key)["ids"])
+        if stale:
+            ann.remove_ids(index, np.array(stale, dtype="int64"))
+            chunk_store.delete(stale)
+
+        live = sum(len(entry["ids"]) for entry in known.values())
+        stats = {"added": len(added), "changed": len(changed), "removed": len(removed),
+                 "embedded_chunks": total - first_new, "vectors": live}
+        if "dim" not in index_info:
+            return stats
+
+        compacted = False
+        if total > 2 * max(live, 1):
+            self._compact(known, index_info["dim"], chunk_store, lexical, total)
+            compacted = True
+
+        # Перестраиваем индекс из vectors.f32, если меняется тип или IVF обучен на слишком малой выборке
+        kind = ann.choose_index_type(live) if index_type == "auto" else index_type
+        retrain = kind in ("ivf", "ivfpq") and live > 4 * index_info.get("trained_on", 0)
+        rebuilt = (index is None or compacted or rebuild or rolled_back or retrain
+                   or kind != index_info.get("type") or storage != index_info.get("storage", "float32"))
+        vectors = self.load_vectors(index_info["dim"])
+        if rebuilt:
+            ids = np.array(sorted(i for entry in known.values() for i in entry["ids"]), dtype="int64")
+            index = ann.build_index(kind, np.ascontiguousarray(vectors[ids]), ids, storage)
+            index_info.update(type=ann.index_type(index), storage=storage, trained_on=live)
+            print(f"[RAG] Индекс {index_info['type']}/{storage} построен по {live} векторам")
+        else:
+            # Новые векторы — в индекс из vectors.f32 теми же батчами
+            for start in range(first_new, total, EMBED_BATCH):
+                stop = min(start + EMBED_BATCH, total)
+                index.add_with_ids(np.ascontiguousarray(vectors[start:stop]),
+                                   np.arange(start, stop, dtype="int64"))
+
+        if removed or changed or added or rebuilt:
+            index_info["total"] = len(self.load_vectors(index_info["dim"]))
+            self.save(index)
+            save_json(self.manifest_path, manifest)
+        return stats
+
+    def _rollback(self, total: int, dim: Optional[int], chunk_store: ChunkStore, lexical: LexicalIndex) -> bool:
+        """Откатить хвост незавершённой сборки: векторы, чанки и BM25 с ID >= total. True — если он был"""
+        vectors = dim is not None and os.path.exists(self.vectors_path) \
+            and os.path.getsize(self.vectors_path) > total * dim * 4
+        if vectors:
+            with open(self.vectors_path, "r+b") as f:
+                f.truncate(total * dim * 4)
+        chunks = chunk_store.delete_from(total)
+        terms = lexical.truncate(total)
+        if vectors or chunks or terms:
+            print(f"[RAG] Откат незавершённой сборки: удалены векторы, чанки и BM25 с ID >= {total}")
+            return True
+        return False
+
+    def _compact(self, known: Dict[str, Dict], dim: int, chunk_store: ChunkStore,
+                 lexical: LexicalIndex, total: int):
+        """Убрать дыры от удалённых чанков в vectors.f32, chunks.sqlite и BM25 (индекс затем перестраивается)"""
+        live = sorted(i for entry in known.values() for i in entry["ids"])
+        vectors = np.array(self.load_vectors(dim)[live])
+        with open(self.vectors_path, "wb") as f:
+            f.write(vectors.tobytes())
+        remap = {old: new for new, old in enumerate(live)}
+        for entry in known.values():
+            entry["ids"] = [remap[i] for i in entry["ids"]]
+        chunk_store.renumber(remap)
+        lexical.clear()
+        rows = chunk_store.texts()
+        lexical.add([i for i, _ in rows], [text for _, text in rows])
+        print(f"[RAG] Индекс уплотнён: {total} -> {len(live)} векторов")
@@ -0,0 +1,291 @@
+# rag/lexical.py
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from collections import Counter, defaultdict
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# BM25
+K1 = 1.2
+B = 0.75
+
+# Составные токены (номера задач, даты, версии) сохраняем целиком и по частям
+TOKEN_RE = re.compile(r"[0-9a-zа-я]+(?:[-_./#][0-9a-zа-я]+)*")
+PART_RE = re.compile(r"[-_./#]")
+CYRILLIC_RE = re.compile(r"[а-я]")
+
+STOPWORDS = frozenset(
+    "и в во не что он на я с со как а то все она так его но да ты к у же вы за бы по "
+    "только ее мне было вот от меня еще нет о из ему теперь когда даже ну вдруг ли если "
+    "уже или ни быть был него до вас нибудь опять уж вам ведь там потом себя ничего ей "
+    "может они тут где есть надо ней для мы тебя их чем была сам чтоб без будто чего раз "
+    "тоже себе под будет ж тогда кто этот того потому этого какой совсем ним здесь этом "
+    "один почти мой тем чтобы нее были куда зачем всех никогда можно при наконец два об "
+    "другой хоть после над больше тот через эти нас про всего них какая много разве три "
+    "эту моя впрочем хорошо свою этой перед иногда лучше чуть том нельзя такой им более "
+    "всегда конечно всю между это".split()
+)
+
+# Запасной стеммер, если нет snowballstemmer: отрезаем самое длинное окончание
+_SUFFIXES = sorted(
+    "ившись ывшись ующая ующее ующие ующий ующих ующую ейшая ейшее ейшие ейший ейших "
+    "ивший ывший ившая ывшая ившие ывшие иями ями ами ией ием ого его ому ему ыми ими "
+    "ая яя ое ее ые ие ый ий ой ей ую юю их ых ом ем ам ям ах ях ов ев ию ия ье ья ью ьи "
+    "ешь ишь ете ите ет ит ут ют ат ят ал ял ил ыл ла ло ли ть ти ся сь "
+    "а я о е ы и у ю ь й".split(),
+    key=len, reverse=True)
+MIN_STEM = 3
+
+
+def _light_stem(word: str) -> str:
+    for suffix in _SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= MIN_STEM:
+            return word[:-len(suffix)]
+    return word
+
+
+@lru_cache(maxsize=1)
+def _russian_stemmer():
+    """Snowball (snowballstemmer), иначе упрощённое отсечение окончаний"""
+    try:
+        import snowballstemmer
+        return snowballstemmer.stemmer("russian").stemWord
+    except ImportError:
+        print("[RAG] snowballstemmer не установлен — упрощённый стемминг для BM25")
+        return _light_stem
+
+
+@lru_cache(maxsize=100_000)
+def stem(word: str) -> str:
+    if len(word) <= MIN_STEM or not CYRILLIC_RE.search(word):
+        return word  # латиница, числа и короткие слова — как есть (имена, номера)
+    return _russian_stemmer()(word)
+
+
+def tokenize(text: str) -> List[str]:
+    """Термы для BM25: нижний регистр, ё -> е, стоп-слова убраны, русские слова — основы"""
+    terms = []
+    for token in TOKEN_RE.findall(text.lower().replace("ё", "е")):
+        parts = PART_RE.split(token)
+        if len(parts) > 1:
+            terms.append(token)
+        terms.extend(stem(p) for p in parts if p not in STOPWORDS)
+    return terms
+
+
+def _encode_ids(ids: np.ndarray) -> bytes:
+    # Возрастающие ID -> дельты -> zlib: постинги частых термов сжимаются в разы
+    return zlib.compress(np.diff(ids, prepend=0).astype("<u4").tobytes())
+
+
+def _decode_ids(blob: bytes) -> np.ndarray:
+    return np.cumsum(np.frombuffer(zlib.decompress(blob), dtype="<u4"), dtype="int64")
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS terms (
+    term TEXT PRIMARY KEY,
+    ids  BLOB NOT NULL,  -- ID чанков по возрастанию, дельты uint32 + zlib
+    tfs  BLOB NOT NULL   -- частоты терма, uint16 + zlib
+);
+CREATE TABLE IF NOT EXISTS lengths (
+    id     INTEGER PRIMARY KEY,
+    length INTEGER NOT NULL
+);
+"""
+SQL_BATCH = 500  # термов в одном IN (...)
+POSTINGS_CACHE = 20_000  # декодированных постингов в памяти
+
+
+class LexicalIndex:
+    """
+    Инвертированный индекс BM25 по текстам чанков (lexical.sqlite рядом с FAISS).
+    ID — те же, что в faiss.index и chunks.sqlite. Новые чанки дописываются в
+    постинги; удалённые отсекаются маской ChunkStore при поиске, а при уплотнении
+    стора индекс перестраивается.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._lengths: Optional[np.ndarray] = None
+        self._postings: Dict[str, Optional[Tuple[np.ndarray, np.ndarray]]] = {}
+        with self._lock:
+            self._conn.executescript(SCHEMA)
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _changed(self):
+        self._lengths = None
+        self._postings = {}
+
+    def _fetch(self, terms: List[str]) -> Dict[str, Tuple[bytes, bytes]]:
+        rows = {}
+        for start in range(0, len(terms), SQL_BATCH):
+            batch = terms[start:start + SQL_BATCH]
+            marks = ",".join("?" * len(batch))
+            for term, ids, tfs in self._conn.execute(
+                    f"SELECT term, ids, tfs FROM terms WHERE term IN ({marks})", batch):
+                rows[term] = (ids, tfs)
+        return rows
+
+    def add(self, ids: Iterable[int], texts: Iterable[str]):
+        """Дописать чанки (ID больше уже проиндексированных)"""
+        postings = defaultdict(lambda: ([], []))
+        lengths = []
+        for i, text in zip(ids, texts):
+            terms = tokenize(text)
+            lengths.append((int(i), len(terms)))
+            for term, tf in Counter(terms).items():
+                postings[term][0].append(int(i))
+                postings[term][1].append(min(tf, 65535))
+        if not lengths:
+            return
+
+        with self._lock:
+            existing = self._fetch(list(postings))
+            rows = []
+            for term, (new_ids, new_tfs) in postings.items():
+                term_ids = np.array(new_ids, dtype="int64")
+                term_tfs = np.array(new_tfs, dtype="<u2")
+                if term in existing:
+                    old_ids, old_tfs = existing[term]
+                    term_ids = np.concatenate([_decode_ids(old_ids), term_ids])
+                    term_tfs = np.concatenate([np.frombuffer(zlib.decompress(old_tfs), dtype="<u2"), term_tfs])
+                    order = np.argsort(term_ids, kind="stable")
+                    term_ids, term_tfs = term_ids[order], term_tfs[order]
+                rows.append((term, _encode_ids(term_ids), zlib.compress(term_tfs.tobytes())))
+            self._conn.executemany("INSERT OR REPLACE INTO terms VALUES (?, ?, ?)", rows)
+            self._conn.executemany("INSERT OR REPLACE INTO lengths VALUES (?, ?)", lengths)
+            self._conn.commit()
+            self._changed()
+
+    def truncate(self, start: int) -> int:
+        """
+        Убрать из индекса чанки с ID >= start (хвост незавершённой сборки), чтобы их ID
+        можно было выдать заново. Постинги переписываются, только если такой хвост есть.
+        """
+        with self._lock:
+            removed = self._conn.execute("SELECT COUNT(*) FROM lengths WHERE id >= ?", (int(start),)).fetchone()[0]
+            if not removed:
+                return 0
+            rows, empty = [], []
+            for term, ids, tfs in self._conn.execute("SELECT term, ids, tfs FROM terms").fetchall():
+                term_ids = _decode_ids(ids)
+                keep = term_ids < start
+                if keep.all():
+                    continue
+                if not keep.any():
+                    empty.append((term,))
+                    continue
+                term_tfs = np.frombuffer(zlib.decompress(tfs), dtype="<u2")[keep]
+                rows.append((term, _encode_ids(term_ids[keep]), zlib.compress(term_tfs.tobytes())))
+            self._conn.executemany("INSERT OR REPLACE INTO terms VALUES (?, ?, ?)", rows)
+            self._conn.executemany("DELETE FROM terms WHERE term = ?", empty)
+            self._conn.execute("DELETE FROM lengths WHERE id >= ?", (int(start),))
+            self._conn.commit()
+            self._changed()
+        return removed
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM terms")
+            self._conn.execute("DELETE FROM lengths")
+            self._conn.commit()
+            self._changed()
+
+    def _doc_lengths(self) -> np.ndarray:
+        if self._lengths is None:
+            with self._lock:
+                rows = self._conn.execute("SELECT id, length FROM lengths").fetchall()
+            lengths = np.zeros(max((i for i, _ in rows), default=-1) + 1, dtype="float32")
+            for i, length in rows:
+                lengths[i] = length
+            self._lengths = lengths
+        return self._lengths
+
+    def _get_postings(self, terms: List[str]) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+        missing = [t for t in terms if t not in self._postings]
+        if missing and len(self._postings) + len(missing) > POSTINGS_CACHE:
+            self._postings = {}
+            missing = list(terms)
+        if missing:
+            with self._lock:
+                rows = self._fetch(missing)
+            for term in missing:
+                if term in rows:
+                    ids, tfs = rows[term]
+                    self._postings[term] = (_decode_ids(ids),
+                                            np.frombuffer(zlib.decompress(tfs), dtype="<u2").astype("float32"))
+                else:
+                    self._postings[term] = None
+        return {t: self._postings[t] for t in terms if self._postings.get(t) is not None}
+
+    def search_batch(self, queries: List[str], allowed: np.ndarray, live: np.ndarray, k: int,
+                     budget_ms: Optional[float] = None) -> List[List[Tuple[float, int]]]:
+        """
+        BM25 top-k на каждый запрос: [(score, id)] по убыванию.
+        allowed — маска допустимых ID (фильтры), live — маска существующих (для idf).
+        budget_ms: термы обрабатываются от редких к частым; по истечении бюджета
+        оставшиеся (самые частые, с наименьшим вкладом) пропускаются — самый редкий
+        терм каждого запроса учитывается всегда.
+        """
+        deadline = time.perf_counter() + budget_ms / 1000 if budget_ms else None
+        query_terms = [list(dict.fromkeys(tokenize(q))) for q in queries]
+        postings = self._get_postings(sorted({t for terms in query_terms for t in terms}))
+        lengths = self._doc_lengths()
+        live = live[:len(lengths)]
+        n_docs = int(live.sum())
+        if n_docs == 0:
+            return [[] for _ in queries]
+        avgdl = float(lengths[:len(live)][live].mean()) or 1.0
+
+        def in_mask(mask: np.ndarray, ids: np.ndarray) -> np.ndarray:
+            inside = ids < len(mask)
+            inside[inside] = mask[ids[inside]]
+            return inside
+
+        results, skipped = [], 0
+        for terms in query_terms:
+            weighted = []
+            for term in terms:
+                if term not in postings:
+                    continue
+                ids, tfs = postings[term]
+                df = int(in_mask(live, ids).sum())
+                if df:
+                    weighted.append((math.log(1 + (n_docs - df + 0.5) / (df + 0.5)), ids, tfs))
+            weighted.sort(key=lambda w: -w[0])
+
+            all_ids, all_scores = [], []
+            for n, (idf, ids, tfs) in enumerate(weighted):
+                if n and deadline is not None and time.perf_counter() > deadline:
+                    skipped += len(weighted) - n
+                    break
+                keep = in_mask(allowed, ids)
+                ids, tfs = ids[keep], tfs[keep]
+                norm = K1 * (1 - B + B * lengths[ids] / avgdl)
+                all_ids.append(ids)
+                all_scores.append(idf * tfs * (K1 + 1) / (tfs + norm))
+            if not all_ids or not sum(len(i) for i in all_ids):
+                results.append([])
+                continue
+            uniq, inverse = np.unique(np.concatenate(all_ids), return_inverse=True)
+            scores = np.bincount(inverse, weights=np.concatenate(all_scores))
+            top = np.argsort(-scores, kind="stable")[:k]
+            results.append(list(zip(scores[top].tolist(), uniq[top].tolist())))
+        if skipped:
+            print(f"[RAG] BM25: бюджет {budget_ms} мс исчерпан, пропущено термов: {skipped}")
+        return results
@@ -3,6 +3,8 @@ import glob
 import json
 from typing import List, Dict
 
+from rag.metadata import file_meta
+
 # Мы делаем RAG по САММАРИ встреч
 SUMMARIES_DIR = "summaries"   # тут лежат meeting_*_summary.json
 
@@ -48,7 +50,7 @@ def load_summary_docs() -> List[Dict]:
             docs.append({
                 "id": os.path.basename(p),
                 "text": text.strip(),
-                "meta": {"path": p}
+                "meta": {"path": p, **file_meta(p)}  # саммари встречи: kind и дата — из имени
             })
         except Exception as e:
             print(f"[RAG] Ошибка чтения {p}: {e}")
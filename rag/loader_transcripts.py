@@ -3,17 +3,30 @@ import os
 import glob
 from typing import List, Dict
 
+from transcriber.utils import TRANSCRIPT_EXT, read_transcript
+from rag.metadata import file_meta
+
 TRANSCRIPTS_ROOT = "transcripts"
 MEETINGS_DIR     = os.path.join(TRANSCRIPTS_ROOT, "meetings")
 QUESTIONS_DIR    = os.path.join(TRANSCRIPTS_ROOT, "questions")
 
+def _read_text(path: str) -> str:
+    """JSONL-транскрипт (сегмент на строку — по ним режет чанкер) или старый плоский .txt"""
+    if path.endswith(TRANSCRIPT_EXT):
+        _, segments = read_transcript(path)
+        return "\n".join(seg["text"].strip() for seg in segments if seg.get("text", "").strip())
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read().strip()
+
 def _load_txt_files(folder: str, kind: str) -> List[Dict]:
-    paths = sorted(glob.glob(os.path.join(folder, "*.txt")))
+    paths = sorted(
+        glob.glob(os.path.join(folder, "*.txt")) +
+        glob.glob(os.path.join(folder, f"*{TRANSCRIPT_EXT}"))
+    )
     docs = []
     for p in paths:
         try:
-            with open(p, "r", encoding="utf-8") as f:
-                txt = f.read().strip()
+            txt = _read_text(p)
             if not txt:
                 continue
             docs.append({
@@ -21,17 +34,18 @@ def _load_txt_files(folder: str, kind: str) -> List[Dict]:
                 "text": txt,
                 "meta": {
                     "path": p,
-                    "type": kind  # "meeting" | "question"
+                    "type": kind,  # "meeting" | "question"
+                    **file_meta(p, kind)
                 }
             })
         except Exception as e:
-            print(f"[RAG] Ошибка чтения транскрипции {p}: {e}")
+            print(f"[RAG] Ошибка чтения транскрибации {p}: {e}")
     return docs
 
 def load_transcript_docs() -> List[Dict]:
     """
     Возвращает список документов из транскрибаций:
-    [{id, text, meta:{path, type}}]
+    [{id, text, meta:{path, type, kind, meeting_date}}]
     """
     docs = []
     docs += _load_txt_files(MEETINGS_DIR,  "meeting")
@@ -0,0 +1,43 @@
+# rag/metadata.py
+"""
+Типизированные метаданные чанков (колонки chunks.sqlite, по ним фильтруем до поиска):
+- source       — коллекция стора: "summary" | "transcript";
+- kind         — "meeting" | "question" (по префиксу имени файла);
+- meeting_date — дата записи "YYYY-MM-DD" из имени файла (meeting_2025-03-14_10-30-00_linux...).
+"""
+import os
+import re
+from datetime import date, timedelta
+from typing import Dict, Optional
+
+SOURCES = ("summary", "transcript")
+KINDS = ("meeting", "question")
+TYPED_FIELDS = ("source", "kind", "meeting_date")
+
+# Первая метка времени в имени — момент записи (дальше может идти метка транскрибации)
+STAMP_RE = re.compile(r"(\d{4})-(\d{2})-(\d{2})_\d{2}-\d{2}-\d{2}")
+
+
+def meeting_date(path: str) -> Optional[str]:
+    match = STAMP_RE.search(os.path.basename(path))
+    if match is None:
+        return None
+    try:
+        return date(*map(int, match.groups())).isoformat()
+    except ValueError:
+        return None
+
+
+def record_kind(path: str) -> Optional[str]:
+    name = os.path.basename(path)
+    return next((kind for kind in KINDS if name.startswith(f"{kind}_")), None)
+
+
+def file_meta(path: str, kind: Optional[str] = None) -> Dict:
+    """kind и meeting_date по имени файла (source проставляет IndexStore по коллекции)"""
+    return {"kind": kind or record_kind(path), "meeting_date": meeting_date(path)}
+
+
+def since_days(days: int, today: Optional[date] = None) -> Dict[str, str]:
+    """Фильтр по meeting_date за последние days дней: {"meeting_date": since_days(14)}"""
+    return {"gte": ((today or date.today()) - timedelta(days=days)).isoformat()}
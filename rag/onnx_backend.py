@@ -0,0 +1,244 @@
+# rag/onnx_backend.py
+"""
+Бэкенд эмбеддера для машин без GPU: трансформер SentenceTransformer, экспортированный
+в ONNX и динамически квантованный в int8, исполняется ONNX Runtime. Пулинг и
+нормализация повторяют модули SentenceTransformer, так что контракт encode тот же.
+
+Экспорт однократный и кэшируется в ONNX_CACHE_DIR/<модель>/ вместе с токенизатором;
+сразу после экспорта — сверка с torch по косинусам (parity в meta.json).
+
+    python -m rag.onnx_backend --export                       # экспорт + сверка
+    python -m rag.onnx_backend --check --store rag_store      # сверка на чанках стора
+"""
+import argparse
+import json
+import os
+import re
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+ONNX_CACHE_DIR = "rag_store/onnx"
+MODEL_FILE = "model_int8.onnx"
+OPSET = 14
+PARITY_MIN_COS = 0.99  # ниже — int8-модель не используется, остаёмся на torch
+PARITY_TEXTS = [
+    "query: когда релиз новой версии?",
+    "passage: На встрече договорились перенести релиз на следующую неделю из-за багов в оплате.",
+    "query: who owns the JIRA-1234 migration?",
+    "passage: Миграцию базы (JIRA-1234) ведёт команда платформы, срок — конец квартала.",
+    "passage: Обсудили найм: нужен ещё один бэкенд-разработчик и тестировщик.",
+    "passage: The quarterly OKR review was postponed; budget numbers are still pending.",
+]
+
+
+class OnnxBackendError(Exception):
+    """Нет onnxruntime/onnx или экспорт не удался"""
+    pass
+
+
+def export_dir(model_name: str, cache_dir: str = ONNX_CACHE_DIR) -> str:
+    return os.path.join(cache_dir, re.sub(r"[^\w.-]+", "__", model_name))
+
+
+def _load_meta(path: str) -> Dict:
+    with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _save_meta(path: str, meta: Dict):
+    with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+
+
+def _unit(vecs: np.ndarray) -> np.ndarray:
+    return vecs / np.maximum(np.linalg.norm(vecs, axis=1, keepdims=True), 1e-12)
+
+
+def compare(reference: np.ndarray, candidate: np.ndarray) -> Dict[str, float]:
+    """Сверка эмбеддингов: косинус строк между бэкендами и расхождение матриц косинусов текст-текст"""
+    a, b = _unit(reference.astype("float32")), _unit(candidate.astype("float32"))
+    row_cos = (a * b).sum(axis=1)
+    score_diff = np.abs(a @ a.T - b @ b.T)
+    return {"min_cos": float(row_cos.min()), "mean_cos": float(row_cos.mean()),
+            "max_score_diff": float(score_diff.max())}
+
+
+class OnnxEncoder:
+    """
+    ONNX Runtime int8-модель с encode как у SentenceTransformer (поэтому годится
+    для model_cache, Embedder и процессов bulk-эмбеддинга).
+    """
+
+    def __init__(self, path: str, threads: Optional[int] = None):
+        try:
+            import onnxruntime as ort
+        except ImportError as e:
+            raise OnnxBackendError("onnxruntime не установлен (pip install onnxruntime)") from e
+        from transformers import AutoTokenizer
+
+        self.meta = _load_meta(path)
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(os.path.join(path, MODEL_FILE), options,
+                                            providers=["CPUExecutionProvider"])
+        self.input_names = [i.name for i in self.session.get_inputs()]
+        self.tokenizer = AutoTokenizer.from_pretrained(path)
+        self.max_seq_length = self.meta["max_seq_length"]
+        self.size_mb = os.path.getsize(os.path.join(path, MODEL_FILE)) / 2 ** 20
+        # Экспорты без "dim" в meta.json — размерность из выхода графа (hidden size статичен)
+        dim = self.meta.get("dim", self.session.get_outputs()[0].shape[-1])
+        if not isinstance(dim, int):
+            raise OnnxBackendError(f"Неизвестна размерность эмбеддинга ONNX-модели в {path} — "
+                                   f"переэкспортируйте её (python -m rag.onnx_backend --export)")
+        self.dim = dim
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dim
+
+    def _forward(self, texts: List[str]) -> np.ndarray:
+        encoded = self.tokenizer(texts, padding=True, truncation=True, max_length=self.max_seq_length,
+                                 return_tensors="np")
+        feeds = {name: encoded[name].astype("int64") for name in self.input_names}
+        hidden = self.session.run(None, feeds)[0]
+        if self.meta["pooling"] == "cls":
+            vecs = hidden[:, 0]
+        else:
+            mask = encoded["attention_mask"][..., None].astype("float32")
+            vecs = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        if self.meta["normalize"]:
+            vecs = _unit(vecs)
+        return vecs.astype("float32")
+
+    def encode(self, texts: List[str], batch_size: int = 32, show_progress_bar: bool = False,
+               convert_to_numpy: bool = True, normalize_embeddings: bool = False, **_) -> np.ndarray:
+        if isinstance(texts, str):
+            texts = [texts]
+        # Как и SentenceTransformer: батчи из текстов похожей длины, результат — в исходном порядке
+        order = np.argsort([-len(t) for t in texts], kind="stable")
+        out = None
+        for start in range(0, len(texts), batch_size):
+            batch = order[start:start + batch_size]
+            vecs = self._forward([texts[i] for i in batch])
+            if out is None:
+                out = np.empty((len(texts), vecs.shape[1]), dtype="float32")
+            out[batch] = vecs
+        if out is None:
+            return np.zeros((0, 0), dtype="float32")
+        return _unit(out) if normalize_embeddings else out
+
+
+def export(model_name: str, cache_dir: str = ONNX_CACHE_DIR, texts: Optional[List[str]] = None) -> Dict:
+    """
+    Экспорт трансформера модели в ONNX (fp32), динамическая int8-квантизация весов,
+    токенизатор и meta.json рядом; затем сверка с torch. Возвращает meta.
+    """
+    try:
+        import torch
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+    except ImportError as e:
+        raise OnnxBackendError("Для экспорта нужны torch, onnx и onnxruntime (pip install onnx onnxruntime)") from e
+    from sentence_transformers import SentenceTransformer
+
+    path = export_dir(model_name, cache_dir)
+    os.makedirs(path, exist_ok=True)
+    print(f"[RAG] Экспорт {model_name} в ONNX: {path}")
+    start = time.perf_counter()
+    st_model = SentenceTransformer(model_name, device="cpu")
+    transformer = st_model[0].auto_model.eval()
+    pooling = next((m for m in st_model if hasattr(m, "pooling_mode_cls_token")), None)
+    meta = {
+        "model": model_name,
+        "pooling": "cls" if pooling is not None and pooling.pooling_mode_cls_token else "mean",
+        "normalize": any(type(m).__name__ == "Normalize" for m in st_model),
+        "max_seq_length": int(st_model.max_seq_length),
+        "dim": int(st_model.get_sentence_embedding_dimension()),
+    }
+
+    dummy = dict(st_model.tokenizer(["warm-up"], return_tensors="pt"))
+    input_names = list(dummy)
+    axes = {name: {0: "batch", 1: "seq"} for name in input_names + ["last_hidden_state"]}
+    fp32_path = os.path.join(path, "model.onnx")
+    with torch.no_grad():
+        torch.onnx.export(transformer, (dummy,), fp32_path, input_names=input_names,
+                          output_names=["last_hidden_state"], dynamic_axes=axes, opset_version=OPSET)
+    quantize_dynamic(fp32_path, os.path.join(path, MODEL_FILE), weight_type=QuantType.QInt8)
+    os.remove(fp32_path)  # fp32-граф нужен только для квантизации
+    st_model.tokenizer.save_pretrained(path)
+    _save_meta(path, meta)
+    print(f"[RAG] ONNX int8 готов за {time.perf_counter() - start:.0f} с")
+
+    meta["parity"] = check_parity(model_name, cache_dir, texts, reference=st_model)
+    return meta
+
+
+def check_parity(model_name: str, cache_dir: str = ONNX_CACHE_DIR, texts: Optional[List[str]] = None,
+                 reference=None) -> Dict:
+    """Сверка int8 ONNX с torch-бэкендом по косинусам; ok — min_cos >= PARITY_MIN_COS (пишется в meta.json)"""
+    texts = texts or PARITY_TEXTS
+    if reference is None:
+        from sentence_transformers import SentenceTransformer
+        reference = SentenceTransformer(model_name, device="cpu")
+    encoder = OnnxEncoder(export_dir(model_name, cache_dir))
+
+    start = time.perf_counter()
+    torch_vecs = np.asarray(reference.encode(texts, batch_size=32, show_progress_bar=False,
+                                             convert_to_numpy=True), dtype="float32")
+    torch_sec = time.perf_counter() - start
+    start = time.perf_counter()
+    onnx_vecs = encoder.encode(texts, batch_size=32)
+    onnx_sec = time.perf_counter() - start
+
+    parity = compare(torch_vecs, onnx_vecs)
+    parity.update(texts=len(texts), ok=parity["min_cos"] >= PARITY_MIN_COS,
+                  speedup=torch_sec / max(onnx_sec, 1e-9))
+    print(f"[RAG] Сверка ONNX int8 с torch на {len(texts)} текстах: косинус min {parity['min_cos']:.4f}, "
+          f"mean {parity['mean_cos']:.4f}, расхождение скоров {parity['max_score_diff']:.4f}, "
+          f"быстрее в {parity['speedup']:.1f} раза — {'OK' if parity['ok'] else 'НЕ ПРОЙДЕНА'}")
+    encoder.meta["parity"] = parity
+    _save_meta(export_dir(model_name, cache_dir), encoder.meta)
+    return parity
+
+
+def load_or_export(model_name: str, cache_dir: str = ONNX_CACHE_DIR, threads: Optional[int] = None) -> OnnxEncoder:
+    """OnnxEncoder из кэша экспорта (при первом вызове — экспорт); при проваленной сверке — OnnxBackendError"""
+    path = export_dir(model_name, cache_dir)
+    if os.path.exists(os.path.join(path, "meta.json")) and os.path.exists(os.path.join(path, MODEL_FILE)):
+        meta = _load_meta(path)
+    else:
+        meta = export(model_name, cache_dir)
+    parity = meta.get("parity", {})
+    if not parity.get("ok", False):
+        raise OnnxBackendError(f"ONNX int8 для {model_name} не прошёл сверку с torch "
+                               f"(min_cos={parity.get('min_cos')}); перезапустите экспорт или используйте torch")
+    return OnnxEncoder(path, threads)
+
+
+def main():
+    from rag.embedder import MODEL_NAME
+
+    parser = argparse.ArgumentParser(description="Экспорт эмбеддера в ONNX int8 и сверка с torch")
+    parser.add_argument("--model", default=MODEL_NAME)
+    parser.add_argument("--cache-dir", default=ONNX_CACHE_DIR)
+    parser.add_argument("--export", action="store_true", help="(пере)экспортировать модель")
+    parser.add_argument("--check", action="store_true", help="сверить с torch")
+    parser.add_argument("--store", help="сверять на текстах чанков этого стора")
+    parser.add_argument("--limit", type=int, default=256)
+    args = parser.parse_args()
+
+    texts = None
+    if args.store:
+        from rag.index_store import IndexStore
+        _, chunks = IndexStore(args.store).load()
+        texts = [text for _, text in chunks.texts()[:args.limit]]
+    if args.export:
+        export(args.model, args.cache_dir, texts)
+    if args.check or not args.export:
+        check_parity(args.model, args.cache_dir, texts)
+
+
+if __name__ == "__main__":
+    main()
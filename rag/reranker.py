@@ -0,0 +1,129 @@
+# rag/reranker.py
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from utils.model_cache import model_cache
+from rag.embedding_cache import text_key
+
+RERANK_MODEL_NAME = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1"  # многоязычный, ru/eng
+RERANK_BATCH_SIZE = 16
+RERANK_BUDGET_MS = 300.0
+SCORE_CACHE_SIZE = 50_000
+
+
+class CrossEncoderScorer:
+    """Cross-encoder из общего кэша моделей: скор релевантности пары (запрос, текст)"""
+
+    def __init__(self, model_name: str = RERANK_MODEL_NAME, device: Optional[str] = None):
+        self.model_name = model_name
+        self.device = device
+
+    @property
+    def model(self):
+        def load():
+            from sentence_transformers import CrossEncoder
+            print(f"[RAG] Загружаю cross-encoder: {self.model_name}")
+            return CrossEncoder(self.model_name, device=self.device)
+        return model_cache.get_or_load(f"reranker:{self.model_name}:{self.device or 'auto'}",
+                                       load, device=self.device)
+
+    def score(self, pairs: List[Tuple[str, str]], batch_size: int = RERANK_BATCH_SIZE) -> np.ndarray:
+        scores = self.model.predict(pairs, batch_size=batch_size, show_progress_bar=False,
+                                    convert_to_numpy=True)
+        return np.asarray(scores, dtype="float32").reshape(len(pairs))
+
+    def warm_up(self) -> None:
+        self.score([("warm-up", "warm-up")])
+
+
+class Reranker:
+    """
+    Переранжирование кандидатов поиска cross-encoder'ом.
+    Скоры кэшируются по (хэш запроса, хэш текста чанка) — ID чанков меняются при
+    уплотнении стора, текст нет. Пары скорятся батчами по batch_size; если бюджет
+    budget_ms исчерпан раньше, чем посчитаны все кандидаты запроса, для этого
+    запроса остаётся исходный порядок поиска.
+    """
+
+    def __init__(self, scorer, batch_size: int = RERANK_BATCH_SIZE,
+                 budget_ms: Optional[float] = RERANK_BUDGET_MS, cache_size: int = SCORE_CACHE_SIZE):
+        self.scorer = scorer
+        self.batch_size = batch_size
+        self.budget_ms = budget_ms
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[Tuple[bytes, bytes], float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.fallbacks = 0
+
+    def warm_up(self) -> None:
+        self.scorer.warm_up()
+
+    def _cached(self, key: Tuple[bytes, bytes]) -> Optional[float]:
+        with self._lock:
+            score = self._cache.get(key)
+            if score is not None:
+                self._cache.move_to_end(key)
+            return score
+
+    def _store(self, keys: List[Tuple[bytes, bytes]], scores: np.ndarray):
+        with self._lock:
+            for key, score in zip(keys, scores.tolist()):
+                self._cache[key] = score
+                self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def rerank_batch(self, queries: List[str], candidates: List[List[Dict]], top_k: int) -> List[List[Dict]]:
+        """
+        candidates — выдача поиска на каждый запрос (хиты с "text").
+        Возвращает top_k на запрос по убыванию "rerank_score" (или исходный порядок при фолбэке).
+        """
+        deadline = time.perf_counter() + self.budget_ms / 1000 if self.budget_ms else None
+        keys = [[(text_key(q), text_key(h["text"])) for h in hits] for q, hits in zip(queries, candidates)]
+        scores: Dict[Tuple[bytes, bytes], float] = {}
+        pending: Dict[Tuple[bytes, bytes], Tuple[str, str]] = {}
+        for q, hits, hit_keys in zip(queries, candidates, keys):
+            for h, key in zip(hits, hit_keys):
+                cached = self._cached(key)
+                if cached is not None:
+                    scores[key] = cached
+                elif key not in pending:
+                    pending[key] = (q, h["text"])
+        self.hits += len(scores)
+        self.misses += len(pending)
+
+        # Пары идут по запросам: при нехватке бюджета целиком досчитаны первые запросы
+        pending_keys = list(pending)
+        for start in range(0, len(pending_keys), self.batch_size):
+            if start and deadline is not None and time.perf_counter() > deadline:
+                break
+            batch = pending_keys[start:start + self.batch_size]
+            batch_scores = self.scorer.score([pending[k] for k in batch], batch_size=self.batch_size)
+            self._store(batch, batch_scores)
+            scores.update(zip(batch, batch_scores.tolist()))
+
+        results, fallbacks = [], 0
+        for hits, hit_keys in zip(candidates, keys):
+            if all(k in scores for k in hit_keys):
+                ranked = [{**h, "rerank_score": scores[k]} for h, k in zip(hits, hit_keys)]
+                ranked.sort(key=lambda h: -h["rerank_score"])
+                results.append(ranked[:top_k])
+            else:
+                fallbacks += 1
+                results.append(hits[:top_k])
+        if fallbacks:
+            self.fallbacks += fallbacks
+            print(f"[RAG] Реранкер не уложился в {self.budget_ms:.0f} мс — исходный порядок "
+                  f"для {fallbacks} из {len(queries)} запросов")
+        return results
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {"cached": len(self._cache), "hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0, "fallbacks": self.fallbacks}
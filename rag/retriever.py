@@ -0,0 +1,136 @@
+# rag/retriever.py
+import json
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+import numpy as np
+
+from . import ann
+from .index_store import IndexStore
+from .search import HYBRID_BUDGET_MS, SIM_THRESHOLD, hybrid_search_batch, search_batch
+
+SEARCH_MODES = ("dense", "hybrid")
+
+
+def check_embedder(store_dir: str, manifest: Optional[Dict], embedder) -> None:
+    """
+    Эмбеддер запросов должен совпадать с тем, которым собран стор (manifest settings.model):
+    другая модель — ошибка, другой бэкенд (torch / int8-ONNX) — предупреждение, векторы близки, но не равны.
+    """
+    built = ((manifest or {}).get("settings") or {}).get("model")
+    model_id = getattr(embedder, "model_id", None)
+    if built is None or model_id is None or built == model_id:
+        return
+    if built.split("@")[0] != model_id.split("@")[0]:
+        raise RuntimeError(f"[RAG] Стор {store_dir} собран моделью {built}, а запросы считает {model_id}. "
+                           f"Пересоберите индекс или смените rag_model_name.")
+    print(f"[RAG] Внимание: стор {store_dir} собран как {built}, а запросы считает {model_id} — "
+          f"соберите стор тем же бэкендом (--backend) или смените rag_embed_backend.")
+
+
+class Retriever:
+    """
+    Загруженный стор (индекс, чанки, полные векторы, BM25) + эмбеддер.
+    Батч запросов — один вызов Embedder.encode_queries (с кэшем повторов) и один поиск FAISS.
+    mode: "hybrid" (dense + BM25 через RRF, для текстовых запросов) или "dense".
+    reranker — rag.reranker.Reranker: берём rerank_candidates кандидатов и
+    переранжируем их cross-encoder'ом до top_k (только для текстовых запросов).
+    """
+
+    def __init__(self, store_dir: str, embedder, top_k: int = 5, threshold: float = SIM_THRESHOLD,
+                 nprobe: Optional[int] = ann.DEFAULT_NPROBE, ef_search: Optional[int] = ann.DEFAULT_EF_SEARCH,
+                 mode: str = "hybrid", budget_ms: Optional[float] = HYBRID_BUDGET_MS,
+                 reranker=None, rerank_candidates: int = 20):
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode: {mode} (expected one of {SEARCH_MODES})")
+        store = IndexStore(store_dir)
+        self.index, self.chunks = store.load()
+        check_embedder(store_dir, store.load_manifest(), embedder)
+        self.vectors = store.open_vectors()
+        self.lexical = store.open_lexical() if mode == "hybrid" else None
+        if mode == "hybrid" and self.lexical is None:
+            print(f"[RAG] В {store_dir} нет BM25-индекса — только dense-поиск. Пересоберите индекс.")
+        self.mode = mode
+        self.budget_ms = budget_ms
+        self.embedder = embedder
+        self.top_k = top_k
+        self.threshold = threshold
+        self.nprobe = nprobe
+        self.ef_search = ef_search
+        self.reranker = reranker
+        self.rerank_candidates = rerank_candidates
+
+    def search(self, queries: Union[Sequence[str], np.ndarray], top_k: Optional[int] = None,
+               filters: Optional[Dict[str, Any]] = None) -> List[List[Dict]]:
+        """queries — тексты или векторы (N, d); на каждый запрос список хитов"""
+        if len(queries) == 0:
+            return []
+        top_k = top_k or self.top_k
+        if isinstance(queries, np.ndarray):
+            return search_batch(self.index, self.chunks, queries.reshape(len(queries), -1), top_k=top_k,
+                                threshold=self.threshold, nprobe=self.nprobe, ef_search=self.ef_search,
+                                vectors=self.vectors, filters=filters)
+
+        queries = list(queries)
+        depth = max(top_k, self.rerank_candidates) if self.reranker is not None else top_k
+        vecs = self.embedder.encode_queries(queries)
+        if self.lexical is not None:
+            hits = hybrid_search_batch(self.index, self.chunks, self.lexical, queries, vecs,
+                                       top_k=depth, threshold=self.threshold,
+                                       nprobe=self.nprobe, ef_search=self.ef_search,
+                                       vectors=self.vectors, filters=filters, budget_ms=self.budget_ms)
+        else:
+            hits = search_batch(self.index, self.chunks, vecs, top_k=depth,
+                                threshold=self.threshold, nprobe=self.nprobe, ef_search=self.ef_search,
+                                vectors=self.vectors, filters=filters)
+        if self.reranker is not None:
+            hits = self.reranker.rerank_batch(queries, hits, top_k)
+        return hits
+
+
+class QueryBatcher:
+    """
+    Склеивает одновременные одиночные запросы (потоки API-сервера) в батчи
+    для Retriever.search: ждём до max_wait секунд или max_batch запросов.
+    """
+
+    def __init__(self, retriever: Retriever, max_batch: int = 32, max_wait: float = 0.005):
+        self.retriever = retriever
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue: "queue.Queue" = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name="rag-batcher", daemon=True)
+        self._worker.start()
+
+    def search(self, query: str, top_k: Optional[int] = None,
+               filters: Optional[Dict[str, Any]] = None) -> List[Dict]:
+        future: Future = Future()
+        self._queue.put((query, top_k, filters, future))
+        return future.result()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            try:
+                while len(batch) < self.max_batch:
+                    batch.append(self._queue.get(timeout=self.max_wait))
+            except queue.Empty:
+                pass
+
+            # В один поиск — запросы с одинаковыми top_k и фильтрами
+            groups: Dict[str, List] = {}
+            for item in batch:
+                key = json.dumps([item[1], item[2]], sort_keys=True, ensure_ascii=False, default=str)
+                groups.setdefault(key, []).append(item)
+            for items in groups.values():
+                try:
+                    results = self.retriever.search([q for q, _, _, _ in items],
+                                                    top_k=items[0][1], filters=items[0][2])
+                except Exception as e:
+                    for *_, future in items:
+                        future.set_exception(e)
+                    continue
+                for (*_, future), hits in zip(items, results):
+                    future.set_result(hits)
@@ -1,31 +1,192 @@
 import numpy as np
-from typing import List, Dict, Tuple
+import time
+from typing import Any, List, Dict, Optional, Tuple
 from .utils import l2_normalize
+from . import ann
+from .chunk_store import ChunkStore
+from .lexical import LexicalIndex
 
 SIM_THRESHOLD = 0.32  # можно подстроить
+QUANTIZATION_SLACK = 0.05  # максимальная ошибка скора SQ8/fp16 относительно float32
+RRF_K = 60  # reciprocal-rank fusion: 1 / (RRF_K + rank)
+HYBRID_CANDIDATES = 20  # кандидатов от каждого ретривера на запрос
+HYBRID_BUDGET_MS = 50.0  # бюджет BM25 на батч
+PREFILTER_EXACT_MAX = 20_000  # фильтр оставил не больше стольких чанков — точный перебор вместо ANN
+EXACT_BLOCK = 4096  # строк vectors.f32 на одно матричное умножение
+
+def search_batch(
+    index,
+    chunks: ChunkStore,
+    query_vecs: np.ndarray,
+    top_k: int = 5,
+    threshold: float = SIM_THRESHOLD,
+    nprobe: Optional[int] = ann.DEFAULT_NPROBE,
+    ef_search: Optional[int] = ann.DEFAULT_EF_SEARCH,
+    vectors: Optional[np.ndarray] = None,
+    rerank_factor: int = ann.RERANK_FACTOR,
+    filters: Optional[Dict[str, Any]] = None
+) -> List[List[Dict]]:
+    """
+    Поиск N запросов одним вызовом FAISS.
+    query_vecs: (N, d) float32 (не нормализованы) -> нормализуем перед поиском
+    chunks: ChunkStore из IndexStore.load() (тексты читаются только для найденных ID)
+    nprobe — число просматриваемых IVF-списков, ef_search — ширина поиска HNSW
+    (больше — выше recall, медленнее); для flat не используются.
+    vectors — полные float32-векторы (IndexStore.open_vectors()): из квантованного
+    индекса берём top_k * rerank_factor кандидатов и пересчитываем их скоры точно.
+    filters — {поле мета: значение, список значений или диапазон {"gte": ...}} (см. ChunkStore.mask).
+    Фильтр применяется до оценки: узкий (до PREFILTER_EXACT_MAX чанков) — точный перебор
+    только разрешённых векторов из vectors, широкий — поиск FAISS с IDSelector.
+    Результат: на каждый запрос [{"score", "text", "meta": {doc_id, chunk_id, ...}}].
+    """
+    return _with_texts(chunks, _dense_batch(index, chunks, query_vecs, top_k, threshold, nprobe,
+                                            ef_search, vectors, rerank_factor, filters))
+
+def _dense_batch(index, chunks: ChunkStore, query_vecs: np.ndarray, top_k: int, threshold: float,
+                 nprobe: Optional[int], ef_search: Optional[int], vectors: Optional[np.ndarray],
+                 rerank_factor: int, filters: Optional[Dict[str, Any]]) -> List[List[Tuple[float, int]]]:
+    """Dense-поиск без чтения текстов: [(score, id)] на запрос"""
+    q = l2_normalize(query_vecs)  # (N, d)
+    # Порог, удалённые чанки (строки нет) и фильтры — одна маска по ID
+    allowed = chunks.mask(filters)
+    params = keepalive = None
+    if filters:
+        allowed_ids = np.flatnonzero(allowed)
+        if vectors is not None and len(allowed_ids) <= PREFILTER_EXACT_MAX:
+            return _exact_batch(q, allowed_ids, vectors, top_k, threshold)
+        params, keepalive = ann.search_params(index, allowed, nprobe=nprobe, ef_search=ef_search)
+    else:
+        ann.set_search_params(index, nprobe=nprobe, ef_search=ef_search)
+
+    found: List[List] = [[] for _ in range(len(q))]
+    pending = np.arange(len(q))
+    k = min(top_k * (rerank_factor if vectors is not None else 1), index.ntotal)
+    # Скоры квантованного индекса приближённые — порог для остановки с запасом
+    slack = QUANTIZATION_SLACK if vectors is not None else 0.0
+    while len(pending) and k > 0:
+        D, I = index.search(q[pending], k, params=params)  # D (n, k), I (n, k)
+        if vectors is not None:
+            scores, ids = ann.rerank(q[pending], I, vectors)
+        else:
+            scores, ids = D, I
+        keep = (ids >= 0) & (ids < len(allowed)) & (scores >= threshold)
+        keep[keep] = allowed[ids[keep]]
+
+        # Мягко удалённые (HNSW) кандидаты занимают места в выдаче — недобравшим запросам удваиваем k
+        exhausted = (I[:, -1] == -1) | (D[:, -1] < threshold - slack) | (k >= index.ntotal)
+        done = (keep.sum(axis=1) >= top_k) | exhausted
+        for row in np.nonzero(done)[0]:
+            cols = np.nonzero(keep[row])[0][:top_k]
+            found[pending[row]] = list(zip(scores[row, cols].tolist(), ids[row, cols].tolist()))
+        pending = pending[~done]
+        k = min(2 * k, index.ntotal)
+    del keepalive
+    return found
+
+def _exact_batch(q: np.ndarray, ids: np.ndarray, vectors: np.ndarray, top_k: int,
+                 threshold: float) -> List[List[Tuple[float, int]]]:
+    """Точный поиск по подмножеству ID (после предфильтра): [(score, id)] на запрос"""
+    if not len(ids) or top_k <= 0:
+        return [[] for _ in range(len(q))]
+    part_scores, part_ids = [], []
+    for start in range(0, len(ids), EXACT_BLOCK):
+        block = ids[start:start + EXACT_BLOCK]
+        scores = q @ np.asarray(vectors[block]).T  # (N, len(block))
+        k = min(top_k, len(block))
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        part_scores.append(np.take_along_axis(scores, top, axis=1))
+        part_ids.append(block[top])
+    scores, found_ids = np.concatenate(part_scores, axis=1), np.concatenate(part_ids, axis=1)
+    order = np.argsort(-scores, axis=1, kind="stable")[:, :top_k]
+    scores, found_ids = np.take_along_axis(scores, order, axis=1), np.take_along_axis(found_ids, order, axis=1)
+    return [[(s, i) for s, i in zip(row_s.tolist(), row_i.tolist()) if s >= threshold]
+            for row_s, row_i in zip(scores, found_ids)]
+
+def _with_texts(chunks: ChunkStore, found: List[List[Tuple[float, int]]]) -> List[List[Dict]]:
+    rows = chunks.get_many({i for hits in found for _, i in hits})
+    return [[{"score": score, "text": rows[i]["text"], "meta": rows[i]["meta"]}
+             for score, i in hits if i in rows]
+            for hits in found]
+
+def rrf_fuse(rankings: List[List[int]], top_k: int, rrf_k: int = RRF_K) -> List[Tuple[float, int]]:
+    """Reciprocal-rank fusion: [(score, id)] по убыванию суммы 1 / (rrf_k + rank)"""
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, i in enumerate(ranking, start=1):
+            fused[i] = fused.get(i, 0.0) + 1.0 / (rrf_k + rank)
+    return sorted(((score, i) for i, score in fused.items()), key=lambda x: -x[0])[:top_k]
+
+def hybrid_search_batch(
+    index,
+    chunks: ChunkStore,
+    lexical: LexicalIndex,
+    query_texts: List[str],
+    query_vecs: np.ndarray,
+    top_k: int = 5,
+    threshold: float = SIM_THRESHOLD,
+    nprobe: Optional[int] = ann.DEFAULT_NPROBE,
+    ef_search: Optional[int] = ann.DEFAULT_EF_SEARCH,
+    vectors: Optional[np.ndarray] = None,
+    filters: Optional[Dict[str, Any]] = None,
+    candidates: int = HYBRID_CANDIDATES,
+    rrf_k: int = RRF_K,
+    budget_ms: Optional[float] = HYBRID_BUDGET_MS
+) -> List[List[Dict]]:
+    """
+    Гибридный поиск: dense (FAISS, с порогом threshold) и BM25 по candidates кандидатов
+    на запрос, слияние рангов через RRF. Точные имена, номера задач и даты находит BM25,
+    перефразировки — dense. BM25 укладывается в budget_ms (см. LexicalIndex.search_batch).
+    Результат: [{"score" (RRF), "text", "meta", "scores": {"dense", "bm25"}}] на запрос.
+    """
+    depth = max(top_k, candidates)
+    dense = _dense_batch(index, chunks, query_vecs, depth, threshold, nprobe, ef_search,
+                         vectors, ann.RERANK_FACTOR, filters)
+    start = time.perf_counter()
+    lexical_hits = lexical.search_batch(query_texts, chunks.mask(filters), chunks.mask(), depth, budget_ms)
+    lexical_ms = (time.perf_counter() - start) * 1000
+    if budget_ms is not None and lexical_ms > 2 * budget_ms:
+        print(f"[RAG] BM25 занял {lexical_ms:.0f} мс при бюджете {budget_ms:.0f} мс")
+
+    fused = [rrf_fuse([[i for _, i in d], [i for _, i in l]], top_k, rrf_k)
+             for d, l in zip(dense, lexical_hits)]
+    rows = chunks.get_many({i for hits in fused for _, i in hits})
+    results = []
+    for hits, d, l in zip(fused, dense, lexical_hits):
+        dense_scores, bm25_scores = {i: s for s, i in d}, {i: s for s, i in l}
+        results.append([{"score": score, "text": rows[i]["text"], "meta": rows[i]["meta"],
+                         "scores": {"dense": dense_scores.get(i), "bm25": bm25_scores.get(i)}}
+                        for score, i in hits if i in rows])
+    return results
 
 def search(
     index,
-    metas: List[Dict],
+    chunks: ChunkStore,
     query_vec: np.ndarray,
     top_k: int = 5,
-    threshold: float = SIM_THRESHOLD
+    threshold: float = SIM_THRESHOLD,
+    nprobe: Optional[int] = ann.DEFAULT_NPROBE,
+    ef_search: Optional[int] = ann.DEFAULT_EF_SEARCH,
+    vectors: Optional[np.ndarray] = None,
+    rerank_factor: int = ann.RERANK_FACTOR,
+    filters: Optional[Dict[str, Any]] = None
 ) -> List[Dict]:
     """
-    query_vec: (1, d) float32 (не нормализован) -> нормализуем перед поиском
+    Один запрос: query_vec (1, d) -> [{"score", "text", "meta"}] (см. search_batch)
     """
-    q = l2_normalize(query_vec)  # (1, d)
-    D, I = index.search(q, top_k)  # D (1, k), I (1, k)
+    return search_batch(index, chunks, query_vec, top_k=top_k, threshold=threshold,
+                        nprobe=nprobe, ef_search=ef_search, vectors=vectors,
+                        rerank_factor=rerank_factor, filters=filters)[0]
 
-    results = []
-    for score, idx in zip(D[0].tolist(), I[0].tolist()):
-        if idx == -1:
-            continue
-        if score < threshold:
-            continue
-        meta = metas[idx]
-        results.append({
-            "score": float(score),
-            "meta": meta
-        })
-    return results
+def format_context(hits: List[Dict], kind: str = "summary") -> str:
+    """
+    Найденные чанки с источниками — контекст для get_rag_answer_prompt.
+    Метка — коллекция хита (source: summary/transcript); kind — для сторов без неё.
+    """
+    blocks = []
+    for h in hits:
+        meta = h["meta"]
+        source = meta.get("path", "")
+        label = meta.get("source") or meta.get("type", kind)
+        blocks.append(f"[{label}:{meta.get('doc_id')}#chunk{meta.get('chunk_id')}] "
+                      f"score={h['score']:.2f} | {source}\n{h['text'].strip()}")
+    return "\n\n".join(blocks) if blocks else "ничего не найдено"
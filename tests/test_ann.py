@@ -0,0 +1,33 @@
+# tests/test_ann.py
+import numpy as np
+import pytest
+
+from rag import ann
+from rag.utils import l2_normalize
+
+
+def _vectors(n: int, dim: int = 16) -> np.ndarray:
+    rng = np.random.default_rng(0)
+    return l2_normalize(rng.standard_normal((n, dim)).astype("float32"))
+
+
+def test_bitmap_selector_rejects_ids_past_mask():
+    """ID за концом маски (например, мягко удалённые хвостовые ID HNSW) не проходят фильтр"""
+    allowed = np.ones(10, dtype=bool)
+    params, keepalive = ann.search_params(ann.build_index("flat", _vectors(1), np.arange(1)), allowed)
+    selector = keepalive[1]
+    assert all(selector.is_member(i) for i in range(10))
+    assert not any(selector.is_member(i) for i in range(10, 256))
+
+
+@pytest.mark.parametrize("kind", ["flat", "hnsw"])
+def test_filtered_search_ignores_ids_past_mask(kind):
+    vecs = _vectors(200)
+    index = ann.build_index(kind, vecs, np.arange(len(vecs), dtype="int64"))
+    allowed = np.zeros(100, dtype=bool)  # маска короче корпуса: ID 100..199 не разрешены
+    allowed[::3] = True
+    params, keepalive = ann.search_params(index, allowed)
+    _, ids = index.search(vecs[150:160], 20, params=params)
+    found = ids[ids >= 0]
+    assert len(found)
+    assert (found < len(allowed)).all() and allowed[found].all()
@@ -0,0 +1,94 @@
+"""
+Бенчмарки ASR:
+- режим длинных файлов: real-time factor в зависимости от числа процессов;
+- VAD: время декодирования всей записи против только участков речи.
+
+    python -m transcriber.benchmark audio/meetings/meeting_....wav --workers 1,2,4
+    python -m transcriber.benchmark audio/meetings/meeting_....wav --vad
+"""
+import argparse
+import time
+
+from faster_whisper import WhisperModel, decode_audio
+
+from utils.audio_capture import WHISPER_SAMPLE_RATE
+from utils.config import get_config
+from utils.vad import trim_silence
+from transcriber.whisper_optimized import OptimizedWhisperTranscriber
+
+
+def bench_vad(audio_path: str, config: dict) -> None:
+    """Сколько времени экономит декодирование только речи"""
+    audio = decode_audio(audio_path, sampling_rate=WHISPER_SAMPLE_RATE)
+    duration = len(audio) / WHISPER_SAMPLE_RATE
+    model = WhisperModel(config["asr_model_size"], device=config["asr_device"],
+                         compute_type=config["asr_compute_type"])
+
+    t0 = time.perf_counter()
+    segments, _ = model.transcribe(audio, language=config["asr_language"], task="transcribe")
+    n_full = len(list(segments))
+    full = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    speech, tmap = trim_silence(audio, WHISPER_SAMPLE_RATE)
+    vad_time = time.perf_counter() - t0
+    segments, _ = model.transcribe(speech, language=config["asr_language"], task="transcribe")
+    n_vad = len(list(segments))
+    gated = time.perf_counter() - t0
+
+    speech_sec = len(speech) / WHISPER_SAMPLE_RATE
+    print(f"[Bench] audio={duration:.1f}s  speech={speech_sec:.1f}s ({100 * speech_sec / duration:.0f}%)  "
+          f"spans={len(tmap.spans)}")
+    print(f"[Bench] full decode: {full:7.1f}s  RTF={full / duration:.3f}  segments={n_full}")
+    print(f"[Bench] VAD + decode:{gated:7.1f}s  RTF={gated / duration:.3f}  segments={n_vad}  "
+          f"(VAD {vad_time:.2f}s)")
+    print(f"[Bench] saved: {full - gated:.1f}s ({100 * (full - gated) / full:.0f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="RTF parallel long-file ASR vs worker count")
+    parser.add_argument("audio_path")
+    parser.add_argument("--workers", default="1,2,4", help="список числа процессов через запятую")
+    parser.add_argument("--model", default=None, help="размер модели (по умолчанию из конфигурации)")
+    parser.add_argument("--chunk-sec", type=float, default=None)
+    parser.add_argument("--vad", action="store_true", help="сравнить декодирование с VAD и без")
+    args = parser.parse_args()
+
+    config = get_config()
+    if args.model:
+        config["asr_model_size"] = args.model
+    if args.chunk_sec:
+        config["asr_chunk_sec"] = args.chunk_sec
+
+    if args.vad:
+        bench_vad(args.audio_path, config)
+        return
+
+    config["asr_device"] = "cpu"
+
+    duration = len(decode_audio(args.audio_path, sampling_rate=WHISPER_SAMPLE_RATE)) / WHISPER_SAMPLE_RATE
+    print(f"[Bench] {args.audio_path}: {duration:.1f}s, model={config['asr_model_size']}")
+
+    # Базовая линия: один поток декодирования всего файла
+    t0 = time.perf_counter()
+    model = WhisperModel(config["asr_model_size"], device="cpu", compute_type="int8")
+    load = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    segments, _ = model.transcribe(args.audio_path, language=config["asr_language"], task="transcribe")
+    n_segments = len(list(segments))
+    elapsed = time.perf_counter() - t0
+    del model
+    print(f"[Bench] single-stream: {elapsed:7.1f}s  RTF={elapsed / duration:.3f}  "
+          f"segments={n_segments}  (load {load:.1f}s excluded)")
+
+    transcriber = OptimizedWhisperTranscriber(config)
+    for workers in [int(w) for w in args.workers.split(",") if w.strip()]:
+        t0 = time.perf_counter()
+        _, segments = transcriber.transcribe_long(args.audio_path, workers=workers)
+        elapsed = time.perf_counter() - t0
+        print(f"[Bench] workers={workers:<3d}   {elapsed:7.1f}s  RTF={elapsed / duration:.3f}  "
+              f"segments={len(segments)}  (incl. model load per worker)")
+
+
+if __name__ == "__main__":
+    main()
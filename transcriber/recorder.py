@@ -4,6 +4,9 @@ import sys
 import threading
 import time
 from datetime import datetime
+from pathlib import Path
+
+from utils.audio_capture import AudioClip, CaptureEngine, ParecSource
 
 def ensure_virtual_cable_and_loopback():
     # 1. Проверяем VirtualCable
@@ -93,73 +96,64 @@ class Recorder:
         self.monitor_name = monitor_name
         self.samplerate = samplerate
         self.channels = channels
-        self.main_proc = None
-        self.main_sox = None
+        self.main_capture = None
         self.main_filename = None
-        self.question_proc = None
-        self.question_sox = None
+        self.question_capture = None
         self.question_filename = None
+        self.question_start = None  # позиция захвата встречи, с которой начался вопрос
 
         os.makedirs(AUDIO_DIR, exist_ok=True)
         print(f"[Recorder] monitor={monitor_name}, samplerate={samplerate}, channels={channels}")
 
     def _start_parec_recording(self, filename, duration_sec=None):
-        parec_cmd = [
-            "parec", "-d", self.monitor_name,
-            f"--rate={self.samplerate}",
-            "--format=s16le",
-            f"--channels={self.channels}",
-            "--latency-msec=1"
-        ]
-        sox_cmd = [
-            "sox", "-t", "raw", f"-r{self.samplerate}",
-            "-e", "signed-integer", "-b", "16",
-            f"-c{self.channels}", "-", filename
-        ]
-        parec_proc = subprocess.Popen(parec_cmd, stdout=subprocess.PIPE)
-        sox_proc = subprocess.Popen(sox_cmd, stdin=parec_proc.stdout)
+        # Один parec -> кольцевой буфер в процессе -> WAV крупными блоками (без sox)
+        source = ParecSource(self.samplerate, self.channels, device=self.monitor_name)
+        capture = CaptureEngine(source, filename=filename).start()
 
         if duration_sec is not None:
             def stop_after_delay():
                 time.sleep(duration_sec)
                 try:
-                    parec_proc.terminate()
-                    sox_proc.terminate()
+                    capture.stop()
                 except Exception as e:
-                    print("[Recorder] Ошибка при остановке процесса:", e)
+                    print("[Recorder] Ошибка при остановке записи:", e)
             threading.Thread(target=stop_after_delay, daemon=True).start()
 
-        return parec_proc, sox_proc
+        return capture
 
     def start_main_recording(self):
         filename = _generate_filename("meeting")
         print(f"[Recorder] ▶️ Запись встречи: {filename}")
-        self.main_proc, self.main_sox = self._start_parec_recording(filename)
+        self.main_capture = self._start_parec_recording(filename)
         self.main_filename = filename
 
     def stop_main_recording(self):
         print("[Recorder] ⏹ Останавливаю основную запись...")
-        if self.main_proc:
-            self.main_proc.terminate()
-        if self.main_sox:
-            self.main_sox.terminate()
-            self.main_sox.wait()
+        if self.main_capture:
+            self.main_capture.stop()
         print(f"[Recorder] ✅ Основная запись завершена, файл сохранён: {self.main_filename}")
         return self.main_filename
 
     def start_question_recording(self):
         filename = _generate_filename("question")
         print(f"[Recorder] 🔴 Запись вопроса: {filename}")
-        self.question_proc, self.question_sox = self._start_parec_recording(filename)
         self.question_filename = filename
+        if self.main_capture is not None and self.main_capture.is_running:
+            # Вопрос — фрагмент идущей записи встречи по смещениям, без второго parec на тот же монитор
+            self.question_start = self.main_capture.position
+        else:
+            self.question_capture = self._start_parec_recording(filename)
 
     def stop_question_recording(self):
         print("[Recorder] 🔵 Останавливаю запись вопроса...")
-        if self.question_proc:
-            self.question_proc.terminate()
-        if self.question_sox:
-            self.question_sox.terminate()
-            self.question_sox.wait()
+        if self.question_start is not None:
+            clip = AudioClip(capture=self.main_capture, start=self.question_start,
+                             end=self.main_capture.position, name=Path(self.question_filename).stem)
+            self.question_start = None
+            clip.save(self.question_filename)
+        elif self.question_capture:
+            self.question_capture.stop()
+            self.question_capture = None
         print(f"[Recorder] ✅ Запись вопроса завершена, файл сохранён: {self.question_filename}")
         return self.question_filename
 
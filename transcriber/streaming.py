@@ -0,0 +1,194 @@
+"""
+Инкрементальная транскрипция встречи во время записи
+"""
+import logging
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from utils.audio_capture import AudioCaptureError, CaptureEngine, WHISPER_SAMPLE_RATE, resample, to_float32_mono
+from utils.vad import detect_speech
+from transcriber.whisper_optimized import OptimizedWhisperTranscriber, TranscriptionError
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class StreamWord:
+    """Слово с глобальными (от начала записи) временными метками"""
+    start: float
+    end: float
+    text: str
+    probability: float = 1.0
+
+
+def _normalize(word: str) -> str:
+    return re.sub(r"[^\w]", "", word.lower())
+
+
+class IncrementalTranscriber:
+    """
+    Фоновый ASR по растущему захвату встречи перекрывающимися окнами.
+
+    Слова из хвостового перекрытия окна не фиксируются: они декодируются
+    повторно в следующем окне с полным контекстом. На стыке окон дубликаты
+    отсекаются по времени и по совпадению текста. После остановки записи
+    остаётся декодировать только последний хвост.
+    """
+
+    def __init__(self, transcriber: OptimizedWhisperTranscriber, capture: CaptureEngine,
+                 window_sec: float = 30.0, overlap_sec: float = 5.0, poll_sec: float = 1.0):
+        if overlap_sec >= window_sec:
+            raise ValueError("overlap_sec must be smaller than window_sec")
+        self.transcriber = transcriber
+        self.capture = capture
+        # Читаем ASR-поток захвата (16 kHz, если он ведётся), а не архивный
+        self.samplerate = capture.asr_samplerate
+        self._ring = capture.asr_buffer or capture.buffer
+        self.window = int(window_sec * self.samplerate)
+        self.overlap = int(overlap_sec * self.samplerate)
+        self.poll_sec = poll_sec
+
+        self.words: List[StreamWord] = []
+        self.segments: List[Dict[str, Any]] = []  # записи JSONL-транскрипта
+        self.complete = True  # False, если воркер отстал от кольцевого буфера
+        self.windows_decoded = 0
+        self.windows_skipped = 0
+        self._next_start = 0
+        self._committed_until = 0.0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def text(self) -> str:
+        """Текущий накопленный транскрипт"""
+        with self._lock:
+            return " ".join(w.text for w in self.words).strip()
+
+    def start(self) -> "IncrementalTranscriber":
+        self._thread = threading.Thread(target=self._run, name="incremental-asr", daemon=True)
+        self._thread.start()
+        logger.info(f"Incremental ASR started: window={self.window / self.samplerate:.0f}s, "
+                    f"overlap={self.overlap / self.samplerate:.0f}s")
+        return self
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            if self.capture.asr_position - self._next_start >= self.window:
+                try:
+                    self._decode(self._next_start, self._next_start + self.window, final=False)
+                except Exception as e:
+                    logger.error(f"Incremental ASR window failed: {e}")
+                    self._stop.wait(self.poll_sec)
+            else:
+                self._stop.wait(self.poll_sec)
+
+    def _decode(self, start: int, end: int, final: bool) -> None:
+        if start < self._ring.oldest:
+            logger.warning("Incremental ASR fell behind the capture buffer, skipping ahead")
+            self.complete = False
+            start = self._ring.oldest
+
+        audio = resample(to_float32_mono(self.capture.asr_view(start, end)),
+                         self.samplerate, WHISPER_SAMPLE_RATE)
+        offset = start / self.samplerate
+        commit_limit = float("inf") if final else (end - self.overlap) / self.samplerate
+
+        # Окно без речи не декодируем
+        if self.transcriber.vad and not detect_speech(audio, WHISPER_SAMPLE_RATE):
+            self.windows_skipped += 1
+            self._next_start = end if final else end - self.overlap
+            return
+
+        segments, _ = self.transcriber.get_model().transcribe(
+            audio,
+            language=self.transcriber.language,
+            task="transcribe",
+            word_timestamps=True,
+        )
+
+        new_words: List[StreamWord] = []
+        new_segments: List[Dict[str, Any]] = []
+        with self._lock:
+            last = self.words[-1] if self.words else None
+        for segment in segments:
+            seg_words = []
+            for w in segment.words or []:
+                word = StreamWord(offset + w.start, offset + w.end, w.word.strip(), w.probability)
+                if not word.text or word.end > commit_limit:
+                    continue
+                if word.start < self._committed_until - 0.05:
+                    continue
+                # Повтор последнего зафиксированного слова на стыке окон (перекрывается по времени)
+                if not new_words and last is not None and \
+                        _normalize(word.text) == _normalize(last.text) and word.start < last.end:
+                    continue
+                seg_words.append(word)
+                new_words.append(word)
+            if seg_words:
+                new_segments.append(self._segment(segment, seg_words))
+
+        with self._lock:
+            self.words.extend(new_words)
+            self.segments.extend(new_segments)
+            if new_words:
+                self._committed_until = new_words[-1].end
+
+        self.windows_decoded += 1
+        self._next_start = end if final else end - self.overlap
+
+    def _segment(self, segment, words: List[StreamWord]) -> Dict[str, Any]:
+        data = {
+            "start": round(words[0].start, 3),
+            "end": round(words[-1].end, 3),
+            "text": " ".join(w.text for w in words),
+            "avg_logprob": round(segment.avg_logprob, 4),
+        }
+        if self.transcriber.word_timestamps:
+            data["words"] = [
+                {"start": round(w.start, 3), "end": round(w.end, 3),
+                 "word": w.text, "probability": round(w.probability, 4)}
+                for w in words
+            ]
+        return data
+
+    def finish(self, name: Optional[str] = None) -> str:
+        """
+        Остановить воркер, декодировать хвост записи и вернуть полный транскрипт.
+        Захват к этому моменту должен быть остановлен (или позиция — финальной).
+        Транскрипт сохраняется под именем name, только если покрыта вся запись.
+        """
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+        start_time = time.time()
+        end = self.capture.asr_position
+        try:
+            while end - self._next_start > self.window:
+                self._decode(self._next_start, self._next_start + self.window, final=False)
+            if end > self._next_start:
+                self._decode(self._next_start, end, final=True)
+        except AudioCaptureError as e:
+            raise TranscriptionError(f"Capture buffer error: {e}")
+        except Exception as e:
+            raise TranscriptionError(f"Transcription error: {e}")
+
+        text = self.text
+        logger.info(f"Incremental ASR finished: {self.windows_decoded} windows "
+                    f"({self.windows_skipped} silent skipped), "
+                    f"tail decoded in {time.time() - start_time:.2f}s")
+        if name and self.complete:
+            self.transcriber.store_segments(name, self.segments, end / self.samplerate)
+        return text
+
+    def cancel(self) -> None:
+        """Остановить воркер без декодирования хвоста"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
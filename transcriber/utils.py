@@ -12,3 +12,117 @@ def save_transcript(result_aligned, audio_path, transcripts_dir="transcripts"):
     with open(transcript_file, "w", encoding="utf-8") as f:
         json.dump(result_aligned, f, ensure_ascii=False, indent=2)
     print(f"✅ Транскрибация сохранена: {transcript_file}")
+
+
+# =========================
+# Транскрипт в формате JSONL
+# =========================
+# Первая строка — заголовок {"type": "info", ...}, далее по строке на сегмент:
+# {"type": "segment", "start", "end", "text", "avg_logprob", "words"?: [{start, end, word, probability}]}
+
+TRANSCRIPT_EXT = ".jsonl"
+
+
+def segment_to_dict(segment, offset=0.0, with_words=False):
+    """
+    Сегмент faster-whisper (или dict) -> запись транскрипта с глобальными метками времени.
+    """
+    if isinstance(segment, dict):
+        data = dict(segment)
+        data["start"] = round(data["start"] + offset, 3)
+        data["end"] = round(data["end"] + offset, 3)
+        return data
+
+    data = {
+        "start": round(segment.start + offset, 3),
+        "end": round(segment.end + offset, 3),
+        "text": segment.text.strip(),
+        "avg_logprob": round(segment.avg_logprob, 4),
+    }
+    if with_words and segment.words:
+        data["words"] = [
+            {
+                "start": round(w.start + offset, 3),
+                "end": round(w.end + offset, 3),
+                "word": w.word.strip(),
+                "probability": round(w.probability, 4),
+            }
+            for w in segment.words
+        ]
+    return data
+
+
+class TranscriptWriter:
+    """
+    Потоковая запись транскрипта: каждый сегмент пишется сразу, как его отдал декодер.
+    Пишем в <path>.part и переименовываем при закрытии, чтобы читатели не видели
+    недописанный файл.
+    """
+
+    def __init__(self, path, info):
+        self.path = str(path)
+        self.num_segments = 0
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._tmp_path = self.path + ".part"
+        self._f = open(self._tmp_path, "w", encoding="utf-8")
+        self._write({"type": "info", **info})
+
+    def _write(self, record):
+        self._f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def write_segment(self, segment):
+        self._write({"type": "segment", **segment})
+        self._f.flush()
+        self.num_segments += 1
+
+    def close(self):
+        if not self._f.closed:
+            self._f.close()
+            os.replace(self._tmp_path, self.path)
+
+    def abort(self):
+        if not self._f.closed:
+            self._f.close()
+        if os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def write_transcript(path, info, segments):
+    """Записать готовый список сегментов в JSONL-транскрипт"""
+    with TranscriptWriter(path, info) as writer:
+        for seg in segments:
+            writer.write_segment(seg)
+    return str(path)
+
+
+def read_transcript(path):
+    """
+    Прочитать JSONL-транскрипт. Возвращает (info, segments).
+    """
+    info, segments = {}, []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            kind = record.pop("type", "segment")
+            if kind == "info":
+                info = record
+            else:
+                segments.append(record)
+    return info, segments
+
+
+def segments_text(segments):
+    """Полный текст транскрипта из сегментов"""
+    return " ".join(seg["text"].strip() for seg in segments if seg.get("text")).strip()
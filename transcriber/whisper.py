@@ -2,6 +2,8 @@ from faster_whisper import WhisperModel
 import os
 from datetime import datetime
 
+from transcriber.utils import TRANSCRIPT_EXT, TranscriptWriter, segment_to_dict, segments_text
+
 TRANSCRIPTS_DIR = "/home/stanislav/PycharmProjects/MIA/transcripts"
 TRANSCRIPTS_MEET = os.path.join(TRANSCRIPTS_DIR, "meetings")
 TRANSCRIPTS_QUEST = os.path.join(TRANSCRIPTS_DIR, "questions")
@@ -16,7 +18,8 @@ def load_asr_model(device="cuda"):
 def transcribe_with_faster_whisper(audio_path, asr_model=None):
     """
     Транскрибирует аудиофайл с помощью Faster-Whisper.
-    Возвращает полный текст. Сохраняет транскрипт в нужную подпапку.
+    Возвращает полный текст. Транскрипт (JSONL: заголовок + сегменты с метками времени)
+    пишется в нужную подпапку посегментно, по мере декодирования.
     """
     if asr_model is None:
         asr_model = load_asr_model()
@@ -24,9 +27,6 @@ def transcribe_with_faster_whisper(audio_path, asr_model=None):
     print(f"📝 Транскрибация файла: {audio_path}")
     segments, info = asr_model.transcribe(audio_path, language="ru", task="transcribe")
 
-    text = " ".join([segment.text.strip() for segment in segments]).strip()
-    print("📝 Транскрибация файла завершена")
-
     base_name = os.path.splitext(os.path.basename(audio_path))[0]  # meeting_..._linux
     ts = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
 
@@ -38,10 +38,22 @@ def transcribe_with_faster_whisper(audio_path, asr_model=None):
     else:
         out_dir = TRANSCRIPTS_DIR  # запасной вариант
 
-    os.makedirs(out_dir, exist_ok=True)
-    file_path = os.path.join(out_dir, f"{base_name}_{ts}.txt")
-    with open(file_path, "w", encoding="utf-8") as f:
-        f.write(text)
+    file_path = os.path.join(out_dir, f"{base_name}_{ts}{TRANSCRIPT_EXT}")
+    header = {
+        "source": os.path.basename(audio_path),
+        "language": info.language,
+        "language_probability": info.language_probability,
+        "duration": info.duration,
+    }
+    records = []
+    with TranscriptWriter(file_path, header) as writer:
+        for segment in segments:
+            record = segment_to_dict(segment)
+            writer.write_segment(record)
+            records.append(record)
+
+    text = segments_text(records)
+    print("📝 Транскрибация файла завершена")
 
     print(f"[Whisper] ✅ Транскрипция сохранена: {file_path}")
     return text
@@ -1,16 +1,27 @@
 """
 Оптимизированная транскрипция с кэшированием
 """
+import hashlib
+import json
 import logging
+import multiprocessing
 import os
+import wave
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from pathlib import Path
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Tuple
 import time
 
-from faster_whisper import WhisperModel
+import numpy as np
+from faster_whisper import WhisperModel, decode_audio
 from utils.config import get_config
-from utils.model_cache import cached_model, get_asr_cache_key
+from utils.audio_capture import AudioClip, WHISPER_SAMPLE_RATE
+from utils.model_cache import cached_model, get_asr_cache_key, get_asr_model_size_mb
+from utils.vad import TimestampMap, trim_silence, vad_signature
+from transcriber.utils import (
+    TRANSCRIPT_EXT, TranscriptWriter, read_transcript, segment_to_dict, segments_text, write_transcript
+)
 
 logger = logging.getLogger(__name__)
 
@@ -20,6 +31,52 @@ class TranscriptionError(Exception):
     pass
 
 
+def split_on_silence(audio: np.ndarray, samplerate: int = WHISPER_SAMPLE_RATE,
+                     target_sec: float = 60.0, max_sec: float = 90.0,
+                     frame_ms: int = 30) -> List[Tuple[int, int]]:
+    """
+    Разбить аудио на куски [start, end) в сэмплах.
+    Каждый разрез ставится в самом тихом кадре окна [target_sec, max_sec] от начала куска.
+    """
+    frame = int(samplerate * frame_ms / 1000)
+    n_frames = len(audio) // frame
+    if len(audio) <= max_sec * samplerate or n_frames == 0:
+        return [(0, len(audio))] if len(audio) else []
+
+    frames = audio[:n_frames * frame].reshape(n_frames, frame)
+    energy = np.sqrt(np.mean(frames.astype(np.float32) ** 2, axis=1))
+
+    target = int(target_sec * samplerate / frame)
+    limit = int(max_sec * samplerate / frame)
+    # Разрез по середине самого тихого кадра
+    edges = []
+    start = 0
+    while n_frames - start > limit:
+        cut = start + target + int(np.argmin(energy[start + target:start + limit]))
+        edges.append(cut * frame + frame // 2)
+        start = cut
+    starts = [0] + edges
+    ends = edges + [len(audio)]
+    return list(zip(starts, ends))
+
+
+# Модель процесса-воркера (по одной int8-модели на процесс)
+_worker_model: Optional[WhisperModel] = None
+
+
+def _init_worker(model_size: str, compute_type: str, cpu_threads: int) -> None:
+    global _worker_model
+    _worker_model = WhisperModel(model_size, device="cpu", compute_type=compute_type,
+                                 cpu_threads=cpu_threads)
+
+
+def _transcribe_chunk(offset_sec: float, audio: np.ndarray, language: str,
+                      word_timestamps: bool) -> List[Dict[str, Any]]:
+    segments, _ = _worker_model.transcribe(audio, language=language, task="transcribe",
+                                           word_timestamps=word_timestamps)
+    return [segment_to_dict(seg, offset_sec, with_words=word_timestamps) for seg in segments]
+
+
 class OptimizedWhisperTranscriber:
     """Оптимизированный транскрайбер с кэшированием"""
     
@@ -33,10 +90,17 @@ class OptimizedWhisperTranscriber:
         self.meetings_dir.mkdir(parents=True, exist_ok=True)
         self.questions_dir.mkdir(parents=True, exist_ok=True)
         
-        # Кэшированная модель
-        self._model: Optional[WhisperModel] = None
+        # Кэш транскрипций по хэшу содержимого аудио
+        self.language = config.get("asr_language", "ru")
+        self.word_timestamps = config.get("asr_word_timestamps", False)
+        self.vad = config.get("asr_vad", False)
+        self.cache_dir = self.transcripts_dir / ".cache"
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._hash_memo: Dict[Tuple[str, int, int], str] = {}
     
-    @cached_model(get_asr_cache_key)
+    @cached_model(lambda self, *args: get_asr_cache_key(*args),
+                  size_func=lambda self, *args: get_asr_model_size_mb(*args),
+                  device_func=lambda self, model_size, device, compute_type: device)
     def _load_model(self, model_size: str, device: str, compute_type: str) -> WhisperModel:
         """Загрузка модели с кэшированием"""
         logger.info(f"Loading Faster-Whisper model: {model_size} on {device}")
@@ -58,101 +122,321 @@ class OptimizedWhisperTranscriber:
             raise TranscriptionError(f"Model loading failed: {e}")
     
     def get_model(self) -> WhisperModel:
-        """Получить модель (загрузить если нужно)"""
-        if self._model is None:
-            self._model = self._load_model(
-                self.config["asr_model_size"],
-                self.config["asr_device"],
-                self.config["asr_compute_type"]
-            )
-        return self._model
+        """
+        Получить модель (загрузить если нужно). Ссылка не хранится в транскрайбере,
+        чтобы кэш моделей мог выгрузить её по бюджету памяти или простою.
+        """
+        return self._load_model(
+            self.config["asr_model_size"],
+            self.config["asr_device"],
+            self.config["asr_compute_type"]
+        )
+    
+    def warm_up(self) -> None:
+        """Загрузить модель и прогнать секунду тишины, чтобы прогреть ядра и кэши"""
+        segments, _ = self.get_model().transcribe(
+            np.zeros(WHISPER_SAMPLE_RATE, dtype=np.float32),
+            language=self.language,
+            task="transcribe",
+        )
+        list(segments)
     
     def transcribe(self, audio_path: str) -> str:
         """Транскрибировать аудиофайл"""
+        logger.info(f"Transcribing: {audio_path}")
+        start_time = time.time()
+        
+        result = self.transcribe_segments(audio_path)
+        text = segments_text(result["segments"])
+        
+        transcribe_time = time.time() - start_time
+        logger.info(f"Transcription completed in {transcribe_time:.2f}s"
+                    f"{' (cache hit)' if result['cached'] else ''}")
+        return text
+    
+    def transcribe_segments(self, audio_path: str) -> Dict[str, Any]:
+        """
+        Сегменты транскрипции файла. Если для хэша содержимого и настроек ASR уже есть
+        JSONL-транскрипт — читаем его, иначе декодируем и пишем транскрипт посегментно.
+        Возвращает {"segments", "info", "transcript_path", "cached"}.
+        """
         if not os.path.exists(audio_path):
             raise TranscriptionError(f"Audio file not found: {audio_path}")
         
-        logger.info(f"Transcribing: {audio_path}")
-        start_time = time.time()
+        key = self._cache_key(audio_path)
+        cached = self._cache_load(key)
+        if cached is not None:
+            return cached
         
+        transcript_path = self._transcript_path(audio_path)
         try:
-            model = self.get_model()
-            segments, info = model.transcribe(
-                audio_path, 
-                language="ru", 
-                task="transcribe"
-            )
-            
-            # Собираем текст
-            text = " ".join([segment.text.strip() for segment in segments]).strip()
-            
-            transcribe_time = time.time() - start_time
-            logger.info(f"Transcription completed in {transcribe_time:.2f}s")
-            
-            # Сохраняем транскрипт
-            self._save_transcript(audio_path, text)
-            
-            return text
-            
+            if self._use_long_mode(audio_path):
+                info, segments = self.transcribe_long(audio_path, transcript_path)
+            elif self.vad:
+                # Декодируем только речь, метки времени возвращаем в шкалу исходной записи
+                audio = decode_audio(audio_path, sampling_rate=WHISPER_SAMPLE_RATE)
+                speech, tmap = trim_silence(audio, WHISPER_SAMPLE_RATE)
+                raw_segments, language, language_probability = [], self.language, None
+                if len(speech):
+                    raw_segments, raw_info = self.get_model().transcribe(
+                        speech,
+                        language=self.language,
+                        task="transcribe",
+                        word_timestamps=self.word_timestamps
+                    )
+                    language, language_probability = raw_info.language, raw_info.language_probability
+                info = self._info_dict(audio_path, language, language_probability,
+                                       len(audio) / WHISPER_SAMPLE_RATE)
+                info["speech_duration"] = len(speech) / WHISPER_SAMPLE_RATE
+                segments = self._write_stream(transcript_path, info, raw_segments, tmap=tmap)
+            else:
+                model = self.get_model()
+                raw_segments, raw_info = model.transcribe(
+                    audio_path, 
+                    language=self.language, 
+                    task="transcribe",
+                    word_timestamps=self.word_timestamps
+                )
+                info = self._info_dict(audio_path, raw_info.language,
+                                       raw_info.language_probability, raw_info.duration)
+                segments = self._write_stream(transcript_path, info, raw_segments)
         except Exception as e:
             logger.error(f"Transcription failed: {e}")
             raise TranscriptionError(f"Transcription error: {e}")
+        
+        logger.info(f"Transcript saved: {transcript_path}")
+        self._cache_store(key, transcript_path)
+        return {"segments": segments, "info": info,
+                "transcript_path": str(transcript_path), "cached": False}
+    
+    def _write_stream(self, transcript_path: Path, info: Dict[str, Any], raw_segments,
+                      offset: float = 0.0, tmap: Optional[TimestampMap] = None) -> List[Dict[str, Any]]:
+        """Пишем сегменты в JSONL по мере того, как их отдаёт декодер"""
+        segments = []
+        with TranscriptWriter(transcript_path, info) as writer:
+            for raw in raw_segments:
+                seg = segment_to_dict(raw, offset, with_words=self.word_timestamps)
+                if tmap is not None:
+                    seg = tmap.remap_segment(seg)
+                writer.write_segment(seg)
+                segments.append(seg)
+        return segments
+    
+    def _info_dict(self, source: str, language: str, language_probability: Optional[float],
+                   duration: float) -> Dict[str, Any]:
+        return {
+            "source": Path(source).name,
+            "language": language,
+            "language_probability": language_probability,
+            "duration": duration,
+            "model": self.config["asr_model_size"],
+            "compute_type": self.config["asr_compute_type"],
+            "created": datetime.now().isoformat(timespec="seconds"),
+        }
     
-    def _save_transcript(self, audio_path: str, text: str) -> str:
-        """Сохранить транскрипт в файл"""
+    def store_segments(self, audio_path: str, segments: List[Dict[str, Any]],
+                       duration: float) -> str:
+        """
+        Записать транскрипт из сегментов, полученных вне transcribe_segments
+        (например, потоковым ASR), и зарегистрировать его в кэше, если есть аудиофайл.
+        """
+        info = self._info_dict(audio_path, self.language, None, duration)
+        transcript_path = self._transcript_path(audio_path)
+        write_transcript(transcript_path, info, segments)
+        logger.info(f"Transcript saved: {transcript_path}")
+        if os.path.exists(audio_path):
+            self._cache_store(self._cache_key(audio_path), transcript_path)
+        return str(transcript_path)
+    
+    def _audio_hash(self, audio_path: str) -> str:
+        """Хэш содержимого аудио (мемоизируется по пути, размеру и mtime)"""
+        st = os.stat(audio_path)
+        memo_key = (os.path.abspath(audio_path), st.st_size, st.st_mtime_ns)
+        digest = self._hash_memo.get(memo_key)
+        if digest is None:
+            h = hashlib.blake2b(digest_size=16)
+            with open(audio_path, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    h.update(block)
+            digest = h.hexdigest()
+            self._hash_memo[memo_key] = digest
+        return digest
+    
+    def _cache_key(self, audio_path: str) -> str:
+        """
+        Ключ кэша: хэш аудио + модель + режим декодирования (длинные файлы всегда int8
+        по кускам) + язык + VAD с его порогами + пословные метки
+        """
+        mode = "int8-long" if self._use_long_mode(audio_path) else self.config["asr_compute_type"]
+        return "_".join([
+            self._audio_hash(audio_path),
+            self.config["asr_model_size"],
+            mode,
+            self.language,
+            vad_signature() if self.vad else "novad",
+            "words" if self.word_timestamps else "nowords",
+        ])
+    
+    def _cache_load(self, key: str) -> Optional[Dict[str, Any]]:
+        """Запись кэша — ссылка на JSONL-транскрипт; читаем сам транскрипт"""
+        path = self.cache_dir / f"{key}.json"
+        if not path.exists():
+            return None
         try:
-            # Определяем тип записи по имени файла
-            base_name = Path(audio_path).stem
-            if base_name.startswith("meeting_"):
-                out_dir = self.meetings_dir
-            elif base_name.startswith("question_"):
-                out_dir = self.questions_dir
-            else:
-                out_dir = self.transcripts_dir
+            with open(path, "r", encoding="utf-8") as f:
+                transcript_path = json.load(f).get("transcript_path")
+            if not (transcript_path and os.path.exists(transcript_path)):
+                return None
+            info, segments = read_transcript(transcript_path)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Broken transcript cache entry {path}: {e}")
+            return None
+        return {"segments": segments, "info": info,
+                "transcript_path": transcript_path, "cached": True}
+    
+    def _cache_store(self, key: str, transcript_path: Path) -> None:
+        path = self.cache_dir / f"{key}.json"
+        tmp_path = path.with_suffix(".tmp")
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"transcript_path": str(transcript_path)}, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Failed to write transcript cache {path}: {e}")
+    
+    def _use_long_mode(self, audio_path: str) -> bool:
+        """Длинный WAV на CPU транскрибируется параллельно по кускам"""
+        if self.config["asr_device"] != "cpu" or self.config.get("asr_workers", 1) <= 1:
+            return False
+        if Path(audio_path).suffix.lower() != ".wav":
+            return False
+        try:
+            with wave.open(audio_path, "rb") as wf:
+                duration = wf.getnframes() / wf.getframerate()
+        except (wave.Error, EOFError):
+            return False
+        return duration >= self.config.get("asr_long_file_sec", 600)
+    
+    def transcribe_long(self, audio_path: str, transcript_path: Optional[Path] = None,
+                        workers: Optional[int] = None) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+        """
+        Режим длинных файлов: разрез по паузам, куски декодируются в пуле процессов
+        (в каждом своя int8-модель), сегменты сшиваются с глобальными метками времени
+        и пишутся в транскрипт по порядку по мере готовности кусков.
+        """
+        workers = workers or self.config.get("asr_workers", 1)
+        cpu_threads = max(1, (os.cpu_count() or 1) // workers)
+        
+        audio = decode_audio(audio_path, sampling_rate=WHISPER_SAMPLE_RATE)
+        duration = len(audio) / WHISPER_SAMPLE_RATE
+        info = self._info_dict(audio_path, self.language, None, duration)
+        info["compute_type"] = "int8"
+        tmap = None
+        if self.vad:
+            audio, tmap = trim_silence(audio, WHISPER_SAMPLE_RATE)
+            info["speech_duration"] = len(audio) / WHISPER_SAMPLE_RATE
+        bounds = split_on_silence(
+            audio,
+            target_sec=self.config.get("asr_chunk_sec", 60),
+            max_sec=self.config.get("asr_chunk_sec", 60) * 1.5,
+        )
+        logger.info(f"Long-file mode: {duration:.0f}s audio, "
+                    f"{len(bounds)} chunks, {workers} workers x {cpu_threads} threads")
+        
+        # spawn, не fork: родитель многопоточный (pynput, захват, прогрев, потоки CTranslate2/OpenMP)
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.config["asr_model_size"], "int8", cpu_threads),
+        ) as pool:
+            futures = [
+                pool.submit(_transcribe_chunk, start / WHISPER_SAMPLE_RATE, audio[start:end],
+                            self.language, self.word_timestamps)
+                for start, end in bounds
+            ]
+            chunks = (seg for f in futures for seg in f.result())
+            if transcript_path is None:
+                return info, [tmap.remap_segment(seg) if tmap else seg for seg in chunks]
+            return info, self._write_stream(transcript_path, info, chunks, tmap=tmap)
+    
+    def transcribe_array(self, audio: np.ndarray, name: str,
+                         info_extra: Optional[Dict[str, Any]] = None) -> str:
+        """
+        Транскрибировать аудио из памяти: float32 моно 16 kHz, без WAV-файла.
+        Транскрипт пишется под именем name, как для одноимённой записи.
+        С asr_vad декодируется только речь, метки времени — в шкале исходного аудио.
+        """
+        if audio.dtype != np.float32 or audio.ndim != 1:
+            raise TranscriptionError("Expected 1-D float32 mono audio at 16 kHz")
+        duration = len(audio) / WHISPER_SAMPLE_RATE
+        logger.info(f"Transcribing from memory: {name} ({duration:.1f}s)")
+        start_time = time.time()
+        
+        try:
+            tmap = None
+            speech = audio
+            if self.vad:
+                speech, tmap = trim_silence(audio, WHISPER_SAMPLE_RATE)
+            raw_segments, language, language_probability = [], self.language, None
+            if len(speech):
+                raw_segments, raw_info = self.get_model().transcribe(
+                    speech,
+                    language=self.language,
+                    task="transcribe",
+                    word_timestamps=self.word_timestamps
+                )
+                language, language_probability = raw_info.language, raw_info.language_probability
             
-            # Генерируем имя файла
-            ts = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-            output_path = out_dir / f"{base_name}_{ts}.txt"
+            info = self._info_dict(name, language, language_probability, duration)
+            if tmap is not None:
+                info["speech_duration"] = len(speech) / WHISPER_SAMPLE_RATE
+            info.update(info_extra or {})
+            segments = self._write_stream(self._transcript_path(name), info, raw_segments, tmap=tmap)
+            text = segments_text(segments)
             
-            # Сохраняем
-            with open(output_path, "w", encoding="utf-8") as f:
-                f.write(text)
+            transcribe_time = time.time() - start_time
+            logger.info(f"In-memory transcription completed in {transcribe_time:.2f}s")
             
-            logger.info(f"Transcript saved: {output_path}")
-            return str(output_path)
+            return text
             
         except Exception as e:
-            logger.error(f"Failed to save transcript: {e}")
-            raise TranscriptionError(f"Failed to save transcript: {e}")
+            logger.error(f"In-memory transcription failed: {e}")
+            raise TranscriptionError(f"Transcription error: {e}")
+    
+    def transcribe_clip(self, clip: AudioClip) -> str:
+        """Транскрибировать фрагмент идущего захвата напрямую из памяти"""
+        return self.transcribe_array(
+            clip.to_float32(WHISPER_SAMPLE_RATE),
+            clip.name,
+            {"capture_offset_sec": clip.start / clip.samplerate},
+        )
+    
+    def _transcript_path(self, audio_path: str) -> Path:
+        """Путь к JSONL-транскрипту: подпапка по типу записи + метка времени"""
+        base_name = Path(audio_path).stem
+        if base_name.startswith("meeting_"):
+            out_dir = self.meetings_dir
+        elif base_name.startswith("question_"):
+            out_dir = self.questions_dir
+        else:
+            out_dir = self.transcripts_dir
+        
+        ts = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        return out_dir / f"{base_name}_{ts}{TRANSCRIPT_EXT}"
     
     def get_transcription_stats(self, audio_path: str) -> Dict[str, Any]:
-        """Получить статистику транскрипции"""
-        if not os.path.exists(audio_path):
-            raise TranscriptionError(f"Audio file not found: {audio_path}")
+        """Получить статистику транскрипции (из JSONL-транскрипта, без повторного ASR)"""
+        result = self.transcribe_segments(audio_path)
+        segments = result["segments"]
+        info = result["info"]
         
-        try:
-            model = self.get_model()
-            segments, info = model.transcribe(
-                audio_path, 
-                language="ru", 
-                task="transcribe"
-            )
-            
-            # Собираем статистику
-            total_duration = sum(segment.end - segment.start for segment in segments)
-            num_segments = len(list(segments))
-            
-            return {
-                "total_duration": total_duration,
-                "num_segments": num_segments,
-                "language": info.language,
-                "language_probability": info.language_probability
-            }
-            
-        except Exception as e:
-            logger.error(f"Failed to get transcription stats: {e}")
-            raise TranscriptionError(f"Stats error: {e}")
-
+        return {
+            "total_duration": sum(seg["end"] - seg["start"] for seg in segments),
+            "num_segments": len(segments),
+            "language": info.get("language"),
+            "language_probability": info.get("language_probability")
+        }
 
 # Функции для обратной совместимости
 def load_asr_model(device: str = "cuda") -> WhisperModel:
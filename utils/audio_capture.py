@@ -0,0 +1,560 @@
+"""
+Захват аудио внутри процесса: кольцевой буфер + подключаемые источники + поток записи WAV
+"""
+import logging
+import os
+import subprocess
+import threading
+import time
+import wave
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_WIDTH = 2  # s16le
+WHISPER_SAMPLE_RATE = 16000
+
+DataCallback = Callable[[np.ndarray], None]
+
+
+class AudioCaptureError(Exception):
+    """Исключение для ошибок захвата аудио"""
+    pass
+
+
+class RingBuffer:
+    """
+    Предвыделенный кольцевой буфер PCM (int16, shape (frames, channels)).
+
+    Каждый блок пишется дважды (в i и i + capacity), поэтому любое окно
+    длиной не больше capacity доступно как непрерывный NumPy view без копирования.
+    Позиции — абсолютные номера фреймов с начала записи.
+    """
+
+    def __init__(self, capacity: int, channels: int = 1):
+        if capacity <= 0:
+            raise ValueError("capacity must be positive")
+        self.capacity = capacity
+        self.channels = channels
+        self._data = np.zeros((capacity * 2, channels), dtype=np.int16)
+        self._total = 0
+        self._lock = threading.Lock()
+
+    @property
+    def total_written(self) -> int:
+        """Абсолютная позиция следующего записываемого фрейма"""
+        return self._total
+
+    @property
+    def oldest(self) -> int:
+        """Абсолютная позиция самого старого фрейма, ещё лежащего в буфере"""
+        return max(0, self._total - self.capacity)
+
+    def write(self, frames: np.ndarray) -> None:
+        """Добавить фреймы (int16, (n,) или (n, channels))"""
+        frames = np.asarray(frames, dtype=np.int16).reshape(-1, self.channels)
+        # Блок длиннее буфера: пишем только хвост, но позиции считаем по полной длине
+        dropped = max(0, len(frames) - self.capacity)
+        frames = frames[dropped:]
+
+        with self._lock:
+            pos = (self._total + dropped) % self.capacity
+            n = len(frames)
+            first = min(n, self.capacity - pos)
+            for base in (0, self.capacity):
+                self._data[base + pos:base + pos + first] = frames[:first]
+            if first < n:
+                rest = n - first
+                self._data[:rest] = frames[first:]
+                self._data[self.capacity:self.capacity + rest] = frames[first:]
+            self._total += dropped + n
+
+    def view(self, start: int, end: int) -> np.ndarray:
+        """
+        Непрерывный view на фреймы [start, end) без копирования.
+        Валиден, пока писатель не перезапишет эти фреймы (capacity фреймов вперёд).
+        """
+        with self._lock:
+            if start < self.oldest or end > self._total or start > end:
+                raise AudioCaptureError(
+                    f"Range [{start}, {end}) is outside buffer [{self.oldest}, {self._total})"
+                )
+            pos = start % self.capacity
+            return self._data[pos:pos + (end - start)]
+
+    def read(self, start: int, end: int) -> np.ndarray:
+        """Копия фреймов [start, end)"""
+        return self.view(start, end).copy()
+
+    def read_from(self, start: int) -> Tuple[int, np.ndarray]:
+        """
+        Копия всех фреймов от start до конца записи под локом (писатель не перезапишет их
+        посреди чтения). Если start уже перезаписан — читаем от самого старого.
+        Возвращает (фактический start, фреймы).
+        """
+        with self._lock:
+            start = max(start, self.oldest)
+            pos = start % self.capacity
+            return start, self._data[pos:pos + (self._total - start)].copy()
+
+
+class AudioSource:
+    """Базовый источник PCM: вызывает callback с блоками int16 (n, channels)"""
+
+    def __init__(self, samplerate: int, channels: int = 1):
+        self.samplerate = samplerate
+        self.channels = channels
+
+    def start(self, on_data: DataCallback) -> None:
+        raise NotImplementedError
+
+    def stop(self) -> None:
+        raise NotImplementedError
+
+
+class SoundDeviceSource(AudioSource):
+    """Захват через PortAudio (sounddevice) прямо в процесс"""
+
+    def __init__(self, samplerate: int, channels: int = 1, device: Optional[str] = None,
+                 blocksize: int = 0, latency: str = "high"):
+        super().__init__(samplerate, channels)
+        self.device = device
+        self.blocksize = blocksize
+        self.latency = latency
+        self._stream = None
+
+    def start(self, on_data: DataCallback) -> None:
+        try:
+            import sounddevice as sd
+        except ImportError as e:
+            raise AudioCaptureError(f"sounddevice is not installed: {e}")
+
+        def callback(indata, frames, time_info, status):
+            if status:
+                logger.warning(f"sounddevice status: {status}")
+            on_data(indata)
+
+        try:
+            self._stream = sd.InputStream(
+                samplerate=self.samplerate,
+                channels=self.channels,
+                dtype="int16",
+                device=self.device,
+                blocksize=self.blocksize,
+                latency=self.latency,
+                callback=callback,
+            )
+            self._stream.start()
+        except Exception as e:
+            raise AudioCaptureError(f"Failed to open input device {self.device!r}: {e}")
+
+    def stop(self) -> None:
+        if self._stream is not None:
+            self._stream.stop()
+            self._stream.close()
+            self._stream = None
+
+
+class ParecSource(AudioSource):
+    """Один процесс parec; сырой PCM читается из pipe крупными блоками без sox"""
+
+    def __init__(self, samplerate: int, channels: int = 1, device: str = "VirtualCable.monitor",
+                 block_ms: int = 100):
+        super().__init__(samplerate, channels)
+        self.device = device
+        self.block_bytes = int(samplerate * block_ms / 1000) * channels * SAMPLE_WIDTH
+        self._proc: Optional[subprocess.Popen] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, on_data: DataCallback) -> None:
+        cmd = [
+            "parec", "-d", self.device,
+            f"--rate={self.samplerate}",
+            "--format=s16le",
+            f"--channels={self.channels}",
+            "--latency-msec=1"
+        ]
+        try:
+            self._proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                          bufsize=self.block_bytes)
+        except FileNotFoundError as e:
+            raise AudioCaptureError(f"parec not found: {e}")
+
+        def reader():
+            frame_bytes = self.channels * SAMPLE_WIDTH
+            tail = b""
+            stream = self._proc.stdout
+            while True:
+                chunk = stream.read(self.block_bytes)
+                if not chunk:
+                    break
+                chunk = tail + chunk
+                usable = len(chunk) - len(chunk) % frame_bytes
+                tail = chunk[usable:]
+                if usable:
+                    on_data(np.frombuffer(chunk[:usable], dtype=np.int16).reshape(-1, self.channels))
+
+        self._thread = threading.Thread(target=reader, name="parec-reader", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._proc and self._proc.poll() is None:
+            try:
+                self._proc.terminate()
+                self._proc.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self._proc.kill()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self._proc = None
+
+
+class ArraySource(AudioSource):
+    """Синтетический источник из массива (для тестов и бенчмарков)"""
+
+    def __init__(self, samples: np.ndarray, samplerate: int, channels: int = 1,
+                 block_ms: int = 100, realtime: bool = False):
+        super().__init__(samplerate, channels)
+        self.samples = np.asarray(samples, dtype=np.int16).reshape(-1, channels)
+        self.block = max(1, int(samplerate * block_ms / 1000))
+        self.realtime = realtime
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, on_data: DataCallback) -> None:
+        def feeder():
+            period = self.block / self.samplerate
+            for i in range(0, len(self.samples), self.block):
+                if self._stop.is_set():
+                    break
+                on_data(self.samples[i:i + self.block])
+                if self.realtime:
+                    time.sleep(period)
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=feeder, name="array-source", daemon=True)
+        self._thread.start()
+
+    def wait(self, timeout: Optional[float] = None) -> None:
+        """Дождаться, пока источник отдаст все фреймы"""
+        if self._thread:
+            self._thread.join(timeout)
+
+    def stop(self) -> None:
+        self._stop.set()
+        self.wait(timeout=5)
+
+
+class WavFileSource(ArraySource):
+    """Источник из WAV-файла (s16le)"""
+
+    def __init__(self, path: str, block_ms: int = 100, realtime: bool = False):
+        with wave.open(str(path), "rb") as wf:
+            if wf.getsampwidth() != SAMPLE_WIDTH:
+                raise AudioCaptureError(f"Only 16-bit WAV is supported: {path}")
+            channels = wf.getnchannels()
+            samplerate = wf.getframerate()
+            pcm = np.frombuffer(wf.readframes(wf.getnframes()), dtype=np.int16)
+        super().__init__(pcm, samplerate, channels, block_ms=block_ms, realtime=realtime)
+
+
+def to_float32_mono(pcm: np.ndarray) -> np.ndarray:
+    """int16 (n, channels) -> float32 моно в диапазоне [-1, 1] (формат входа Whisper)"""
+    pcm = np.asarray(pcm)
+    if pcm.ndim == 2:
+        pcm = pcm.mean(axis=1) if pcm.shape[1] > 1 else pcm[:, 0]
+    return pcm.astype(np.float32) / 32768.0
+
+
+def _lowpass_kernel(factor: int, taps_per_phase: int = 16) -> np.ndarray:
+    """FIR нижних частот (windowed sinc) для прореживания в factor раз"""
+    taps = taps_per_phase * factor + 1
+    n = np.arange(taps) - (taps - 1) / 2
+    kernel = np.sinc(n / factor) * np.hamming(taps)
+    return (kernel / kernel.sum()).astype(np.float32)
+
+
+def resample(audio: np.ndarray, src_rate: int, dst_rate: int) -> np.ndarray:
+    """
+    Ресэмплинг float32 моно. Для целого коэффициента (48k -> 16k) —
+    FIR-фильтр нижних частот (windowed sinc) и прореживание, иначе линейная интерполяция.
+    """
+    if src_rate == dst_rate:
+        return np.asarray(audio, dtype=np.float32)
+    if src_rate % dst_rate == 0:
+        factor = src_rate // dst_rate
+        filtered = np.convolve(audio, _lowpass_kernel(factor), mode="same")
+        return filtered[::factor].astype(np.float32)
+    duration = len(audio) / src_rate
+    t_dst = np.arange(int(duration * dst_rate)) / dst_rate
+    t_src = np.arange(len(audio)) / src_rate
+    return np.interp(t_dst, t_src, audio).astype(np.float32)
+
+
+class StreamingResampler:
+    """
+    Потоковый ресэмплер float32 моно: блоки любого размера, без артефактов на стыках.
+    Целый коэффициент — FIR + прореживание с сохранением истории фильтра и фазы,
+    иначе — линейная интерполяция с переносом дробной позиции между блоками.
+    """
+
+    def __init__(self, src_rate: int, dst_rate: int):
+        self.src_rate = src_rate
+        self.dst_rate = dst_rate
+        if src_rate % dst_rate == 0:
+            self.factor = src_rate // dst_rate
+            self._kernel = _lowpass_kernel(self.factor)
+            self._history = np.zeros(len(self._kernel) - 1, dtype=np.float32)
+            self._phase = 0
+        else:
+            self.factor = 0
+            self._step = src_rate / dst_rate
+            self._last = np.zeros(1, dtype=np.float32)
+            self._pos = 1.0
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        block = np.asarray(block, dtype=np.float32)
+        if self.src_rate == self.dst_rate or len(block) == 0:
+            return block
+
+        if self.factor:
+            x = np.concatenate([self._history, block])
+            self._history = x[len(x) - len(self._history):]
+            filtered = np.convolve(x, self._kernel, mode="valid")
+            out = filtered[self._phase::self.factor]
+            self._phase = (self._phase - len(filtered)) % self.factor
+            return out.astype(np.float32)
+
+        x = np.concatenate([self._last, block])
+        positions = np.arange(self._pos, len(x) - 1, self._step)
+        out = np.interp(positions, np.arange(len(x)), x)
+        next_pos = positions[-1] + self._step if len(positions) else self._pos
+        self._pos = next_pos - len(block)
+        self._last = x[-1:]
+        return out.astype(np.float32)
+
+
+class _WavSink:
+    """Кольцевой буфер + WAV-файл, куда поток записи сбрасывает новые фреймы"""
+
+    def __init__(self, buffer: RingBuffer, filename: str, samplerate: int):
+        self.buffer = buffer
+        self.filename = filename
+        self.samplerate = samplerate
+        self.flushed = 0
+        self.dropped = 0
+        self.gaps: List[Tuple[int, int]] = []  # потерянные диапазоны фреймов [start, end)
+        Path(filename).parent.mkdir(parents=True, exist_ok=True)
+        self.wav = wave.open(filename, "wb")
+        self.wav.setnchannels(buffer.channels)
+        self.wav.setsampwidth(SAMPLE_WIDTH)
+        self.wav.setframerate(samplerate)
+
+    def flush(self) -> None:
+        start, frames = self.buffer.read_from(self.flushed)
+        if start > self.flushed:
+            logger.warning(f"Capture writer overrun on {self.filename}: "
+                           f"frames [{self.flushed}, {start}) dropped")
+            self._drop(start)
+        if len(frames):
+            self.wav.writeframesraw(frames.tobytes())
+        self.flushed = start + len(frames)
+
+    def skip(self, error: Exception) -> None:
+        """Сброс не удался: пропускаем накопленное, чтобы следующий сброс писал уже новые фреймы"""
+        end = self.buffer.total_written
+        logger.error(f"Capture writer failed on {self.filename}: {error}; "
+                     f"frames [{self.flushed}, {end}) dropped")
+        self._drop(end)
+
+    def _drop(self, end: int) -> None:
+        if end > self.flushed:
+            self.gaps.append((self.flushed, end))
+            self.dropped += end - self.flushed
+        self.flushed = max(self.flushed, end)
+
+    def close(self) -> None:
+        self.flush()
+        self.wav.close()
+
+
+class CaptureEngine:
+    """
+    Захват в кольцевой буфер с фоновым потоком, сбрасывающим PCM в WAV крупными блоками.
+    Живой PCM доступен другим стадиям через view()/read() без обращения к файлу.
+
+    С asr_rate рядом ведётся побочный поток 16 kHz моно int16 (потоковый ресэмплер
+    в отдельном кольцевом буфере и, если задан asr_filename, в отдельном WAV) —
+    ASR читает его без повторного декодирования и ресэмплинга.
+    """
+
+    def __init__(self, source: AudioSource, filename: Optional[str] = None,
+                 buffer_seconds: float = 600.0, flush_seconds: float = 2.0,
+                 asr_rate: Optional[int] = None, asr_filename: Optional[str] = None):
+        self.source = source
+        self.samplerate = source.samplerate
+        self.channels = source.channels
+        self.filename = filename
+        self.asr_filename = asr_filename
+        self.flush_seconds = flush_seconds
+        self.buffer = RingBuffer(int(buffer_seconds * self.samplerate), self.channels)
+
+        # Побочный ASR-поток (если частота захвата уже ASR-ная — это сам основной буфер)
+        self.asr_buffer: Optional[RingBuffer] = None
+        self._resampler: Optional[StreamingResampler] = None
+        if asr_rate and (asr_rate != self.samplerate or self.channels != 1):
+            self.asr_buffer = RingBuffer(int(buffer_seconds * asr_rate), 1)
+            self._resampler = StreamingResampler(self.samplerate, asr_rate)
+        self.asr_samplerate = asr_rate if self.asr_buffer is not None else self.samplerate
+
+        self._sinks: List[_WavSink] = []
+        self._writer: Optional[threading.Thread] = None
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._running = False
+
+    @property
+    def position(self) -> int:
+        """Сколько фреймов захвачено с начала записи"""
+        return self.buffer.total_written
+
+    @property
+    def asr_position(self) -> int:
+        """Сколько фреймов в ASR-потоке"""
+        return (self.asr_buffer or self.buffer).total_written
+
+    @property
+    def dropped_frames(self) -> int:
+        return sum(sink.dropped for sink in self._sinks)
+
+    @property
+    def is_running(self) -> bool:
+        return self._running
+
+    def start(self) -> "CaptureEngine":
+        if self.filename:
+            self._sinks.append(_WavSink(self.buffer, self.filename, self.samplerate))
+        if self.asr_filename and self.asr_buffer is not None:
+            self._sinks.append(_WavSink(self.asr_buffer, self.asr_filename, self.asr_samplerate))
+        if self._sinks:
+            self._writer = threading.Thread(target=self._writer_loop, name="capture-writer", daemon=True)
+            self._writer.start()
+
+        self._running = True
+        self.source.start(self._on_data)
+        logger.info(f"Capture started: {type(self.source).__name__}, "
+                    f"{self.samplerate} Hz, {self.channels} ch, file={self.filename}, "
+                    f"asr={self.asr_samplerate} Hz")
+        return self
+
+    def _on_data(self, frames: np.ndarray) -> None:
+        self.buffer.write(frames)
+        if self._resampler is not None:
+            asr = self._resampler.process(to_float32_mono(frames.reshape(-1, self.channels)))
+            self.asr_buffer.write(np.clip(asr * 32768.0, -32768, 32767).astype(np.int16))
+        if self._sinks and self.position - self._sinks[0].flushed >= self.flush_seconds * self.samplerate:
+            self._wake.set()
+
+    def _writer_loop(self) -> None:
+        while not self._stopping.is_set():
+            self._wake.wait(self.flush_seconds)
+            self._wake.clear()
+            for sink in self._sinks:
+                # Ошибка одного сброса не должна останавливать поток записи: захват идёт дальше
+                try:
+                    sink.flush()
+                except (AudioCaptureError, OSError, wave.Error) as e:
+                    sink.skip(e)
+
+    def view(self, start: int, end: Optional[int] = None) -> np.ndarray:
+        """Zero-copy view на захваченные фреймы [start, end)"""
+        return self.buffer.view(start, self.position if end is None else end)
+
+    def read(self, start: int, end: Optional[int] = None) -> np.ndarray:
+        """Копия захваченных фреймов [start, end)"""
+        return self.view(start, end).copy()
+
+    def asr_view(self, start: int, end: Optional[int] = None) -> np.ndarray:
+        """Zero-copy view на ASR-поток (позиции — во фреймах ASR-потока)"""
+        buffer = self.asr_buffer or self.buffer
+        return buffer.view(start, buffer.total_written if end is None else end)
+
+    def to_asr_frame(self, frame: int) -> int:
+        """Позиция основного захвата -> позиция в ASR-потоке"""
+        return frame * self.asr_samplerate // self.samplerate
+
+    def stop(self) -> Optional[str]:
+        """Остановить захват, дописать хвост и закрыть файлы. Возвращает путь к основному WAV."""
+        if not self._running:
+            return self.filename
+        self._running = False
+        try:
+            self.source.stop()
+        finally:
+            self._stopping.set()
+            self._wake.set()
+            if self._writer:
+                self._writer.join()
+                self._writer = None
+            for sink in self._sinks:
+                sink.close()
+
+        logger.info(f"Capture stopped: {self.position} frames "
+                    f"({self.position / self.samplerate:.1f}s), dropped={self.dropped_frames}")
+        return self.filename
+
+
+@dataclass
+class AudioClip:
+    """Фрагмент идущего захвата: пара абсолютных смещений [start, end) без копирования PCM"""
+    capture: CaptureEngine
+    start: int
+    end: int
+    name: str
+
+    @property
+    def samplerate(self) -> int:
+        return self.capture.samplerate
+
+    @property
+    def duration(self) -> float:
+        return (self.end - self.start) / self.samplerate
+
+    def view(self) -> np.ndarray:
+        """Zero-copy view на PCM int16 фрагмента"""
+        return self.capture.view(self.start, self.end)
+
+    def to_float32(self, samplerate: int = WHISPER_SAMPLE_RATE) -> np.ndarray:
+        """float32 моно с нужной частотой — готовый вход для Whisper"""
+        if self.capture.asr_samplerate == samplerate:
+            pcm = self.capture.asr_view(self.capture.to_asr_frame(self.start),
+                                        self.capture.to_asr_frame(self.end))
+            return to_float32_mono(pcm)
+        return resample(to_float32_mono(self.view()), self.samplerate, samplerate)
+
+    def save(self, filename: str) -> str:
+        """Записать фрагмент в WAV (исходная частота и число каналов захвата)"""
+        pcm = self.view().copy()
+        Path(filename).parent.mkdir(parents=True, exist_ok=True)
+        with wave.open(filename, "wb") as wf:
+            wf.setnchannels(self.capture.channels)
+            wf.setsampwidth(SAMPLE_WIDTH)
+            wf.setframerate(self.samplerate)
+            wf.writeframes(pcm.tobytes())
+        return filename
+
+
+def create_source(backend: str, samplerate: int, channels: int, device: str) -> AudioSource:
+    """Фабрика источников по имени бэкенда из конфигурации"""
+    if backend == "parec":
+        return ParecSource(samplerate, channels, device=device)
+    if backend == "sounddevice":
+        # PortAudio видит PulseAudio-источники через устройство "pulse"
+        os.environ.setdefault("PULSE_SOURCE", device)
+        return SoundDeviceSource(samplerate, channels, device="pulse")
+    raise AudioCaptureError(f"Unknown capture backend: {backend}")
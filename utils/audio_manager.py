@@ -9,10 +9,11 @@ import time
 import logging
 from datetime import datetime
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import Optional
 from contextlib import contextmanager
 
 from utils.config import get_config
+from utils.audio_capture import AudioClip, CaptureEngine, AudioCaptureError, create_source
 
 logger = logging.getLogger(__name__)
 
@@ -36,14 +37,18 @@ class AudioManager:
         self.samplerate = config["sample_rate"]
         self.channels = config["channels"]
         
-        # Процессы записи
-        self.main_proc: Optional[subprocess.Popen] = None
-        self.main_sox: Optional[subprocess.Popen] = None
+        self.capture_backend = config.get("capture_backend", "parec")
+        self.capture_profile = config.get("capture_profile", "archive")
+        self.asr_samplerate = config.get("asr_sample_rate", 16000)
+        
+        # Захват записи
+        self.main_capture: Optional[CaptureEngine] = None
         self.main_filename: Optional[str] = None
+        self.main_asr_filename: Optional[str] = None
         
-        self.question_proc: Optional[subprocess.Popen] = None
-        self.question_sox: Optional[subprocess.Popen] = None
-        self.question_filename: Optional[str] = None
+        # Вопрос — это пара смещений в захвате встречи, без второго захвата
+        self.question_name: Optional[str] = None
+        self.question_start: Optional[int] = None
         
         # Директории
         self.audio_dir = Path(config["audio_dir"])
@@ -129,72 +134,64 @@ class AudioManager:
         folder = self.meetings_dir if prefix == "meeting" else self.questions_dir
         return str(folder / f"{prefix}_{ts}_{sys.platform}.wav")
     
-    def _start_recording(self, filename: str, duration_sec: Optional[int] = None) -> Tuple[subprocess.Popen, subprocess.Popen]:
-        """Запуск записи с улучшенной обработкой ошибок"""
+    def _start_recording(self, filename: str, duration_sec: Optional[int] = None) -> CaptureEngine:
+        """Запуск захвата в кольцевой буфер с фоновой записью WAV"""
+        rate, asr_rate, asr_filename = self.samplerate, None, None
+        if self.capture_profile == "asr":
+            # PulseAudio сам отдаёт 16 kHz — пишем сразу ASR-готовый WAV
+            rate = self.asr_samplerate
+        elif self.capture_profile == "archive+asr":
+            asr_rate = self.asr_samplerate
+            asr_filename = str(Path(filename).parent / "asr" / Path(filename).name)
+        
         try:
-            # Команда parec
-            parec_cmd = [
-                "parec", "-d", self.monitor_name,
-                f"--rate={self.samplerate}",
-                "--format=s16le",
-                f"--channels={self.channels}",
-                "--latency-msec=1"
-            ]
-            
-            # Команда sox
-            sox_cmd = [
-                "sox", "-t", "raw", f"-r{self.samplerate}",
-                "-e", "signed-integer", "-b", "16",
-                f"-c{self.channels}", "-", filename
-            ]
-            
-            # Запуск процессов
-            parec_proc = subprocess.Popen(parec_cmd, stdout=subprocess.PIPE, 
-                                        stderr=subprocess.PIPE, text=True)
-            sox_proc = subprocess.Popen(sox_cmd, stdin=parec_proc.stdout, 
-                                      stderr=subprocess.PIPE, text=True)
-            
-            # Автоматическая остановка через duration_sec
-            if duration_sec is not None:
-                def stop_after_delay():
-                    time.sleep(duration_sec)
-                    self._terminate_processes(parec_proc, sox_proc)
-                
-                threading.Thread(target=stop_after_delay, daemon=True).start()
-            
-            return parec_proc, sox_proc
-            
-        except FileNotFoundError as e:
-            raise AudioRecordingError(f"Required audio tool not found: {e}")
-        except subprocess.SubprocessError as e:
+            source = create_source(self.capture_backend, rate,
+                                   self.channels, self.monitor_name)
+            capture = CaptureEngine(
+                source,
+                filename=filename,
+                buffer_seconds=self.config.get("capture_buffer_sec", 600),
+                flush_seconds=self.config.get("capture_flush_sec", 2.0),
+                asr_rate=asr_rate,
+                asr_filename=asr_filename,
+            ).start()
+        except AudioCaptureError as e:
             raise AudioRecordingError(f"Failed to start recording: {e}")
+        
+        # Автоматическая остановка через duration_sec
+        if duration_sec is not None:
+            def stop_after_delay():
+                time.sleep(duration_sec)
+                self._stop_capture(capture)
+            
+            threading.Thread(target=stop_after_delay, daemon=True).start()
+        
+        return capture
     
-    def _terminate_processes(self, *processes) -> None:
-        """Безопасное завершение процессов"""
-        for proc in processes:
-            if proc and proc.poll() is None:
+    def _stop_capture(self, *captures: Optional[CaptureEngine]) -> None:
+        """Безопасная остановка захвата"""
+        for capture in captures:
+            if capture is not None:
                 try:
-                    proc.terminate()
-                    proc.wait(timeout=5)
-                except subprocess.TimeoutExpired:
-                    proc.kill()
+                    capture.stop()
                 except Exception as e:
-                    logger.warning(f"Error terminating process: {e}")
+                    logger.warning(f"Error stopping capture: {e}")
     
     def start_main_recording(self) -> str:
         """Запуск записи встречи"""
         filename = self._generate_filename("meeting")
         logger.info(f"Starting meeting recording: {filename}")
         
-        self.main_proc, self.main_sox = self._start_recording(filename)
+        self.main_capture = self._start_recording(filename)
         self.main_filename = filename
+        self.main_asr_filename = self.main_capture.asr_filename
         return filename
     
     def stop_main_recording(self) -> str:
         """Остановка записи встречи"""
         logger.info("Stopping main recording...")
         
-        self._terminate_processes(self.main_proc, self.main_sox)
+        self._stop_capture(self.main_capture)
         
         if self.main_filename and Path(self.main_filename).exists():
             logger.info(f"Main recording completed: {self.main_filename}")
@@ -203,32 +200,60 @@ class AudioManager:
             raise AudioRecordingError("Recording file not found")
     
     def start_question_recording(self) -> str:
-        """Запуск записи вопроса"""
-        filename = self._generate_filename("question")
-        logger.info(f"Starting question recording: {filename}")
+        """Запуск записи вопроса: запоминаем текущую позицию захвата встречи"""
+        if self.main_capture is None or not self.main_capture.is_running:
+            raise AudioRecordingError("Question recording requires an active meeting capture")
         
-        self.question_proc, self.question_sox = self._start_recording(filename)
-        self.question_filename = filename
-        return filename
+        self.question_name = Path(self._generate_filename("question")).stem
+        self.question_start = self.main_capture.position
+        logger.info(f"Starting question recording: {self.question_name} "
+                    f"at frame {self.question_start}")
+        return self.question_name
     
-    def stop_question_recording(self) -> str:
-        """Остановка записи вопроса"""
+    def stop_question_recording(self) -> AudioClip:
+        """Остановка записи вопроса: фрагмент захвата встречи без копирования"""
         logger.info("Stopping question recording...")
         
-        self._terminate_processes(self.question_proc, self.question_sox)
+        if self.question_start is None or self.main_capture is None:
+            raise AudioRecordingError("Question recording was not started")
         
-        if self.question_filename and Path(self.question_filename).exists():
-            logger.info(f"Question recording completed: {self.question_filename}")
-            return self.question_filename
-        else:
-            raise AudioRecordingError("Question recording file not found")
+        clip = AudioClip(
+            capture=self.main_capture,
+            start=self.question_start,
+            end=self.main_capture.position,
+            name=self.question_name,
+        )
+        self.question_start = None
+        
+        try:
+            clip.view()
+        except AudioCaptureError as e:
+            raise AudioRecordingError(f"Question audio is no longer in the capture buffer: {e}")
+        
+        logger.info(f"Question recording completed: {clip.name} ({clip.duration:.1f}s)")
+        return clip
+    
+    def save_clip_async(self, clip: AudioClip) -> threading.Thread:
+        """
+        Сохранить WAV вопроса в фоне, не задерживая транскрипцию.
+        PCM копируется из буфера захвата уже в потоке записи.
+        """
+        filename = str(self.questions_dir / f"{clip.name}.wav")
+        
+        def writer():
+            try:
+                clip.save(filename)
+                logger.info(f"Question audio saved: {filename}")
+            except (AudioCaptureError, OSError) as e:
+                logger.error(f"Failed to save question audio {filename}: {e}")
+        
+        thread = threading.Thread(target=writer, name="question-wav", daemon=True)
+        thread.start()
+        return thread
     
     def cleanup(self) -> None:
         """Очистка ресурсов"""
-        self._terminate_processes(
-            self.main_proc, self.main_sox,
-            self.question_proc, self.question_sox
-        )
+        self._stop_capture(self.main_capture)
 
 
 @contextmanager
@@ -18,11 +18,28 @@ RAG_STORE_DIR = BASE_DIR / "rag_store"
 SAMPLE_RATE = 48000  # 48kHz для лучшего качества
 CHANNELS = 1
 AUDIO_FORMAT = "s16le"
+CAPTURE_BACKEND = "parec"  # "parec" или "sounddevice"
+# "archive" — только WAV 48 kHz; "asr" — сразу 16 kHz моно;
+# "archive+asr" — архив 48 kHz + побочный поток 16 kHz для ASR (audio/meetings/asr/)
+CAPTURE_PROFILE = "archive+asr"
+ASR_SAMPLE_RATE = 16000  # частота входа Whisper
+CAPTURE_BUFFER_SEC = 600  # размер кольцевого буфера захвата
+CAPTURE_FLUSH_SEC = 2.0  # период сброса PCM на диск
 
 # Параметры ASR
 ASR_MODEL_SIZE = "base"  # "tiny", "base", "small", "medium", "large"
 ASR_DEVICE = "cuda"  # "cuda" или "cpu"
 ASR_COMPUTE_TYPE = "float16"  # "float16", "int8", "int8_float16"
+ASR_LANGUAGE = "ru"
+ASR_WORD_TIMESTAMPS = False  # пословные метки времени в JSONL-транскрипте
+ASR_VAD = True  # декодировать только участки речи
+ASR_WORKERS = max(1, (os.cpu_count() or 1) // 4)  # процессы для длинных файлов на CPU
+ASR_CHUNK_SEC = 60  # целевая длина куска в режиме длинных файлов
+ASR_LONG_FILE_SEC = 600  # с какой длительности включать режим длинных файлов
+ASR_STREAMING = True  # инкрементальная транскрипция встречи во время записи
+ASR_STREAM_WINDOW_SEC = 30
+ASR_STREAM_OVERLAP_SEC = 5
+QUESTION_SAVE_AUDIO = True  # сохранять WAV вопросов (в фоне, после старта ASR)
 
 # Параметры LLM
 LLM_HOST = "http://localhost:11434"
@@ -34,6 +51,33 @@ RAG_MODEL_NAME = "intfloat/multilingual-e5-base"
 RAG_TOP_K = 5
 RAG_THRESHOLD = 0.32
 RAG_BATCH_SIZE = 32
+RAG_EMBED_BACKEND = "torch"  # "torch", "onnx" (int8 ONNX Runtime для машин без GPU), "auto"
+RAG_QUERY_CACHE_SIZE = 4096  # LRU эмбеддингов запросов (0 — выключен)
+RAG_QUERY_CACHE_DIR = None  # например str(RAG_STORE_DIR / "query_cache") — кэш запросов переживает перезапуск
+RAG_EMBED_WORKERS = 0  # сборка индекса: CPU-процессов для эмбеддинга (0 — в текущем процессе; на GPU не нужны)
+RAG_INDEX_TYPE = "auto"  # "auto" (по размеру корпуса), "flat", "hnsw", "ivf", "ivfpq"
+RAG_NPROBE = 16  # IVF: сколько списков просматривать
+RAG_EF_SEARCH = 64  # HNSW: ширина поиска
+RAG_SEARCH_MODE = "hybrid"  # "hybrid" (dense + BM25, RRF) или "dense"
+RAG_HYBRID_BUDGET_MS = 50  # бюджет BM25 на запрос/батч, мс
+RAG_RERANK = False  # переранжирование кандидатов cross-encoder'ом
+RAG_RERANK_MODEL = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1"
+RAG_RERANK_CANDIDATES = 20  # сколько кандидатов поиска переранжировать
+RAG_RERANK_BATCH_SIZE = 16
+RAG_RERANK_BUDGET_MS = 300  # не уложились — остаётся порядок поиска
+RAG_VECTOR_STORAGE = "sq8"  # векторы в индексе: "float32", "sq8", "fp16" (точный пересчёт по vectors.f32)
+
+# Бюджет памяти кэша моделей (МБ, None — без ограничения) и выгрузка простаивающих (сек)
+MODEL_CACHE_RAM_MB = None
+MODEL_CACHE_VRAM_MB = None
+MODEL_CACHE_IDLE_SEC = None
+
+# Демон моделей (python -m api.model_server): "auto" — использовать, если запущен; "on"; "off"
+MODEL_SERVER = "auto"
+MODEL_SERVER_SOCKET = os.path.join(os.environ.get("XDG_RUNTIME_DIR", "/tmp"), "mia-models.sock")
+
+# Прогрев моделей (ASR, эмбеддер, LLM) в фоне при старте
+WARMUP_MODELS = True
 
 # Параметры аудио
 VIRTUAL_CABLE_NAME = "VirtualCable.monitor"
@@ -67,9 +111,24 @@ def get_config(env: str = "development") -> Dict[str, Any]:
         "rag_store_dir": str(RAG_STORE_DIR),
         "sample_rate": SAMPLE_RATE,
         "channels": CHANNELS,
+        "capture_backend": CAPTURE_BACKEND,
+        "capture_profile": CAPTURE_PROFILE,
+        "asr_sample_rate": ASR_SAMPLE_RATE,
+        "capture_buffer_sec": CAPTURE_BUFFER_SEC,
+        "capture_flush_sec": CAPTURE_FLUSH_SEC,
         "asr_model_size": ASR_MODEL_SIZE,
         "asr_device": ASR_DEVICE,
         "asr_compute_type": ASR_COMPUTE_TYPE,
+        "asr_language": ASR_LANGUAGE,
+        "asr_word_timestamps": ASR_WORD_TIMESTAMPS,
+        "asr_vad": ASR_VAD,
+        "asr_workers": ASR_WORKERS,
+        "asr_chunk_sec": ASR_CHUNK_SEC,
+        "asr_long_file_sec": ASR_LONG_FILE_SEC,
+        "asr_streaming": ASR_STREAMING,
+        "asr_stream_window_sec": ASR_STREAM_WINDOW_SEC,
+        "asr_stream_overlap_sec": ASR_STREAM_OVERLAP_SEC,
+        "question_save_audio": QUESTION_SAVE_AUDIO,
         "llm_host": LLM_HOST,
         "llm_model": LLM_MODEL,
         "llm_timeout": LLM_TIMEOUT,
@@ -77,6 +136,27 @@ def get_config(env: str = "development") -> Dict[str, Any]:
         "rag_top_k": RAG_TOP_K,
         "rag_threshold": RAG_THRESHOLD,
         "rag_batch_size": RAG_BATCH_SIZE,
+        "rag_embed_backend": RAG_EMBED_BACKEND,
+        "rag_embed_workers": RAG_EMBED_WORKERS,
+        "rag_query_cache_size": RAG_QUERY_CACHE_SIZE,
+        "rag_query_cache_dir": RAG_QUERY_CACHE_DIR,
+        "rag_index_type": RAG_INDEX_TYPE,
+        "rag_nprobe": RAG_NPROBE,
+        "rag_ef_search": RAG_EF_SEARCH,
+        "rag_vector_storage": RAG_VECTOR_STORAGE,
+        "rag_search_mode": RAG_SEARCH_MODE,
+        "rag_rerank": RAG_RERANK,
+        "rag_rerank_model": RAG_RERANK_MODEL,
+        "rag_rerank_candidates": RAG_RERANK_CANDIDATES,
+        "rag_rerank_batch_size": RAG_RERANK_BATCH_SIZE,
+        "rag_rerank_budget_ms": RAG_RERANK_BUDGET_MS,
+        "rag_hybrid_budget_ms": RAG_HYBRID_BUDGET_MS,
+        "model_cache_ram_mb": MODEL_CACHE_RAM_MB,
+        "model_cache_vram_mb": MODEL_CACHE_VRAM_MB,
+        "model_cache_idle_sec": MODEL_CACHE_IDLE_SEC,
+        "model_server": MODEL_SERVER,
+        "model_server_socket": MODEL_SERVER_SOCKET,
+        "warmup_models": WARMUP_MODELS,
         "virtual_cable_name": VIRTUAL_CABLE_NAME,
         "audio_latency_ms": AUDIO_LATENCY_MS,
     }
@@ -1,75 +1,269 @@
 """
 Система кэширования моделей
 """
+import gc
 import logging
+import sys
 import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
 from typing import Dict, Any, Optional
-from functools import lru_cache
 from contextlib import contextmanager
 
 logger = logging.getLogger(__name__)
 
+# Примерный размер весов faster-whisper (МБ) в float16; int8 — вдвое меньше, float32 — вдвое больше
+ASR_MODEL_SIZES_MB = {
+    "tiny": 75,
+    "base": 145,
+    "small": 485,
+    "medium": 1530,
+    "large": 3090,
+    "large-v2": 3090,
+    "large-v3": 3090,
+}
+
+
+class ModelCacheError(Exception):
+    """Исключение для ошибок кэша моделей"""
+    pass
+
+
+@dataclass
+class CacheEntry:
+    """Загруженная модель и её учёт в бюджете"""
+    model: Any
+    size_mb: float
+    pool: str
+    load_time: float
+    last_used: float = field(default_factory=time.monotonic)
+    hits: int = 0
+
+
+def _pool(device: Optional[str]) -> str:
+    """Пул памяти по устройству: "cuda" (VRAM) или "cpu" (RAM)"""
+    return "cuda" if device and str(device).startswith("cuda") else "cpu"
+
+
+def estimate_model_size_mb(model: Any) -> Optional[float]:
+    """Оценка размера модели по параметрам и буферам torch (SentenceTransformer и т.п.)"""
+    size_mb = getattr(model, "size_mb", None)
+    if size_mb is not None:
+        return size_mb  # модели не на torch (ONNX Runtime) знают свой размер сами
+    parameters = getattr(model, "parameters", None)
+    if parameters is None:
+        # Обёртки вроде CrossEncoder держат torch-модель в .model
+        inner = getattr(model, "model", None)
+        return estimate_model_size_mb(inner) if inner is not None and inner is not model else None
+    try:
+        total = sum(p.numel() * p.element_size() for p in parameters())
+        buffers = getattr(model, "buffers", None)
+        if buffers is not None:
+            total += sum(b.numel() * b.element_size() for b in buffers())
+    except Exception:
+        return None
+    return total / 2 ** 20
+
 
 class ModelCache:
-    """Кэш для моделей с потокобезопасностью"""
-    
-    def __init__(self):
-        self._cache: Dict[str, Any] = {}
+    """
+    Кэш для моделей с потокобезопасностью и бюджетом памяти.
+
+    На каждый пул (RAM и VRAM) задаётся бюджет в МБ; при нехватке вытесняются
+    давно не использованные модели (LRU), простаивающие дольше idle_timeout
+    выгружаются фоновым потоком. Одну и ту же модель грузит только один поток,
+    остальные ждут его результата.
+    """
+
+    def __init__(self, budgets_mb: Optional[Dict[str, Optional[float]]] = None,
+                 idle_timeout: Optional[float] = None):
+        self._cache: "OrderedDict[str, CacheEntry]" = OrderedDict()
         self._lock = threading.RLock()
         self._loading: Dict[str, threading.Event] = {}
-    
+        self.budgets_mb: Dict[str, Optional[float]] = dict(budgets_mb or {})
+        self.idle_timeout = idle_timeout
+        self._stats = {"hits": 0, "misses": 0, "loads": 0, "load_errors": 0,
+                       "load_time": 0.0, "evictions": 0, "idle_unloads": 0}
+        self._reaper: Optional[threading.Thread] = None
+        self._reaper_stop = threading.Event()
+
+    def configure(self, budgets_mb: Optional[Dict[str, Optional[float]]] = None,
+                  idle_timeout: Optional[float] = None) -> None:
+        """Задать бюджеты и таймаут простоя (например, из конфигурации приложения)"""
+        with self._lock:
+            if budgets_mb is not None:
+                self.budgets_mb.update(budgets_mb)
+            self.idle_timeout = idle_timeout
+            for pool in set(e.pool for e in self._cache.values()):
+                self._evict_for(pool, 0.0)
+        self._ensure_reaper()
+
     def get(self, key: str) -> Optional[Any]:
         """Получить модель из кэша"""
         with self._lock:
-            return self._cache.get(key)
-    
-    def set(self, key: str, model: Any) -> None:
-        """Сохранить модель в кэш"""
+            entry = self._cache.get(key)
+            if entry is None:
+                return None
+            self._touch(key, entry)
+            return entry.model
+
+    def set(self, key: str, model: Any, size_mb: Optional[float] = None,
+            device: Optional[str] = None, load_time: float = 0.0) -> None:
+        """Сохранить модель в кэш (с вытеснением, если не хватает бюджета)"""
+        if size_mb is None:
+            size_mb = estimate_model_size_mb(model)
+        if size_mb is None:
+            logger.warning(f"Unknown size for model {key}, it is not counted in the budget")
+            size_mb = 0.0
+        pool = _pool(device)
         with self._lock:
-            self._cache[key] = model
-            logger.info(f"Model cached: {key}")
-    
+            self._cache.pop(key, None)
+            self._evict_for(pool, size_mb)
+            self._cache[key] = CacheEntry(model, size_mb, pool, load_time)
+            logger.info(f"Model cached: {key} ({size_mb:.0f} MB, {pool}, "
+                        f"{self._used_mb(pool):.0f}/{self._budget_str(pool)} MB used)")
+        self._ensure_reaper()
+
     def has(self, key: str) -> bool:
         """Проверить наличие модели в кэше"""
         with self._lock:
             return key in self._cache
-    
+
+    def remove(self, key: str) -> bool:
+        """Выгрузить модель из кэша"""
+        with self._lock:
+            entry = self._cache.pop(key, None)
+        if entry is None:
+            return False
+        logger.info(f"Model unloaded: {key} ({entry.size_mb:.0f} MB)")
+        del entry
+        _release_memory()
+        return True
+
     def clear(self) -> None:
         """Очистить кэш"""
         with self._lock:
             self._cache.clear()
             logger.info("Model cache cleared")
-    
-    def get_or_load(self, key: str, loader_func, *args, **kwargs) -> Any:
-        """Получить модель из кэша или загрузить"""
-        # Проверяем кэш
-        if self.has(key):
-            logger.info(f"Using cached model: {key}")
-            return self.get(key)
-        
-        # Проверяем, не загружается ли уже
-        with self._lock:
-            if key in self._loading:
-                loading_event = self._loading[key]
-            else:
-                loading_event = threading.Event()
-                self._loading[key] = loading_event
-        
-        # Если уже загружается, ждем
-        if loading_event.is_set():
+        self._reaper_stop.set()
+        _release_memory()
+
+    def get_or_load(self, key: str, loader_func, *args, size_mb: Optional[float] = None,
+                    device: Optional[str] = None, **kwargs) -> Any:
+        """
+        Получить модель из кэша или загрузить. Параллельные вызовы с одним ключом
+        ждут единственную загрузку; если она упала, следующий вызов пробует снова.
+        """
+        while True:
+            with self._lock:
+                entry = self._cache.get(key)
+                if entry is not None:
+                    self._stats["hits"] += 1
+                    entry.hits += 1
+                    self._touch(key, entry)
+                    return entry.model
+                loading_event = self._loading.get(key)
+                if loading_event is None:
+                    loading_event = threading.Event()
+                    self._loading[key] = loading_event
+                    self._stats["misses"] += 1
+                    break
+            # Модель уже грузит другой поток
             loading_event.wait()
-            return self.get(key)
-        
-        # Загружаем модель
+
+        start_time = time.time()
         try:
             logger.info(f"Loading model: {key}")
             model = loader_func(*args, **kwargs)
-            self.set(key, model)
+            load_time = time.time() - start_time
+            with self._lock:
+                self._stats["loads"] += 1
+                self._stats["load_time"] += load_time
+            self.set(key, model, size_mb=size_mb, device=device, load_time=load_time)
             return model
+        except Exception:
+            with self._lock:
+                self._stats["load_errors"] += 1
+            raise
         finally:
-            loading_event.set()
             with self._lock:
                 self._loading.pop(key, None)
+            loading_event.set()
+
+    def stats(self) -> Dict[str, Any]:
+        """Статистика: попадания/промахи/загрузки, занятая память по пулам, модели"""
+        with self._lock:
+            now = time.monotonic()
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "load_time": round(self._stats["load_time"], 2),
+                "hit_rate": self._stats["hits"] / lookups if lookups else 0.0,
+                "pools": {
+                    pool: {"used_mb": round(self._used_mb(pool), 1), "budget_mb": self.budgets_mb.get(pool)}
+                    for pool in sorted(set(self.budgets_mb) | {e.pool for e in self._cache.values()})
+                },
+                "models": {
+                    key: {"size_mb": round(e.size_mb, 1), "pool": e.pool, "hits": e.hits,
+                          "load_time": round(e.load_time, 2), "idle_sec": round(now - e.last_used, 1)}
+                    for key, e in self._cache.items()
+                },
+            }
+
+    def _touch(self, key: str, entry: CacheEntry) -> None:
+        entry.last_used = time.monotonic()
+        self._cache.move_to_end(key)
+
+    def _used_mb(self, pool: str) -> float:
+        return sum(e.size_mb for e in self._cache.values() if e.pool == pool)
+
+    def _budget_str(self, pool: str) -> str:
+        budget = self.budgets_mb.get(pool)
+        return "inf" if budget is None else f"{budget:.0f}"
+
+    def _evict_for(self, pool: str, size_mb: float) -> None:
+        """Вытеснить LRU-модели пула, чтобы уместить ещё size_mb. Вызывается под self._lock"""
+        budget = self.budgets_mb.get(pool)
+        if budget is None:
+            return
+        if size_mb > budget:
+            logger.warning(f"Model of {size_mb:.0f} MB exceeds the {pool} budget of {budget:.0f} MB")
+        for key in [k for k, e in self._cache.items() if e.pool == pool]:
+            if self._used_mb(pool) + size_mb <= budget:
+                break
+            entry = self._cache.pop(key)
+            self._stats["evictions"] += 1
+            logger.info(f"Model evicted (LRU): {key} ({entry.size_mb:.0f} MB, {pool})")
+
+    def _ensure_reaper(self) -> None:
+        """Фоновый поток выгрузки простаивающих моделей (только при заданном idle_timeout)"""
+        with self._lock:
+            if not self.idle_timeout or (self._reaper and self._reaper.is_alive()):
+                return
+            self._reaper_stop.clear()
+            self._reaper = threading.Thread(target=self._reap, name="model-cache-reaper", daemon=True)
+            self._reaper.start()
+
+    def _reap(self) -> None:
+        while self.idle_timeout and not self._reaper_stop.wait(min(self.idle_timeout / 2, 60.0)):
+            now = time.monotonic()
+            with self._lock:
+                idle = [k for k, e in self._cache.items() if now - e.last_used > self.idle_timeout]
+                for key in idle:
+                    self._cache.pop(key)
+                    self._stats["idle_unloads"] += 1
+                    logger.info(f"Model unloaded after {self.idle_timeout:.0f}s idle: {key}")
+            if idle:
+                _release_memory()
+
+
+def _release_memory() -> None:
+    """Вернуть память выгруженных моделей (и кэш CUDA-аллокатора, если torch уже загружен)"""
+    gc.collect()
+    torch = sys.modules.get("torch")
+    if torch is not None and torch.cuda.is_available():
+        torch.cuda.empty_cache()
 
 
 # Глобальный кэш моделей
@@ -77,8 +271,11 @@ model_cache = ModelCache()
 
 
 # Декораторы для кэширования
-def cached_model(key_func=None):
-    """Декоратор для кэширования моделей"""
+def cached_model(key_func=None, size_func=None, device_func=None):
+    """
+    Декоратор для кэширования моделей.
+    size_func/device_func по аргументам загрузчика дают размер (МБ) и устройство для учёта в бюджете.
+    """
     def decorator(func):
         def wrapper(*args, **kwargs):
             # Генерируем ключ кэша
@@ -86,8 +283,13 @@ def cached_model(key_func=None):
                 cache_key = key_func(*args, **kwargs)
             else:
                 cache_key = f"{func.__name__}_{hash(str(args) + str(sorted(kwargs.items())))}"
-            
-            return model_cache.get_or_load(cache_key, func, *args, **kwargs)
+
+            return model_cache.get_or_load(
+                cache_key, func, *args,
+                size_mb=size_func(*args, **kwargs) if size_func else None,
+                device=device_func(*args, **kwargs) if device_func else None,
+                **kwargs
+            )
         return wrapper
     return decorator
 
@@ -98,6 +300,18 @@ def get_asr_cache_key(model_size: str, device: str, compute_type: str) -> str:
     return f"asr_{model_size}_{device}_{compute_type}"
 
 
+def get_asr_model_size_mb(model_size: str, device: str, compute_type: str) -> Optional[float]:
+    """Оценка размера ASR модели в памяти"""
+    base = ASR_MODEL_SIZES_MB.get(model_size)
+    if base is None:
+        return None
+    if compute_type.startswith("int8"):
+        return base / 2
+    if compute_type == "float32":
+        return base * 2
+    return base
+
+
 def get_embedder_cache_key(model_name: str, device: str) -> str:
     """Ключ кэша для эмбеддера"""
     return f"embedder_{model_name}_{device}"
@@ -111,4 +325,3 @@ def model_cache_context():
     finally:
         # Можно добавить логику очистки при выходе
         pass
-
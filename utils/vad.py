@@ -0,0 +1,133 @@
+"""
+Детектор речи (VAD) и обрезка тишины перед ASR
+"""
+import logging
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+Span = Tuple[int, int]
+
+
+def _runs(mask: np.ndarray) -> List[Tuple[int, int, bool]]:
+    """Серии одинаковых значений булевой маски: (start, end, value)"""
+    if len(mask) == 0:
+        return []
+    edges = np.flatnonzero(np.diff(mask.astype(np.int8))) + 1
+    starts = np.concatenate([[0], edges])
+    ends = np.concatenate([edges, [len(mask)]])
+    return [(int(s), int(e), bool(mask[s])) for s, e in zip(starts, ends)]
+
+
+def detect_speech(audio: np.ndarray, samplerate: int = 16000, frame_ms: int = 30,
+                  margin_db: float = 10.0, min_speech_ms: int = 250,
+                  min_silence_ms: int = 500, pad_ms: int = 200) -> List[Span]:
+    """
+    Энергетический VAD: участки речи [start, end) в сэмплах.
+
+    Порог — уровень шумового пола (10-й перцентиль энергии кадров) + margin_db,
+    ограниченный диапазоном [-60, -40] dBFS: так цифровая тишина null-sink'а
+    и сплошная речь обрабатываются одинаково корректно.
+    """
+    frame = int(samplerate * frame_ms / 1000)
+    n_frames = len(audio) // frame
+    if n_frames == 0:
+        return []
+
+    frames = np.asarray(audio[:n_frames * frame], dtype=np.float32).reshape(n_frames, frame)
+    db = 10 * np.log10(np.mean(frames ** 2, axis=1) + 1e-12)
+    threshold = min(max(np.percentile(db, 10) + margin_db, -60.0), -40.0)
+    voiced = db > threshold
+
+    # Короткие паузы внутри речи считаем речью, короткие всплески — тишиной
+    min_silence = max(1, min_silence_ms // frame_ms)
+    min_speech = max(1, min_speech_ms // frame_ms)
+    for start, end, value in _runs(voiced):
+        if not value and end - start < min_silence and start > 0 and end < n_frames:
+            voiced[start:end] = True
+    for start, end, value in _runs(voiced):
+        if value and end - start < min_speech:
+            voiced[start:end] = False
+
+    pad = int(samplerate * pad_ms / 1000)
+    spans: List[Span] = []
+    for start, end, value in _runs(voiced):
+        if not value:
+            continue
+        s = max(0, start * frame - pad)
+        e = min(len(audio), end * frame + pad)
+        if spans and s <= spans[-1][1]:
+            spans[-1] = (spans[-1][0], e)
+        else:
+            spans.append((s, e))
+    return spans
+
+
+class TimestampMap:
+    """
+    Соответствие времени в склеенном аудио (только речь) времени в исходной записи.
+    """
+
+    def __init__(self, spans: List[Span], samplerate: int = 16000):
+        self.spans = spans
+        self.samplerate = samplerate
+        lengths = np.array([e - s for s, e in spans], dtype=np.int64)
+        self._compact_starts = np.concatenate([[0], np.cumsum(lengths)[:-1]]) if spans else np.zeros(0, np.int64)
+        self._orig_starts = np.array([s for s, _ in spans], dtype=np.int64)
+        self._lengths = lengths
+
+    @property
+    def speech_samples(self) -> int:
+        return int(self._lengths.sum())
+
+    def compact(self, audio: np.ndarray) -> np.ndarray:
+        """Склеить участки речи в одно аудио"""
+        if not self.spans:
+            return audio[:0]
+        return np.concatenate([audio[s:e] for s, e in self.spans])
+
+    def to_original(self, t: float, at_end: bool = False) -> float:
+        """
+        Время (сек) в склеенном аудио -> время в исходной записи.
+        at_end=True для концов сегментов: граница склейки относится к предыдущему участку.
+        """
+        if not self.spans:
+            return t
+        pos = t * self.samplerate
+        idx = int(np.searchsorted(self._compact_starts, pos - (1e-6 if at_end else 0), side="right")) - 1
+        idx = min(max(idx, 0), len(self.spans) - 1)
+        inside = min(max(pos - self._compact_starts[idx], 0), self._lengths[idx])
+        return float(self._orig_starts[idx] + inside) / self.samplerate
+
+    def remap_segment(self, segment: Dict[str, Any]) -> Dict[str, Any]:
+        """Перевести метки времени сегмента транскрипта (и его слов) в исходную шкалу"""
+        data = dict(segment)
+        data["start"] = round(self.to_original(segment["start"]), 3)
+        data["end"] = round(self.to_original(segment["end"], at_end=True), 3)
+        if "words" in segment:
+            data["words"] = [
+                {**w,
+                 "start": round(self.to_original(w["start"]), 3),
+                 "end": round(self.to_original(w["end"], at_end=True), 3)}
+                for w in segment["words"]
+            ]
+        return data
+
+
+def vad_signature() -> str:
+    """Параметры VAD по умолчанию одной строкой: входят в ключ кэша транскриптов"""
+    return "vad" + "-".join(map(str, detect_speech.__defaults__[1:]))
+
+
+def trim_silence(audio: np.ndarray, samplerate: int = 16000, **vad_kwargs) -> Tuple[np.ndarray, TimestampMap]:
+    """Оставить только речь. Возвращает (склеенное аудио, карта времени в исходную запись)"""
+    spans = detect_speech(audio, samplerate, **vad_kwargs)
+    tmap = TimestampMap(spans, samplerate)
+    speech = tmap.compact(audio)
+    if len(audio):
+        logger.info(f"VAD: {len(spans)} speech spans, "
+                    f"{tmap.speech_samples / samplerate:.1f}s of {len(audio) / samplerate:.1f}s "
+                    f"({100 * tmap.speech_samples / len(audio):.0f}% speech)")
+    return speech, tmap
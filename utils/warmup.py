@@ -0,0 +1,101 @@
+"""
+Фоновая загрузка и прогрев моделей при старте приложения
+"""
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+LOADING = "loading"
+READY = "ready"
+FAILED = "failed"
+
+
+class WarmupError(Exception):
+    """Исключение для компонентов, которые не удалось загрузить"""
+    pass
+
+
+class ModelWarmup:
+    """
+    Загружает компоненты (ASR, эмбеддер, LLM) в параллельных потоках и прогоняет
+    на каждом пустой инференс. Горячие клавиши работают сразу; обработчик, которому
+    нужна модель, ждёт только её готовности через wait().
+    """
+
+    def __init__(self):
+        self._tasks: Dict[str, Callable[[], Any]] = {}
+        self._status: Dict[str, str] = {}
+        self._errors: Dict[str, str] = {}
+        self._timings: Dict[str, float] = {}
+        self._results: Dict[str, Any] = {}
+        self._events: Dict[str, threading.Event] = {}
+        self._lock = threading.Lock()
+
+    def add(self, name: str, task: Callable[[], Any]) -> "ModelWarmup":
+        """Зарегистрировать компонент: task загружает и прогревает модель"""
+        with self._lock:
+            self._tasks[name] = task
+            self._status[name] = PENDING
+            self._events[name] = threading.Event()
+        return self
+
+    def start(self) -> "ModelWarmup":
+        """Запустить загрузку всех компонентов в фоне"""
+        for name in list(self._tasks):
+            threading.Thread(target=self._run, args=(name,), name=f"warmup-{name}", daemon=True).start()
+        return self
+
+    def _run(self, name: str) -> None:
+        with self._lock:
+            self._status[name] = LOADING
+        start_time = time.time()
+        try:
+            result = self._tasks[name]()
+            with self._lock:
+                self._results[name] = result
+                self._timings[name] = time.time() - start_time
+                self._status[name] = READY
+            logger.info(f"Warm-up {name}: ready in {self._timings[name]:.2f}s")
+        except Exception as e:
+            with self._lock:
+                self._errors[name] = str(e)
+                self._timings[name] = time.time() - start_time
+                self._status[name] = FAILED
+            logger.error(f"Warm-up {name} failed: {e}")
+        finally:
+            self._events[name].set()
+
+    def is_ready(self, name: str) -> bool:
+        with self._lock:
+            return self._status.get(name) == READY
+
+    def wait(self, name: str, timeout: Optional[float] = None) -> Any:
+        """
+        Дождаться компонента и вернуть результат его задачи.
+        Незарегистрированный компонент считается готовым (возвращает None).
+        """
+        event = self._events.get(name)
+        if event is None:
+            return None
+        if not event.wait(timeout):
+            raise WarmupError(f"{name} is still loading")
+        with self._lock:
+            if self._status[name] == FAILED:
+                raise WarmupError(f"{name} failed to load: {self._errors[name]}")
+            return self._results.get(name)
+
+    def status(self) -> Dict[str, Dict[str, Any]]:
+        """Состояние компонентов: {name: {"status", "seconds", "error"}}"""
+        with self._lock:
+            return {
+                name: {
+                    "status": self._status[name],
+                    "seconds": round(self._timings[name], 2) if name in self._timings else None,
+                    "error": self._errors.get(name),
+                }
+                for name in self._tasks
+            }